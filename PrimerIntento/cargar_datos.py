@@ -1,5 +1,5 @@
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 import geopandas as gpd
 from shapely.geometry import Point
 from geoalchemy2 import Geometry, WKTElement
@@ -28,13 +28,37 @@ print("Datos convertidos a formato geoespacial...")
 
 try:
     engine = create_engine(db_connection_str)
+    # Staging + ON CONFLICT: volver a correr el script no duplica filas
     final_gdf.to_sql(
-        'bus_locations',
+        'bus_locations_staging',
         con=engine,
-        if_exists='append',
+        if_exists='replace',
         index=False,
         dtype={'location': Geometry('POINT', srid=4326)}
     )
-    print(f"Datos cargados exitosamente: {len(final_gdf)} registros en tabla 'bus_locations'.")
+    with engine.begin() as conn:
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS bus_locations (
+            placa TEXT NOT NULL,
+            velocidad_kmh DOUBLE PRECISION,
+            location geometry(Point, 4326),
+            ts TIMESTAMP NOT NULL
+        );
+        """))
+        if conn.execute(text("SELECT to_regclass('uq_bus_locations_placa_ts')")).scalar() is None:
+            # Cargas anteriores con 'append' pudieron dejar duplicados
+            conn.execute(text("""
+            DELETE FROM bus_locations a USING bus_locations b
+            WHERE a.placa = b.placa AND a.ts = b.ts AND a.ctid > b.ctid;
+            """))
+            conn.execute(text("CREATE UNIQUE INDEX uq_bus_locations_placa_ts ON bus_locations (placa, ts);"))
+        insertadas = conn.execute(text("""
+        INSERT INTO bus_locations (placa, velocidad_kmh, location, ts)
+        SELECT placa, velocidad_kmh, location, ts FROM bus_locations_staging
+        ON CONFLICT (placa, ts) DO NOTHING;
+        """)).rowcount
+        conn.execute(text("DROP TABLE bus_locations_staging;"))
+    print(f"Datos cargados exitosamente: {insertadas} registros nuevos en tabla 'bus_locations' "
+          f"({len(final_gdf) - insertadas} ya existían).")
 except Exception as e:
-    print(f"Error al cargar datos: {e}")
\ No newline at end of file
+    print(f"Error al cargar datos: {e}")
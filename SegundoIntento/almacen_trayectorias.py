@@ -0,0 +1,262 @@
+import argparse
+import time
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from instrumentacion import instrumentar, registrar_filas
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+COLUMNAS_CATEGORICAS = ('origen', 'destino', 'zona')
+CLAVE_EPOCH_BASE = b'epoch_base'
+
+# Vistas (sin copia) de los arreglos de un bus
+VistaBus = namedtuple('VistaBus', ['placa', 'latitud', 'longitud', 'velocidad_kmh', 't', 'categorias'])
+
+class AlmacenTrayectorias:
+    """Fixes de la flota en arreglos columnares ordenados por (placa, ts).
+
+    - `placas`: diccionario ordenado de placas; el bus i ocupa
+      `[offsets[i], offsets[i + 1])` en todos los arreglos (estilo CSR)
+    - `latitud`, `longitud`, `velocidad_kmh`: float32 (~0.2 m de resolución en Arequipa)
+    - `t`: segundos int32 desde `epoch_base` (alcanza para 68 años)
+    - `categorias`: columnas de texto como (códigos, valores)
+
+    Pasa de ~100-300 bytes por fix en un DataFrame con placas como texto a
+    ~16 bytes más los códigos de las columnas categóricas.
+    """
+
+    def __init__(self, placas, offsets, latitud, longitud, velocidad_kmh, t, epoch_base, categorias=None):
+        self.placas = placas
+        self.offsets = offsets
+        self.latitud = latitud
+        self.longitud = longitud
+        self.velocidad_kmh = velocidad_kmh
+        self.t = t
+        self.epoch_base = int(epoch_base)
+        self.categorias = categorias or {}
+        self._indice = None
+
+    @classmethod
+    def desde_dataframe(cls, df, columnas_categoricas=COLUMNAS_CATEGORICAS):
+        """Construye el almacén desde un DataFrame con placa, latitud, longitud, velocidad_kmh y ts."""
+        codigos, placas = pd.factorize(df['placa'], sort=True)
+        ts = pd.to_datetime(df['ts']).to_numpy('datetime64[s]').astype(np.int64)
+        epoch_base = int(ts.min()) if len(ts) else 0
+        # (placa, ts) empaquetados en un int64: un argsort en vez de lexsort sobre
+        # dos claves; si ya viene ordenado desde la BD no se reordena nada
+        rango = int(ts.max()) - epoch_base + 1 if len(ts) else 1
+        if len(placas) <= np.iinfo(np.int64).max // rango:
+            clave = codigos.astype(np.int64) * rango + (ts - epoch_base)
+            orden = slice(None) if np.all(clave[1:] >= clave[:-1]) else np.argsort(clave)
+        else:
+            orden = np.lexsort((ts, codigos))
+        codigos = codigos[orden]
+        offsets = np.zeros(len(placas) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codigos, minlength=len(placas)), out=offsets[1:])
+
+        categorias = {}
+        for columna in columnas_categoricas:
+            if columna in df:
+                codigos_col, valores = pd.factorize(df[columna])
+                codigos_col = codigos_col[orden]
+                tipo = np.int16 if len(valores) < np.iinfo(np.int16).max else np.int32
+                categorias[columna] = (codigos_col.astype(tipo), np.asarray(valores, dtype=object))
+
+        return cls(
+            placas=np.asarray(placas, dtype=object),
+            offsets=offsets,
+            latitud=df['latitud'].to_numpy(np.float32)[orden],
+            longitud=df['longitud'].to_numpy(np.float32)[orden],
+            velocidad_kmh=df['velocidad_kmh'].to_numpy(np.float32)[orden],
+            t=(ts[orden] - epoch_base).astype(np.int32),
+            epoch_base=epoch_base,
+            categorias=categorias,
+        )
+
+    def __len__(self):
+        return len(self.t)
+
+    @property
+    def n_buses(self):
+        return len(self.placas)
+
+    def indice(self, placa):
+        if self._indice is None:
+            self._indice = {p: i for i, p in enumerate(self.placas)}
+        return self._indice[placa]
+
+    def vista(self, i):
+        """Arreglos del bus i como vistas: O(1), sin copiar."""
+        inicio, fin = self.offsets[i], self.offsets[i + 1]
+        return VistaBus(
+            self.placas[i], self.latitud[inicio:fin], self.longitud[inicio:fin],
+            self.velocidad_kmh[inicio:fin], self.t[inicio:fin],
+            {nombre: (codigos[inicio:fin], valores) for nombre, (codigos, valores) in self.categorias.items()},
+        )
+
+    def bus(self, placa):
+        return self.vista(self.indice(placa))
+
+    def __iter__(self):
+        for i in range(self.n_buses):
+            yield self.vista(i)
+
+    def ts(self, t=None):
+        """Convierte offsets `t` (por defecto todos) a datetime64[s]."""
+        t = self.t if t is None else t
+        return (t.astype(np.int64) + self.epoch_base).astype('datetime64[s]')
+
+    def codigos_placa(self):
+        """Código de bus por fix, expandido desde los offsets."""
+        return np.repeat(np.arange(self.n_buses, dtype=np.int32), np.diff(self.offsets))
+
+    def memoria_bytes(self):
+        arreglos = [self.offsets, self.latitud, self.longitud, self.velocidad_kmh, self.t]
+        arreglos += [codigos for codigos, _ in self.categorias.values()]
+        return sum(a.nbytes for a in arreglos) + int(pd.Series(self.placas).memory_usage(deep=True))
+
+    def a_dataframe(self):
+        df = pd.DataFrame({
+            'placa': pd.Categorical.from_codes(self.codigos_placa(), self.placas),
+            'latitud': self.latitud, 'longitud': self.longitud,
+            'velocidad_kmh': self.velocidad_kmh, 'ts': self.ts(),
+        })
+        for nombre, (codigos, valores) in self.categorias.items():
+            df[nombre] = pd.Categorical.from_codes(codigos, valores)
+        return df
+
+    def a_arrow(self):
+        """Tabla Arrow sin copiar los arreglos numéricos; placa y categorías como diccionario."""
+        import pyarrow as pa
+
+        columnas = {
+            'placa': pa.DictionaryArray.from_arrays(self.codigos_placa(), pa.array(self.placas, pa.string())),
+            'latitud': pa.array(self.latitud),
+            'longitud': pa.array(self.longitud),
+            'velocidad_kmh': pa.array(self.velocidad_kmh),
+            't': pa.array(self.t),
+        }
+        for nombre, (codigos, valores) in self.categorias.items():
+            # Código -1 (factorize de un nulo) → índice nulo en Arrow
+            columnas[nombre] = pa.DictionaryArray.from_arrays(pa.array(codigos, mask=codigos < 0),
+                                                              pa.array(valores, pa.string()))
+        tabla = pa.table(columnas)
+        return tabla.replace_schema_metadata({CLAVE_EPOCH_BASE: str(self.epoch_base).encode()})
+
+    @classmethod
+    def desde_arrow(cls, tabla):
+        """Inversa de `a_arrow`; la tabla debe venir ordenada por (placa, t)."""
+        import pyarrow as pa
+
+        tabla = tabla.combine_chunks()
+
+        def numerico(nombre):
+            return tabla.column(nombre).chunk(0).to_numpy(zero_copy_only=True)
+
+        def diccionario(nombre):
+            columna = tabla.column(nombre).chunk(0)
+            if not pa.types.is_dictionary(columna.type):
+                columna = columna.dictionary_encode()
+            indices = columna.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+            return indices, np.asarray(columna.dictionary.to_pylist(), dtype=object)
+
+        codigos, placas = diccionario('placa')
+        offsets = np.zeros(len(placas) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codigos, minlength=len(placas)), out=offsets[1:])
+        metadata = tabla.schema.metadata or {}
+        categorias = {nombre: diccionario(nombre) for nombre in tabla.column_names
+                      if nombre not in ('placa', 'latitud', 'longitud', 'velocidad_kmh', 't')}
+        return cls(placas, offsets, numerico('latitud'), numerico('longitud'), numerico('velocidad_kmh'),
+                   numerico('t'), int(metadata.get(CLAVE_EPOCH_BASE, b'0')), categorias)
+
+    def guardar_parquet(self, archivo):
+        import pyarrow.parquet as pq
+        pq.write_table(self.a_arrow(), archivo)
+
+    @classmethod
+    def leer_parquet(cls, archivo):
+        import pyarrow.parquet as pq
+        return cls.desde_arrow(pq.read_table(archivo))
+
+@instrumentar
+def cargar_almacen(tabla='bus_locations', desde=None, hasta=None):
+    """Lee los fixes de la tabla en orden (placa, ts) directamente al almacén."""
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{tabla}_placa_ts ON {tabla} (placa, ts DESC);"
+        ))
+    filtro = "WHERE ts >= :desde AND ts < :hasta" if desde is not None and hasta is not None else ""
+    df = pd.read_sql(text(f"""
+    SELECT placa, ST_Y(location) AS latitud, ST_X(location) AS longitud, velocidad_kmh, ts
+    FROM {tabla}
+    {filtro}
+    ORDER BY placa, ts;
+    """), engine, params={'desde': desde, 'hasta': hasta})
+    registrar_filas(len(df))
+    return AlmacenTrayectorias.desde_dataframe(df)
+
+def benchmark_almacen(n=2_000_000, buses=2000, semilla=0):
+    """Memoria por fix y tiempo de recorrer la flota: DataFrame vs almacén."""
+    rng = np.random.default_rng(semilla)
+    df = pd.DataFrame({
+        'placa': np.char.add('V', rng.integers(0, buses, n).astype(str)).astype(object),
+        'latitud': -16.40 + rng.normal(0, 0.02, n),
+        'longitud': -71.53 + rng.normal(0, 0.02, n),
+        'velocidad_kmh': rng.uniform(5, 45, n),
+        'ts': pd.Timestamp('2025-07-01 06:00') + pd.to_timedelta(rng.integers(0, 18 * 3600, n), unit='s'),
+        'origen': rng.choice(['Plaza de Armas', 'Mall Plaza Cayma', 'Óvalo Miraflores'], n),
+        'destino': rng.choice(['Estadio Melgar', 'Universidad San Agustín'], n),
+    })
+    bytes_df = df.memory_usage(deep=True).sum()
+
+    t0 = time.perf_counter()
+    almacen = AlmacenTrayectorias.desde_dataframe(df)
+    construccion = time.perf_counter() - t0
+
+    muestra = almacen.placas[:100]
+    t0 = time.perf_counter()
+    for placa in muestra:
+        df[df['placa'] == placa]['velocidad_kmh'].mean()
+    filtrado_df = (time.perf_counter() - t0) / len(muestra)
+
+    t0 = time.perf_counter()
+    for vista in almacen:
+        vista.velocidad_kmh.mean()
+    recorrido = (time.perf_counter() - t0) / almacen.n_buses
+
+    print(f"💾 DataFrame: {bytes_df / n:.0f} B/fix | almacén: {almacen.memoria_bytes() / n:.0f} B/fix "
+          f"({bytes_df / almacen.memoria_bytes():.1f}x menos), construido en {construccion:.2f} s")
+    print(f"🚌 Por bus: df[df['placa'] == placa] {filtrado_df * 1e3:.2f} ms | vista {recorrido * 1e6:.1f} µs")
+    return almacen
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Almacén columnar de trayectorias")
+    parser.add_argument('--fixes', type=int, default=2_000_000, help="Tamaño de la flota sintética del benchmark")
+    parser.add_argument('--exportar', metavar='ARCHIVO', help="Cargar bus_locations y guardarlo como Parquet")
+    parser.add_argument('--tabla', default='bus_locations')
+    args = parser.parse_args()
+
+    print("🗃️ ALMACÉN DE TRAYECTORIAS")
+    print("=" * 50)
+    benchmark_almacen(args.fixes)
+
+    if args.exportar:
+        try:
+            almacen = cargar_almacen(args.tabla)
+            almacen.guardar_parquet(args.exportar)
+            print(f"✅ {len(almacen):,} fixes de {almacen.n_buses} buses → {args.exportar}")
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            print("\n🔧 Verificaciones:")
+            print("   • ¿Está PostgreSQL corriendo?")
+            print("   • ¿Está instalado pyarrow?")
@@ -1,12 +1,16 @@
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, r2_score
 from sklearn.preprocessing import StandardScaler
-import joblib
 import warnings
+from features_espaciales import sql_distancia_centro, distancia_centro_m
+from puntos_interes import seleccionar_puntos
+from geocercas import clasificar_zona
+from registro_modelos import registrar_modelo
+from instrumentacion import instrumentar, registrar_filas, resumen
 
 # Suprimir el warning específico que viste
 warnings.filterwarnings("ignore", message="X does not have valid feature names")
@@ -21,20 +25,23 @@ db_name = 'MiPrimeraDB'
 db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
 engine = create_engine(db_connection_str)
 
+@instrumentar
 def cargar_datos_mejorados():
     """Carga datos con más features para mejor predicción"""
     print("Cargando datos desde la base de datos...")
     
-    sql_query = """
+    sql_query = f"""
     SELECT
+        placa,
+        ts,
         ST_Y(location) AS latitud,
         ST_X(location) AS longitud,
         velocidad_kmh,
         EXTRACT(HOUR FROM ts) AS hora,
         EXTRACT(DOW FROM ts) AS dia_semana,
         EXTRACT(MINUTE FROM ts) AS minuto,
-        -- Calcular distancia al centro (Plaza de Armas)
-        ST_Distance(location, ST_SetSRID(ST_Point(-71.5367, -16.3989), 4326)) AS distancia_centro,
+        -- Distancia al centro (Plaza de Armas) en metros, sobre la columna UTM 19S
+        {sql_distancia_centro()} AS distancia_centro,
         -- Identificar si es fin de semana
         CASE WHEN EXTRACT(DOW FROM ts) IN (0, 6) THEN 1 ELSE 0 END AS es_fin_semana,
         -- Identificar horas punta
@@ -51,6 +58,25 @@ def cargar_datos_mejorados():
     print(f"Se cargaron {len(df)} registros con features mejoradas.")
     return df
 
+def cargar_datos_entrenamiento():
+    """Datos listos para entrenar, leídos directo de bus_locations.
+
+    No pasa por la vista de features_trayectoria: el modelo servido predice
+    para un punto y una hora sin historia de bus, así que la vista solo
+    aportaría columnas que no se usan y el riesgo de entrenar con datos viejos
+    si no se refrescó.
+    """
+    return crear_features_adicionales(cargar_datos_mejorados())
+
+def ventana_entrenamiento():
+    """Rango de tiempo y cantidad de registros con que se entrena el modelo"""
+    with engine.connect() as conn:
+        desde, hasta, registros = conn.execute(
+            text("SELECT MIN(ts), MAX(ts), COUNT(*) FROM bus_locations")
+        ).one()
+    return {'tabla': 'bus_locations', 'desde': str(desde), 'hasta': str(hasta), 'registros': registros}
+
+@instrumentar
 def crear_features_adicionales(df):
     """Crea features adicionales para mejorar el modelo"""
     print("Creando features adicionales...")
@@ -66,12 +92,8 @@ def crear_features_adicionales(df):
     df['lon_hora'] = df['longitud'] * df['hora']
     df['distancia_hora'] = df['distancia_centro'] * df['hora']
     
-    # Categorizar zonas de la ciudad
-    df['zona'] = 'centro'
-    df.loc[df['latitud'] < -16.41, 'zona'] = 'sur'
-    df.loc[df['latitud'] > -16.39, 'zona'] = 'norte'
-    df.loc[df['longitud'] < -71.54, 'zona'] = 'este'
-    df.loc[df['longitud'] > -71.53, 'zona'] = 'oeste'
+    # Zona de la ciudad según los polígonos de geocercas.py
+    df['zona'] = clasificar_zona(df['latitud'], df['longitud'])
     
     # One-hot encoding para zona
     zona_dummies = pd.get_dummies(df['zona'], prefix='zona')
@@ -80,16 +102,36 @@ def crear_features_adicionales(df):
     print(f"Features creadas. Total de columnas: {len(df.columns)}")
     return df
 
-def entrenar_modelo_mejorado(df):
-    """Entrena un modelo más sofisticado"""
-    print("Preparando modelo de Machine Learning mejorado...")
-    
-    # Seleccionar features para el modelo
+FRACCION_PRUEBA = 0.2
+
+def mascara_prueba(df, fraccion=FRACCION_PRUEBA):
+    """Filas de prueba según un hash de (placa, ts).
+
+    La partición no depende del orden en que la BD devuelve las filas, así
+    que compactar_modelo.py puede recuperar exactamente las filas que el
+    modelo no vio al entrenar.
+    """
+    segundos = pd.to_datetime(df['ts']).to_numpy('datetime64[s]').astype(np.int64)
+    h = pd.util.hash_array(df['placa'].to_numpy(object)) ^ pd.util.hash_array(segundos)
+    return h % 1000 < fraccion * 1000
+
+# Parámetros del RandomForest (ver busqueda_hiperparametros.py para ajustarlos)
+PARAMETROS_MODELO = {
+    'n_estimators': 200,        # Más árboles para mejor precisión
+    'max_depth': 15,            # Limitar profundidad para evitar overfitting
+    'min_samples_split': 5,     # Mínimo de muestras para dividir nodo
+    'min_samples_leaf': 2,      # Mínimo de muestras en hoja
+}
+
+def seleccionar_feature_columns(df):
+    """Features del modelo que existen en el DataFrame, en orden fijo"""
     feature_columns = [
         'latitud', 'longitud', 'hora', 'dia_semana', 'minuto',
         'distancia_centro', 'es_fin_semana', 'es_hora_punta',
         'hora_sin', 'hora_cos', 'minuto_sin', 'minuto_cos',
-        'lat_hora', 'lon_hora', 'distancia_hora'
+        'lat_hora', 'lon_hora', 'distancia_hora',
+        # Sin historia del bus (features_trayectoria): eta.py pide velocidades
+        # para tramos futuros de la ruta, donde esa historia todavía no existe
     ]
     
     # Agregar columnas de zona si existen
@@ -97,7 +139,16 @@ def entrenar_modelo_mejorado(df):
     feature_columns.extend(zona_cols)
     
     # Filtrar solo las columnas que existen
-    feature_columns = [col for col in feature_columns if col in df.columns]
+    return [col for col in feature_columns if col in df.columns]
+
+@instrumentar
+def entrenar_modelo_mejorado(df, parametros=None):
+    """Entrena un modelo más sofisticado"""
+    print("Preparando modelo de Machine Learning mejorado...")
+    
+    # Seleccionar features para el modelo
+    feature_columns = seleccionar_feature_columns(df)
+    registrar_filas(len(df))
     
     X = df[feature_columns]
     y = df['velocidad_kmh']
@@ -105,10 +156,16 @@ def entrenar_modelo_mejorado(df):
     print(f"Features utilizadas: {len(feature_columns)}")
     print(f"   {', '.join(feature_columns)}")
     
-    # Dividir datos
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=None
-    )
+    # Dividir datos (por hash de placa/ts si están, para poder reconstruir la prueba)
+    if {'placa', 'ts'} <= set(df.columns):
+        prueba = mascara_prueba(df)
+        X_train, X_test, y_train, y_test = X[~prueba], X[prueba], y[~prueba], y[prueba]
+        particion = 'hash_placa_ts'
+    else:
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=FRACCION_PRUEBA, random_state=42, stratify=None
+        )
+        particion = 'aleatoria'
     
     # Escalar features (importante para algunos modelos)
     scaler = StandardScaler()
@@ -117,10 +174,7 @@ def entrenar_modelo_mejorado(df):
     
     # Entrenar Random Forest con mejores parámetros
     model = RandomForestRegressor(
-        n_estimators=200,           # Más árboles para mejor precisión
-        max_depth=15,               # Limitar profundidad para evitar overfitting
-        min_samples_split=5,        # Mínimo de muestras para dividir nodo
-        min_samples_leaf=2,         # Mínimo de muestras en hoja
+        **(parametros or PARAMETROS_MODELO),
         random_state=42,
         n_jobs=-1                   # Usar todos los procesadores
     )
@@ -160,27 +214,28 @@ def entrenar_modelo_mejorado(df):
     for i, row in feature_importance.head(10).iterrows():
         print(f"   {row['feature']}: {row['importance']:.3f}")
     
-    # Guardar modelo y scaler
-    joblib.dump(model, 'modelo_velocidad_buses.pkl')
-    joblib.dump(scaler, 'scaler_velocidad_buses.pkl')
-    joblib.dump(feature_columns, 'feature_columns.pkl')
-    print(f"\nModelo guardado como 'modelo_velocidad_buses.pkl'")
+    # Registrar la versión (esquema, métricas, ventana de datos); producción no cambia hasta promoverla
+    metricas = {'mae_train': mae_train, 'mae_test': mae_test, 'r2_train': r2_train, 'r2_test': r2_test}
+    ventana = {**ventana_entrenamiento(), 'particion_prueba': particion, 'fraccion_prueba': FRACCION_PRUEBA}
+    version = registrar_modelo(model, scaler, feature_columns, metricas,
+                               ventana=ventana, descripcion='RandomForest velocidad')
+    print(f"\nModelo guardado como {version}; compararlo con producción y promoverlo:")
+    print(f"   python registro_modelos.py listar")
+    print(f"   python registro_modelos.py promover {version}")
     
     return model, scaler, feature_columns
 
+@instrumentar
 def hacer_predicciones_multiples(model, scaler, feature_columns):
     """Hace predicciones para múltiples puntos de interés"""
     print("\nPREDICCIONES PARA PUNTOS DE INTERÉS")
     print("=" * 50)
     
     # Puntos de interés en Arequipa
-    puntos_interes = [
-        {"nombre": "Plaza de Armas", "lat": -16.3989, "lon": -71.5367},
-        {"nombre": "Mall Plaza Cayma", "lat": -16.3795, "lon": -71.5492},
-        {"nombre": "Terminal Terrestre", "lat": -16.4195, "lon": -71.5179},
-        {"nombre": "Óvalo Miraflores", "lat": -16.4113, "lon": -71.5235},
-        {"nombre": "Universidad San Agustín", "lat": -16.4068, "lon": -71.5223}
-    ]
+    puntos_interes = seleccionar_puntos([
+        "Plaza de Armas", "Mall Plaza Cayma", "Terminal Terrestre",
+        "Óvalo Miraflores", "Universidad San Agustín"
+    ])
     
     # Horas de interés
     horas_interes = [8, 13, 18, 22]  # 8 AM, 1 PM, 6 PM, 10 PM
@@ -211,8 +266,17 @@ def hacer_predicciones_multiples(model, scaler, feature_columns):
             
             print(f"   {hora:2d}:00h → {velocidad_pred:5.1f} km/h {estado}")
 
+def _verificar_features(datos, feature_columns):
+    """Un modelo con features que la predicción no calcula daría predicciones con ceros"""
+    desconocidas = [col for col in feature_columns if col not in datos]
+    if desconocidas:
+        raise ValueError(f"El modelo usa features que la predicción no sabe calcular: {desconocidas}")
+
 def crear_features_para_prediccion(lat, lon, hora, feature_columns):
     """Crea el vector de features para una predicción específica"""
+    # Misma proyección UTM que la columna location_utm usada en entrenamiento
+    distancia_centro = float(distancia_centro_m(lat, lon))
+    
     # Valores base
     datos = {
         'latitud': lat,
@@ -220,7 +284,7 @@ def crear_features_para_prediccion(lat, lon, hora, feature_columns):
         'hora': hora,
         'dia_semana': 1,  # Lunes por defecto
         'minuto': 0,
-        'distancia_centro': np.sqrt((lat - (-16.3989))**2 + (lon - (-71.5367))**2),
+        'distancia_centro': distancia_centro,
         'es_fin_semana': 0,
         'es_hora_punta': 1 if hora in [7,8,9,13,14,17,18,19,20] else 0,
         'hora_sin': np.sin(2 * np.pi * hora / 24),
@@ -229,27 +293,54 @@ def crear_features_para_prediccion(lat, lon, hora, feature_columns):
         'minuto_cos': 1,
         'lat_hora': lat * hora,
         'lon_hora': lon * hora,
-        'distancia_hora': np.sqrt((lat - (-16.3989))**2 + (lon - (-71.5367))**2) * hora
+        'distancia_hora': distancia_centro * hora
     }
     
-    # Zona (simplificado)
-    if lat < -16.41:
-        zona = 'sur'
-    elif lat > -16.39:
-        zona = 'norte'
-    elif lon < -71.54:
-        zona = 'este'
-    elif lon > -71.53:
-        zona = 'oeste'
-    else:
-        zona = 'centro'
+    # Zona con los mismos polígonos que en el entrenamiento
+    zona = clasificar_zona([lat], [lon])[0]
     
     # One-hot encoding para zona
     for z in ['centro', 'este', 'norte', 'oeste', 'sur']:
         datos[f'zona_{z}'] = 1 if zona == z else 0
     
     # Retornar solo las features que el modelo espera
-    return [datos.get(col, 0) for col in feature_columns]
+    _verificar_features(datos, feature_columns)
+    return [datos[col] for col in feature_columns]
+
+def crear_features_para_prediccion_lote(lat, lon, hora, feature_columns, minuto=0, dia_semana=1):
+    """Versión vectorizada de crear_features_para_prediccion para muchos puntos"""
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    hora = np.broadcast_to(np.asarray(hora, dtype=float), lat.shape)
+    minuto = np.broadcast_to(np.asarray(minuto, dtype=float), lat.shape)
+    dia_semana = np.broadcast_to(np.asarray(dia_semana, dtype=float), lat.shape)
+    distancia_centro = distancia_centro_m(lat, lon)
+    
+    datos = {
+        'latitud': lat,
+        'longitud': lon,
+        'hora': hora,
+        'dia_semana': dia_semana,
+        'minuto': minuto,
+        'distancia_centro': distancia_centro,
+        'es_fin_semana': np.isin(dia_semana, [0, 6]).astype(float),
+        'es_hora_punta': np.isin(hora, [7, 8, 9, 13, 14, 17, 18, 19, 20]).astype(float),
+        'hora_sin': np.sin(2 * np.pi * hora / 24),
+        'hora_cos': np.cos(2 * np.pi * hora / 24),
+        'minuto_sin': np.sin(2 * np.pi * minuto / 60),
+        'minuto_cos': np.cos(2 * np.pi * minuto / 60),
+        'lat_hora': lat * hora,
+        'lon_hora': lon * hora,
+        'distancia_hora': distancia_centro * hora
+    }
+    
+    # Zona con los mismos polígonos que en el entrenamiento
+    zona = clasificar_zona(lat, lon)
+    for z in ['centro', 'este', 'norte', 'oeste', 'sur']:
+        datos[f'zona_{z}'] = (zona == z).astype(float)
+    
+    _verificar_features(datos, feature_columns)
+    return np.column_stack([datos[col] for col in feature_columns])
 
 def main():
     """Función principal mejorada"""
@@ -258,8 +349,7 @@ def main():
     
     try:
         # 1. Cargar y preparar datos
-        df = cargar_datos_mejorados()
-        df = crear_features_adicionales(df)
+        df = cargar_datos_entrenamiento()
         
         # 2. Entrenar modelo
         model, scaler, feature_columns = entrenar_modelo_mejorado(df)
@@ -269,12 +359,15 @@ def main():
         
         print(f"\n¡Análisis completado!")
         print(f"El modelo mejorado está listo para usar.")
+        print(f"\nTiempos por etapa:")
+        print(resumen())
         
     except Exception as e:
         print(f"Error: {e}")
         print("\nVerificaciones:")
         print("   • ¿PostgreSQL está corriendo?")
         print("   • ¿Los datos están cargados en 'bus_locations'?")
+        print("   • ¿Se creó la columna 'location_utm'? (python features_espaciales.py)")
         print("   • ¿Las credenciales de BD son correctas?")
 
 if __name__ == "__main__":
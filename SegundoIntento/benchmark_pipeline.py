@@ -0,0 +1,554 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+TAMANOS = [1_000, 10_000, 100_000, 1_000_000]
+ARCHIVO_LINEA_BASE = 'benchmark_linea_base.json'
+DIRECTORIO_RESULTADOS = 'benchmarks'
+TOLERANCIA_REGRESION = 0.20     # 20% más lento que la línea base
+PISO_RUIDO_S = 0.05             # Diferencias menores se consideran ruido
+MAX_FILAS_ENTRENAMIENTO = 1_000_000
+FILAS_MODELO_PREDICCION = 20_000
+PUNTOS_POR_BUS = 400
+CENTRO_LAT, CENTRO_LON = -16.4009, -71.5378
+
+# --- Datos sintéticos (mismo esquema que el CSV realista y que cargar_datos_mejorados) ---
+
+def datos_sinteticos(n, semilla=0):
+    """Flota de n fixes: caminatas aleatorias alrededor del centro, un fix cada 30-60 s."""
+    rng = np.random.default_rng(semilla)
+    buses = max(1, n // PUNTOS_POR_BUS)
+    bus = np.minimum(np.arange(n) // PUNTOS_POR_BUS, buses - 1)
+    inicio_bus = np.searchsorted(bus, np.arange(buses))
+
+    def acumulado_por_bus(pasos):
+        total = np.cumsum(pasos)
+        return total - total[inicio_bus][bus]
+
+    lat = CENTRO_LAT + rng.normal(0, 0.01, buses)[bus] + acumulado_por_bus(rng.normal(0, 0.0003, n))
+    lon = CENTRO_LON + rng.normal(0, 0.01, buses)[bus] + acumulado_por_bus(rng.normal(0, 0.0003, n))
+    segundos = rng.integers(0, 3600, buses)[bus] + acumulado_por_bus(rng.integers(30, 60, n))
+    ts = pd.Timestamp('2025-07-12 06:00:00') + pd.to_timedelta(segundos, unit='s')
+
+    hora = ts.hour.to_numpy()
+    punta = np.isin(hora, [7, 8, 9, 13, 14, 17, 18, 19, 20])
+    velocidad = np.where(punta, rng.uniform(8, 22, n), rng.uniform(25, 45, n)).round()
+
+    from features_espaciales import distancia_centro_m
+    nombres = np.array(['Plaza de Armas', 'Mall Plaza Cayma', 'Terminal Terrestre', 'Óvalo Miraflores'])
+    dia_semana = (ts.dayofweek.to_numpy() + 1) % 7
+    return pd.DataFrame({
+        'placa': np.char.add('B', bus.astype(str)),
+        'latitud': lat.round(6),
+        'longitud': lon.round(6),
+        'velocidad_kmh': velocidad,
+        'timestamp': ts.strftime('%Y-%m-%d %H:%M:%S'),
+        'ts': ts,
+        'origen': nombres[bus % len(nombres)],
+        'destino': nombres[(bus + 1) % len(nombres)],
+        'hora': hora,
+        'dia_semana': dia_semana,
+        'minuto': ts.minute.to_numpy(),
+        'distancia_centro': distancia_centro_m(lat, lon),
+        'es_fin_semana': np.isin(dia_semana, [0, 6]).astype(int),
+        'es_hora_punta': punta.astype(int),
+    })
+
+def _modelo_pequeno(semilla=0):
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import StandardScaler
+    from analisis_predictivo_mejorado import (
+        crear_features_adicionales, seleccionar_feature_columns, PARAMETROS_MODELO
+    )
+    df = crear_features_adicionales(datos_sinteticos(FILAS_MODELO_PREDICCION, semilla))
+    feature_columns = seleccionar_feature_columns(df)
+    scaler = StandardScaler().fit(df[feature_columns])
+    model = RandomForestRegressor(**PARAMETROS_MODELO, random_state=42, n_jobs=-1)
+    model.fit(scaler.transform(df[feature_columns]), df['velocidad_kmh'])
+    return model, scaler, feature_columns
+
+# --- Etapas: cada una es (preparar, ejecutar); solo `ejecutar` se cronometra ---
+
+def _preparar_interpolar(n, contexto):
+    import generador_datos_realistas  # noqa: F401 (requiere osmnx)
+    rng = np.random.default_rng(0)
+    buses = max(1, n // PUNTOS_POR_BUS)
+    return [list(zip(CENTRO_LAT + np.cumsum(rng.normal(0, 0.001, 40)),
+                     CENTRO_LON + np.cumsum(rng.normal(0, 0.001, 40)))) for _ in range(buses)]
+
+def _ejecutar_interpolar(rutas, contexto):
+    from generador_datos_realistas import interpolar_ruta
+    return sum(len(interpolar_ruta(ruta, PUNTOS_POR_BUS)) for ruta in rutas)
+
+def _ejecutar_script_con_constantes(ruta, constantes):
+    """Ejecuta un script de nivel superior reemplazando sus constantes (p. ej. NUM_BUSES)."""
+    with open(ruta, encoding='utf-8') as f:
+        codigo = f.read()
+    for nombre, valor in constantes.items():
+        codigo, reemplazos = re.subn(rf'^{nombre} = .*$', f'{nombre} = {valor!r}', codigo, flags=re.M)
+        if not reemplazos:
+            raise ValueError(f"'{nombre}' no está definido en {ruta}")
+    exec(compile(codigo, ruta, 'exec'), {'__name__': '__main__', '__file__': ruta})
+
+def _preparar_generador_basico(n, contexto):
+    return os.path.join(contexto['raiz'], 'PrimerIntento', 'generador_datos.py')
+
+def _ejecutar_generador_basico(ruta, contexto):
+    buses = max(1, contexto['n'] // PUNTOS_POR_BUS)
+    _ejecutar_script_con_constantes(ruta, {'NUM_BUSES': buses, 'PUNTOS_POR_BUS': PUNTOS_POR_BUS})
+    return buses * PUNTOS_POR_BUS
+
+def _preparar_generador_realista(n, contexto):
+    import generador_datos_realistas as generador
+    if not os.path.exists(os.path.join(contexto['directorio_codigo'], generador.ARCHIVO_RED_CALLES)):
+        raise RuntimeError(f"falta la red cacheada {generador.ARCHIVO_RED_CALLES}")
+    generador.ARCHIVO_RED_CALLES = os.path.join(contexto['directorio_codigo'], generador.ARCHIVO_RED_CALLES)
+    generador.NUM_BUSES = max(1, n // generador.PUNTOS_POR_BUS)
+    return generador
+
+def _ejecutar_generador_realista(generador, contexto):
+    return len(generador.generar_datos_realistas())
+
+def _preparar_datos_con(*modulos):
+    """Datos sintéticos más la importación de los módulos de la etapa, fuera del cronómetro."""
+    def preparar(n, contexto):
+        for modulo in modulos:
+            importlib.import_module(modulo)
+        return datos_sinteticos(n)
+    return preparar
+
+def _ejecutar_features(df, contexto):
+    from analisis_predictivo_mejorado import crear_features_adicionales
+    return len(crear_features_adicionales(df))
+
+def _preparar_entrenamiento(n, contexto):
+    if n > contexto['max_entrenamiento']:
+        raise RuntimeError(f"más de {contexto['max_entrenamiento']:,} filas (ver --max-entrenamiento)")
+    from analisis_predictivo_mejorado import crear_features_adicionales
+    return crear_features_adicionales(datos_sinteticos(n))
+
+def _ejecutar_entrenamiento(df, contexto):
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import StandardScaler
+    from analisis_predictivo_mejorado import seleccionar_feature_columns, PARAMETROS_MODELO
+    feature_columns = seleccionar_feature_columns(df)
+    X = StandardScaler().fit_transform(df[feature_columns])
+    RandomForestRegressor(**PARAMETROS_MODELO, random_state=42, n_jobs=-1).fit(X, df['velocidad_kmh'])
+    return len(df)
+
+def _preparar_prediccion(n, contexto):
+    from analisis_predictivo_mejorado import crear_features_adicionales
+    model, scaler, feature_columns = _modelo_pequeno()
+    df = crear_features_adicionales(datos_sinteticos(n, semilla=1))
+    # Con pocas filas pueden faltar zonas: sus dummies van en 0, como en el modelo
+    return model, scaler.transform(df.reindex(columns=feature_columns, fill_value=0))
+
+def _ejecutar_prediccion(preparado, contexto):
+    model, X = preparado
+    return len(model.predict(X))
+
+def _preparar_prediccion_compacta(n, contexto):
+    from compactar_modelo import aplanar_bosque
+    model, X = _preparar_prediccion(n, contexto)
+    return aplanar_bosque(model.estimators_), X
+
+def _ejecutar_hotspots(df, contexto):
+    from hotspots_congestion import detectar_hotspots_df
+    detectar_hotspots_df(df)
+    return len(df)
+
+def _preparar_mapa_hotspots(n, contexto):
+    from hotspots_congestion import detectar_hotspots_df
+    return detectar_hotspots_df(datos_sinteticos(n))
+
+def _ejecutar_mapa_hotspots(hotspots, contexto):
+    import folium
+    from hotspots_congestion import agregar_capa_hotspots
+    mapa = folium.Map(location=[CENTRO_LAT, CENTRO_LON], zoom_start=13)
+    agregar_capa_hotspots(mapa, hotspots)
+    mapa.save(os.path.join(contexto['temporal'], 'mapa_hotspots.html'))
+    return len(hotspots)
+
+def _ejecutar_calidad(df, contexto):
+    from calidad_datos import ValidadorCalidad
+    ValidadorCalidad().validar(df[['placa', 'latitud', 'longitud', 'velocidad_kmh', 'ts']])
+    return len(df)
+
+def _ejecutar_almacen(df, contexto):
+    from almacen_trayectorias import AlmacenTrayectorias
+    almacen = AlmacenTrayectorias.desde_dataframe(df)
+    for bus in almacen:
+        bus.velocidad_kmh.mean()
+    return len(almacen)
+
+def _ejecutar_geocercas(df, contexto):
+    from geocercas import MotorGeocercas
+    df = df.sort_values('ts', kind='stable')
+    MotorGeocercas().procesar_df(df)
+    return len(df)
+
+# Etapas con base de datos (cluster temporal o base desechable)
+
+def _preparar_carga_copy(n, contexto):
+    from sqlalchemy import text
+    import gestor_cargas
+    from calidad_datos import normalizar_ts
+    with gestor_cargas.engine.begin() as conn:
+        conn.execute(text("TRUNCATE bus_locations;"))
+    contexto['columnas'] = gestor_cargas.preparar_tabla_destino('bus_locations')
+    df = datos_sinteticos(n)
+    return df[['placa', 'latitud', 'longitud', 'velocidad_kmh']].assign(ts=normalizar_ts(df['ts']))
+
+def _ejecutar_carga_copy(df, contexto):
+    from gestor_cargas import insertar_lote
+    insertar_lote(df, 'bus_locations', contexto['columnas'])
+    return contexto['n']
+
+def _preparar_carga_realista(n, contexto):
+    from sqlalchemy import text
+    import gestor_cargas
+    # Sin esto el manifiesto reconocería el archivo y la carga se omitiría
+    with gestor_cargas.engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS bus_locations_realistas;"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {gestor_cargas.TABLA_LOTES}, {gestor_cargas.TABLA_MANIFIESTO};"))
+    datos_sinteticos(n).drop(columns=['ts']).to_csv(
+        os.path.join(contexto['temporal'], 'datos_buses_aqp_realistas.csv'), index=False
+    )
+
+def _ejecutar_carga_realista(_, contexto):
+    from cargar_datos_realistas import cargar_datos_realistas
+    cargar_datos_realistas()
+    return contexto['n']
+
+def _preparar_carga_paralela(n, contexto):
+    from sqlalchemy import text
+    import carga_paralela
+    with carga_paralela.engine.begin() as conn:
+        conn.execute(text("TRUNCATE bus_locations;"))
+    archivo = os.path.join(contexto['temporal'], 'fixes.csv')
+    datos_sinteticos(n).drop(columns=['ts']).to_csv(archivo, index=False)
+    return archivo
+
+def _ejecutar_carga_paralela(archivo, contexto):
+    from carga_paralela import CargadorParalelo
+    return CargadorParalelo('bus_locations').cargar([archivo])['filas']
+
+def _ejecutar_features_sql(_, contexto):
+    from analisis_predictivo_mejorado import cargar_datos_mejorados
+    return len(cargar_datos_mejorados())
+
+def _ejecutar_mapa_interactivo(_, contexto):
+    from visualizador_mapa import crear_mapa_interactivo
+    crear_mapa_interactivo()
+    return min(contexto['n'], 2000)
+
+def _ejecutar_dashboard(_, contexto):
+    from visualizador_mapa import crear_dashboard_velocidades
+    crear_dashboard_velocidades()
+    return contexto['n']
+
+def _ejecutar_mapa_realista(_, contexto):
+    from visualizador_realista import crear_mapa_realista
+    crear_mapa_realista()
+    return min(contexto['n'], 1500)
+
+def _preparar_mapa_flota(n, contexto):
+    from posicion_actual import reconstruir_ultima_posicion
+    reconstruir_ultima_posicion()
+
+def _ejecutar_mapa_flota(_, contexto):
+    from posicion_actual import crear_mapa_flota_actual
+    crear_mapa_flota_actual()
+    return max(1, contexto['n'] // PUNTOS_POR_BUS)
+
+def _sin_preparacion(n, contexto):
+    return None
+
+# nombre: (preparar, ejecutar, requiere_bd)
+ETAPAS = {
+    'interpolar_ruta': (_preparar_interpolar, _ejecutar_interpolar, False),
+    'generador_basico': (_preparar_generador_basico, _ejecutar_generador_basico, False),
+    'generador_realista': (_preparar_generador_realista, _ejecutar_generador_realista, False),
+    'calidad': (_preparar_datos_con('calidad_datos'), _ejecutar_calidad, False),
+    'almacen': (_preparar_datos_con('almacen_trayectorias'), _ejecutar_almacen, False),
+    'geocercas': (_preparar_datos_con('geocercas'), _ejecutar_geocercas, False),
+    'features': (_preparar_datos_con('analisis_predictivo_mejorado'), _ejecutar_features, False),
+    'entrenamiento': (_preparar_entrenamiento, _ejecutar_entrenamiento, False),
+    'prediccion_lote': (_preparar_prediccion, _ejecutar_prediccion, False),
+    'prediccion_compacta': (_preparar_prediccion_compacta, _ejecutar_prediccion, False),
+    'hotspots': (_preparar_datos_con('hotspots_congestion', 'sklearn.cluster'), _ejecutar_hotspots, False),
+    'mapa_hotspots': (_preparar_mapa_hotspots, _ejecutar_mapa_hotspots, False),
+    'carga_copy': (_preparar_carga_copy, _ejecutar_carga_copy, True),
+    'carga_realista': (_preparar_carga_realista, _ejecutar_carga_realista, True),
+    'carga_paralela': (_preparar_carga_paralela, _ejecutar_carga_paralela, True),
+    'features_sql': (_sin_preparacion, _ejecutar_features_sql, True),
+    'mapa_interactivo': (_sin_preparacion, _ejecutar_mapa_interactivo, True),
+    'dashboard': (_sin_preparacion, _ejecutar_dashboard, True),
+    'mapa_realista': (_sin_preparacion, _ejecutar_mapa_realista, True),
+    'mapa_flota': (_preparar_mapa_flota, _ejecutar_mapa_flota, True),
+}
+
+MODULOS_CON_ENGINE = [
+    'analisis_predictivo_mejorado', 'features_espaciales',
+    'posicion_actual', 'visualizador_mapa', 'visualizador_realista', 'cargar_datos_realistas',
+    'calidad_datos', 'gestor_cargas', 'carga_paralela', 'cache_consultas',
+    'almacen_trayectorias', 'geocercas',
+]
+
+def _apuntar_a_bd(dsn):
+    """Redirige el engine de cada módulo a la base del benchmark."""
+    from sqlalchemy import create_engine
+    engine = create_engine(dsn)
+    for nombre in MODULOS_CON_ENGINE:
+        try:
+            modulo = __import__(nombre)
+        except ImportError:
+            continue
+        modulo.engine = engine
+        modulo.db_connection_str = dsn
+
+def _pico_rss_mb():
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB, macOS bytes
+    return pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024
+
+def _correr_etapa(nombre, n, dsn, raiz, max_entrenamiento):
+    """Se ejecuta en un proceso nuevo para que el pico de RSS sea solo de esta etapa."""
+    directorio_codigo = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, directorio_codigo)
+    # Este proceso hereda 'spawn'; los pools de las etapas deben usar el método por
+    # defecto de la plataforma, como al correr el script, y no reimportar todo
+    multiprocessing.set_start_method(None, force=True)
+    preparar, ejecutar, requiere_bd = ETAPAS[nombre]
+    temporal = tempfile.mkdtemp(prefix='bench_')
+    contexto = {'n': n, 'raiz': raiz, 'directorio_codigo': directorio_codigo, 'temporal': temporal,
+                'max_entrenamiento': max_entrenamiento}
+    os.chdir(temporal)   # Los scripts escriben CSV/HTML en el directorio actual
+    try:
+        if requiere_bd:
+            _apuntar_a_bd(dsn)
+        try:
+            preparado = preparar(n, contexto)
+        except (ImportError, RuntimeError) as e:
+            return {'etapa': nombre, 'n': n, 'estado': 'omitida', 'motivo': str(e)}
+
+        rss_inicial = _pico_rss_mb()
+        t0 = time.perf_counter()
+        cpu0 = time.process_time()
+        filas = ejecutar(preparado, contexto)
+        segundos = time.perf_counter() - t0
+        return {
+            'etapa': nombre, 'n': n, 'estado': 'ok', 'filas': filas,
+            'segundos': segundos, 'cpu_segundos': time.process_time() - cpu0,
+            'filas_por_segundo': filas / segundos if segundos > 0 else None,
+            'pico_rss_mb': _pico_rss_mb(), 'rss_preparacion_mb': rss_inicial,
+        }
+    except Exception as e:
+        return {'etapa': nombre, 'n': n, 'estado': 'error', 'motivo': f"{type(e).__name__}: {e}"}
+    finally:
+        os.chdir(raiz)
+        shutil.rmtree(temporal, ignore_errors=True)
+
+# --- Cluster PostgreSQL temporal ---
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _binarios_postgres():
+    bindir = None
+    if shutil.which('pg_config'):
+        bindir = subprocess.run(['pg_config', '--bindir'], capture_output=True, text=True).stdout.strip()
+    rutas = {}
+    for programa in ('initdb', 'pg_ctl'):
+        candidato = os.path.join(bindir, programa) if bindir else None
+        rutas[programa] = candidato if candidato and os.path.exists(candidato) else shutil.which(programa)
+        if rutas[programa] is None:
+            raise RuntimeError(f"No se encontró '{programa}' (instalar el servidor PostgreSQL)")
+    return rutas
+
+class ClusterTemporal:
+    """Cluster PostgreSQL desechable (initdb + pg_ctl) con PostGIS y, si está, TimescaleDB."""
+
+    def __init__(self):
+        self.binarios = _binarios_postgres()
+        self.directorio = tempfile.mkdtemp(prefix='pg_bench_')
+        self.puerto = _puerto_libre()
+        self.dsn = f'postgresql://postgres@127.0.0.1:{self.puerto}/benchmark'
+
+    def __enter__(self):
+        datos = os.path.join(self.directorio, 'datos')
+        subprocess.run([self.binarios['initdb'], '-D', datos, '-U', 'postgres', '--auth=trust'],
+                       check=True, capture_output=True)
+        sharedir = subprocess.run(['pg_config', '--sharedir'], capture_output=True, text=True).stdout.strip()
+        self.timescale = os.path.exists(os.path.join(sharedir, 'extension', 'timescaledb.control'))
+        with open(os.path.join(datos, 'postgresql.conf'), 'a') as f:
+            f.write(f"\nport = {self.puerto}\nlisten_addresses = '127.0.0.1'\n"
+                    f"unix_socket_directories = '{self.directorio}'\n"
+                    "fsync = off\nsynchronous_commit = off\n")
+            if self.timescale:
+                f.write("shared_preload_libraries = 'timescaledb'\n")
+        subprocess.run([self.binarios['pg_ctl'], '-D', datos, '-l', os.path.join(self.directorio, 'log'),
+                        '-w', 'start'], check=True, capture_output=True)
+        self._crear_esquema()
+        return self
+
+    def _crear_esquema(self):
+        from sqlalchemy import create_engine, text
+        admin = create_engine(f'postgresql://postgres@127.0.0.1:{self.puerto}/postgres',
+                              isolation_level='AUTOCOMMIT')
+        with admin.connect() as conn:
+            conn.execute(text("CREATE DATABASE benchmark;"))
+        admin.dispose()
+
+        engine = create_engine(self.dsn)
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis;"))
+            # Mismo esquema que MiPrimeraDB.backup (hypertable con índice por ts y gist)
+            conn.execute(text("""
+            CREATE TABLE bus_locations (
+                placa TEXT,
+                velocidad_kmh INTEGER,
+                location geometry(Point, 4326),
+                ts TIMESTAMPTZ NOT NULL
+            );
+            """))
+            if self.timescale:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS timescaledb;"))
+                # create_hypertable crea bus_locations_ts_idx (ts DESC)
+                conn.execute(text("SELECT create_hypertable('bus_locations', 'ts');"))
+            else:
+                conn.execute(text("CREATE INDEX bus_locations_ts_idx ON bus_locations (ts DESC);"))
+            conn.execute(text("CREATE INDEX idx_bus_locations_location ON bus_locations USING gist (location);"))
+        engine.dispose()
+
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import features_espaciales
+        features_espaciales.engine = create_engine(self.dsn)
+        features_espaciales.agregar_columna_utm()
+        features_espaciales.engine.dispose()
+
+    def __exit__(self, *exc):
+        subprocess.run([self.binarios['pg_ctl'], '-D', os.path.join(self.directorio, 'datos'),
+                        '-m', 'fast', 'stop'], capture_output=True)
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+# --- Ejecución, reporte y regresiones ---
+
+def ejecutar_benchmark(tamanos=TAMANOS, etapas=None, dsn=None, max_entrenamiento=MAX_FILAS_ENTRENAMIENTO):
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    etapas = etapas or list(ETAPAS)
+    contexto_mp = multiprocessing.get_context('spawn')
+    resultados = []
+
+    for n in tamanos:
+        print(f"\n📏 {n:,} fixes")
+        for nombre in etapas:
+            if ETAPAS[nombre][2] and dsn is None:
+                resultado = {'etapa': nombre, 'n': n, 'estado': 'omitida',
+                             'motivo': 'sin base de datos (--pg-temporal o --dsn)'}
+            else:
+                with ProcessPoolExecutor(max_workers=1, mp_context=contexto_mp) as ejecutor:
+                    resultado = ejecutor.submit(_correr_etapa, nombre, n, dsn, raiz,
+                                                max_entrenamiento).result()
+            resultados.append(resultado)
+
+            if resultado['estado'] == 'ok':
+                velocidad = resultado['filas_por_segundo'] or 0
+                print(f"   ✅ {nombre:<20} {resultado['segundos']:>9.3f} s {velocidad:>14,.0f} filas/s "
+                      f"{resultado['pico_rss_mb']:>8.0f} MB")
+            else:
+                print(f"   {'⏭️' if resultado['estado'] == 'omitida' else '❌'} {nombre:<20} "
+                      f"{resultado['estado']}: {resultado['motivo']}")
+
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {'python': platform.python_version(), 'plataforma': platform.platform(),
+                    'cpus': os.cpu_count(), 'bd': 'temporal' if dsn and '127.0.0.1' in dsn else bool(dsn)},
+        'resultados': resultados,
+    }
+
+def comparar_con_linea_base(reporte, archivo=ARCHIVO_LINEA_BASE, tolerancia=TOLERANCIA_REGRESION):
+    """Marca etapas más lentas que la línea base más allá de la tolerancia."""
+    with open(archivo, encoding='utf-8') as f:
+        base = {(r['etapa'], r['n']): r for r in json.load(f)['resultados'] if r['estado'] == 'ok'}
+
+    regresiones = []
+    print(f"\n📐 Comparación con '{archivo}' (tolerancia {tolerancia:.0%})")
+    for r in reporte['resultados']:
+        anterior = base.get((r['etapa'], r['n']))
+        if r['estado'] != 'ok' or anterior is None:
+            continue
+        cambio = r['segundos'] / anterior['segundos'] - 1 if anterior['segundos'] > 0 else 0
+        if cambio > tolerancia and r['segundos'] - anterior['segundos'] > PISO_RUIDO_S:
+            regresiones.append({**r, 'segundos_base': anterior['segundos'], 'cambio': cambio})
+            print(f"   ⚠️ {r['etapa']} ({r['n']:,}): {anterior['segundos']:.3f} s → "
+                  f"{r['segundos']:.3f} s (+{cambio:.0%})")
+    if not regresiones:
+        print("   ✅ Sin regresiones")
+    return regresiones
+
+def guardar_reporte(reporte, archivo=None):
+    os.makedirs(DIRECTORIO_RESULTADOS, exist_ok=True)
+    archivo = archivo or os.path.join(DIRECTORIO_RESULTADOS,
+                                      f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(archivo, 'w', encoding='utf-8') as f:
+        json.dump(reporte, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Resultados guardados en {archivo}")
+    return archivo
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark generar → cargar → entrenar → predecir → mapas")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=TAMANOS,
+                        help="Cantidad de fixes por corrida (p. ej. 1000 10000000)")
+    parser.add_argument('--etapas', nargs='+', choices=list(ETAPAS), help="Solo estas etapas")
+    parser.add_argument('--pg-temporal', action='store_true',
+                        help="Crear un cluster PostgreSQL temporal con initdb/pg_ctl")
+    parser.add_argument('--dsn', help="Base desechable ya corriendo (se reemplazan sus tablas)")
+    parser.add_argument('--max-entrenamiento', type=int, default=MAX_FILAS_ENTRENAMIENTO)
+    parser.add_argument('--salida', help="Archivo JSON de resultados")
+    parser.add_argument('--linea-base', default=ARCHIVO_LINEA_BASE)
+    parser.add_argument('--guardar-linea-base', action='store_true',
+                        help="Guardar esta corrida como nueva línea base")
+    args = parser.parse_args()
+
+    print("⏱️ BENCHMARK DEL PIPELINE")
+    print("=" * 50)
+
+    try:
+        if args.pg_temporal:
+            with ClusterTemporal() as cluster:
+                print(f"🐘 Cluster temporal en puerto {cluster.puerto} "
+                      f"({'con' if cluster.timescale else 'sin'} TimescaleDB)")
+                reporte = ejecutar_benchmark(args.tamanos, args.etapas, cluster.dsn, args.max_entrenamiento)
+        else:
+            reporte = ejecutar_benchmark(args.tamanos, args.etapas, args.dsn, args.max_entrenamiento)
+
+        guardar_reporte(reporte, args.salida)
+        if args.guardar_linea_base:
+            guardar_reporte(reporte, args.linea_base)
+        elif os.path.exists(args.linea_base):
+            if comparar_con_linea_base(reporte, args.linea_base):
+                sys.exit(1)
+
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Están instalados PostgreSQL, PostGIS y (opcional) TimescaleDB?")
+        print("   • Sin servidor se puede correr solo la parte sin BD (sin --pg-temporal)")
@@ -0,0 +1,294 @@
+import argparse
+import hashlib
+import inspect
+import json
+import math
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+import numpy as np
+
+DIRECTORIO_CACHE = 'cache_features'
+ARCHIVO_ENSAYOS = 'busqueda_hiperparametros.sqlite'
+
+# Espacio de búsqueda alrededor de los parámetros hechos a mano
+ESPACIO = {
+    'n_estimators': [100, 200, 300, 400],
+    'max_depth': [8, 10, 12, 15, 20, None],
+    'min_samples_split': [2, 5, 10, 20],
+    'min_samples_leaf': [1, 2, 4, 8],
+    'max_features': [1.0, 0.7, 0.5, 'sqrt'],
+}
+N_CONFIGURACIONES = 27
+FACTOR_HALVING = 3           # Cada ronda deja 1/3 de las configuraciones con 3x más datos
+MUESTRAS_MINIMAS = 20000
+FRACCION_VALIDACION = 0.2
+MAX_VALIDACION = 50000
+PASO_ARBOLES = 50            # Cada cuántos árboles se revisa si vale la pena seguir
+MARGEN_PODA = 0.10           # Se corta un ensayo con MAE 10% peor que el mejor de su ronda
+
+# --- Cache de features ---
+
+def huella_features():
+    """Hash del código que arma la matriz: si cambia una feature, el cache no sirve."""
+    import analisis_predictivo_mejorado as apm
+    import features_espaciales
+    import geocercas
+
+    funciones = [apm.cargar_datos_entrenamiento, apm.cargar_datos_mejorados, apm.crear_features_adicionales,
+                 apm.seleccionar_feature_columns, apm.mascara_prueba,
+                 features_espaciales.sql_distancia_centro, geocercas.clasificar_zona]
+    codigo = ''.join(inspect.getsource(f) for f in funciones)
+    return hashlib.sha256(codigo.encode()).hexdigest()[:12]
+
+def cachear_features(directorio=DIRECTORIO_CACHE, forzar=False):
+    """Guarda X e y como .npy (mmap) para no repetir la carga de BD en cada ensayo.
+
+    Se reutiliza mientras no cambien la ventana de datos de `bus_locations` ni
+    el código de las features. Las filas de prueba de `mascara_prueba` no se
+    guardan: la búsqueda no las ve y el MAE de prueba del modelo final sigue
+    siendo sobre datos nuevos para él.
+    """
+    from analisis_predictivo_mejorado import (
+        cargar_datos_entrenamiento, seleccionar_feature_columns, ventana_entrenamiento, mascara_prueba
+    )
+
+    ventana = ventana_entrenamiento()
+    codigo = huella_features()
+    ruta_meta = os.path.join(directorio, 'metadata.json')
+    if not forzar and os.path.exists(ruta_meta):
+        with open(ruta_meta, encoding='utf-8') as f:
+            metadata = json.load(f)
+        if metadata['ventana'] == ventana and metadata.get('codigo') == codigo:
+            print(f"♻️ Reutilizando features cacheadas en '{directorio}' ({metadata['filas']:,} filas)")
+            return metadata
+
+    t0 = time.perf_counter()
+    df = cargar_datos_entrenamiento()
+    feature_columns = seleccionar_feature_columns(df)
+    df = df[~mascara_prueba(df)]
+
+    os.makedirs(directorio, exist_ok=True)
+    # float32 es lo que usa el RandomForest internamente
+    np.save(os.path.join(directorio, 'X.npy'), df[feature_columns].to_numpy(dtype=np.float32))
+    np.save(os.path.join(directorio, 'y.npy'), df['velocidad_kmh'].to_numpy(dtype=np.float64))
+
+    metadata = {
+        'feature_columns': feature_columns,
+        'filas': len(df),
+        'ventana': ventana,
+        'codigo': codigo,
+        'version_datos': hashlib.sha256(json.dumps([ventana, codigo, feature_columns], sort_keys=True,
+                                                   default=str).encode()).hexdigest()[:12],
+    }
+    with open(ruta_meta, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    print(f"✅ Features cacheadas en '{directorio}': {len(df):,} filas, "
+          f"{len(feature_columns)} columnas ({time.perf_counter() - t0:.1f} s)")
+    return metadata
+
+def cargar_features_cacheadas(directorio=DIRECTORIO_CACHE):
+    X = np.load(os.path.join(directorio, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(directorio, 'y.npy'), mmap_mode='r')
+    return X, y
+
+# --- Registro de ensayos en SQLite ---
+
+def _conectar(archivo=ARCHIVO_ENSAYOS):
+    conexion = sqlite3.connect(archivo)
+    conexion.execute("""
+    CREATE TABLE IF NOT EXISTS ensayos (
+        busqueda TEXT NOT NULL,
+        config INTEGER NOT NULL,
+        ronda INTEGER NOT NULL,
+        parametros TEXT NOT NULL,
+        muestras INTEGER NOT NULL,
+        arboles INTEGER NOT NULL,
+        mae REAL NOT NULL,
+        estado TEXT NOT NULL,
+        segundos REAL NOT NULL,
+        creado TEXT NOT NULL,
+        PRIMARY KEY (busqueda, config, ronda)
+    )
+    """)
+    return conexion
+
+def _ensayos_previos(conexion, busqueda):
+    filas = conexion.execute(
+        "SELECT config, ronda, mae, estado FROM ensayos WHERE busqueda = ?", (busqueda,)
+    ).fetchall()
+    return {(config, ronda): (mae, estado) for config, ronda, mae, estado in filas}
+
+def _guardar_ensayo(conexion, busqueda, resultado):
+    conexion.execute("""
+    INSERT OR REPLACE INTO ensayos
+        (busqueda, config, ronda, parametros, muestras, arboles, mae, estado, segundos, creado)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (busqueda, resultado['config'], resultado['ronda'], json.dumps(resultado['parametros']),
+          resultado['muestras'], resultado['arboles'], resultado['mae'], resultado['estado'],
+          resultado['segundos'], datetime.now().isoformat(timespec='seconds')))
+    conexion.commit()
+
+# --- Ensayos en procesos ---
+
+_X = _y = _idx_train = _idx_val = None
+
+def _inicializar_proceso(directorio, semilla):
+    """Cada proceso mapea las features del disco: no se copian entre procesos."""
+    global _X, _y, _idx_train, _idx_val
+    _X, _y = cargar_features_cacheadas(directorio)
+    _idx_train, _idx_val = _particion(len(_y), semilla)
+
+def _particion(n, semilla):
+    orden = np.random.default_rng(semilla).permutation(n)
+    n_val = min(int(n * FRACCION_VALIDACION), MAX_VALIDACION)
+    return orden[n_val:], np.sort(orden[:n_val])
+
+def _evaluar_ensayo(tarea):
+    """Entrena con `muestras` filas agregando árboles por tandas; se corta si no promete."""
+    from sklearn.ensemble import RandomForestRegressor
+
+    config, ronda, parametros, muestras, corte_mae = tarea
+    t0 = time.perf_counter()
+    filas = np.sort(_idx_train[:muestras])
+    X_train, y_train = _X[filas], _y[filas]
+    X_val, y_val = _X[_idx_val], _y[_idx_val]
+
+    total_arboles = parametros['n_estimators']
+    model = RandomForestRegressor(**{**parametros, 'n_estimators': 0}, warm_start=True,
+                                  random_state=config, n_jobs=1)
+    estado = 'completo'
+    while model.n_estimators < total_arboles:
+        model.n_estimators = min(model.n_estimators + PASO_ARBOLES, total_arboles)
+        model.fit(X_train, y_train)
+        mae = float(np.abs(model.predict(X_val) - y_val).mean())
+        if corte_mae is not None and mae > corte_mae * (1 + MARGEN_PODA):
+            estado = 'podado'
+            break
+
+    return {'config': config, 'ronda': ronda, 'parametros': parametros, 'muestras': len(filas),
+            'arboles': model.n_estimators, 'mae': mae, 'estado': estado,
+            'segundos': time.perf_counter() - t0}
+
+def generar_configuraciones(n, semilla):
+    rng = np.random.default_rng(semilla)
+    configuraciones = []
+    for _ in range(n):
+        parametros = {}
+        for nombre, valores in ESPACIO.items():
+            valor = valores[rng.integers(len(valores))]
+            parametros[nombre] = valor.item() if isinstance(valor, np.generic) else valor
+        configuraciones.append(parametros)
+    return configuraciones
+
+def buscar_hiperparametros(n_configuraciones=N_CONFIGURACIONES, semilla=42, procesos=None,
+                           directorio=DIRECTORIO_CACHE, archivo=ARCHIVO_ENSAYOS):
+    """Búsqueda aleatoria con successive halving sobre la cantidad de filas.
+
+    Los ensayos ya registrados para la misma búsqueda (mismas semilla,
+    espacio y datos) no se repiten, así que una búsqueda interrumpida se
+    retoma ejecutando lo mismo otra vez.
+    """
+    metadata = cachear_features(directorio)
+    n_train = metadata['filas'] - min(int(metadata['filas'] * FRACCION_VALIDACION), MAX_VALIDACION)
+    configuraciones = generar_configuraciones(n_configuraciones, semilla)
+
+    firma = json.dumps({'semilla': semilla, 'n': n_configuraciones, 'factor': FACTOR_HALVING,
+                        'minimo': MUESTRAS_MINIMAS, 'espacio': ESPACIO,
+                        'datos': metadata['version_datos']}, sort_keys=True, default=str)
+    busqueda = hashlib.sha256(firma.encode()).hexdigest()[:12]
+
+    conexion = _conectar(archivo)
+    previos = _ensayos_previos(conexion, busqueda)
+    print(f"🔎 Búsqueda {busqueda}: {n_configuraciones} configuraciones, "
+          f"{len(previos)} ensayos ya registrados")
+
+    vivos = list(range(n_configuraciones))
+    ronda = 0
+    max_en_curso = procesos or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_proceso,
+                             initargs=(directorio, semilla)) as ejecutor:
+        while True:
+            muestras = min(MUESTRAS_MINIMAS * FACTOR_HALVING ** ronda, n_train)
+            resultados = {c: previos[(c, ronda)][0] for c in vivos if (c, ronda) in previos}
+            pendientes = [c for c in vivos if c not in resultados]
+            t0 = time.perf_counter()
+
+            # Se envían tantos ensayos como procesos; cada uno nuevo recibe como
+            # umbral de poda el mejor MAE de la ronda conocido en ese momento
+            cola, en_curso = list(pendientes), set()
+            while cola or en_curso:
+                while cola and len(en_curso) < max_en_curso:
+                    corte = min(resultados.values()) if resultados else None
+                    c = cola.pop(0)
+                    en_curso.add(ejecutor.submit(_evaluar_ensayo,
+                                                 (c, ronda, configuraciones[c], muestras, corte)))
+                terminados, en_curso = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    resultado = futuro.result()
+                    _guardar_ensayo(conexion, busqueda, resultado)
+                    resultados[resultado['config']] = resultado['mae']
+
+            ordenados = sorted(vivos, key=lambda c: resultados[c])
+            print(f"   Ronda {ronda}: {len(vivos)} configuraciones con {muestras:,} filas, "
+                  f"mejor MAE {resultados[ordenados[0]]:.3f} km/h "
+                  f"({len(pendientes)} nuevas, {time.perf_counter() - t0:.1f} s)")
+
+            if len(vivos) == 1 or muestras >= n_train:
+                break
+            vivos = ordenados[:max(1, math.ceil(len(vivos) / FACTOR_HALVING))]
+            ronda += 1
+
+    conexion.close()
+    mejor = ordenados[0]
+    print(f"🏆 Mejor configuración: {configuraciones[mejor]} (MAE {resultados[mejor]:.3f} km/h)")
+    return busqueda, configuraciones[mejor]
+
+def mejores_parametros(busqueda=None, archivo=ARCHIVO_ENSAYOS):
+    """Mejor ensayo completo de la última ronda de una búsqueda (por defecto la más reciente)."""
+    conexion = _conectar(archivo)
+    try:
+        if busqueda is None:
+            busqueda = conexion.execute(
+                "SELECT busqueda FROM ensayos ORDER BY creado DESC LIMIT 1"
+            ).fetchone()
+            if busqueda is None:
+                raise ValueError(f"No hay ensayos registrados en '{archivo}'")
+            busqueda = busqueda[0]
+        fila = conexion.execute("""
+        SELECT parametros, mae, muestras FROM ensayos
+        WHERE busqueda = ? AND estado = 'completo'
+        ORDER BY ronda DESC, mae ASC LIMIT 1
+        """, (busqueda,)).fetchone()
+    finally:
+        conexion.close()
+    return json.loads(fila[0]), fila[1], fila[2]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Búsqueda de hiperparámetros del RandomForest")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    p_buscar = sub.add_parser('buscar', help="Ejecutar (o retomar) una búsqueda")
+    p_buscar.add_argument('--configuraciones', type=int, default=N_CONFIGURACIONES)
+    p_buscar.add_argument('--semilla', type=int, default=42)
+    p_buscar.add_argument('--procesos', type=int, default=None)
+    sub.add_parser('mejores', help="Mostrar los mejores parámetros encontrados")
+    sub.add_parser('entrenar', help="Entrenar y registrar el modelo con los mejores parámetros")
+    args = parser.parse_args()
+
+    try:
+        if args.comando == 'buscar':
+            buscar_hiperparametros(args.configuraciones, args.semilla, args.procesos)
+        elif args.comando == 'mejores':
+            parametros, mae, muestras = mejores_parametros()
+            print(f"🏆 {parametros} → MAE {mae:.3f} km/h con {muestras:,} filas")
+        elif args.comando == 'entrenar':
+            from analisis_predictivo_mejorado import cargar_datos_entrenamiento, entrenar_modelo_mejorado
+            parametros, _, _ = mejores_parametros()
+            entrenar_modelo_mejorado(cargar_datos_entrenamiento(), parametros)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿PostgreSQL está corriendo y 'bus_locations' tiene datos?")
+        print("   • ¿Se ejecutó una búsqueda? (python busqueda_hiperparametros.py buscar)")
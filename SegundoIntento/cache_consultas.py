@@ -0,0 +1,265 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+DIRECTORIO_CACHE_CONSULTAS = 'cache_consultas'
+MAX_ENTRADAS_MEMORIA = 64
+MAX_BYTES_MEMORIA = 256 * 1024 ** 2
+MAX_BYTES_DISCO = 2 * 1024 ** 3
+
+COLUMNA_VERSION = 'ts'
+
+# Versión de una tabla sin escribir nada en la BD: el oid (tabla recreada),
+# la lista de chunks del catálogo (drop_chunks, chunk nuevo) y MAX(ts) de
+# cada chunk, que cambia al hacer commit de un fix más nuevo que los que ya
+# tenía. Con un índice que empiece por ts cada MAX lee una sola entrada, así
+# que cuesta lo mismo con 1 k o 1 G filas y no bloquea a quien escribe.
+SQL_VERSION_TABLA = f"""
+SELECT CAST(c.oid AS BIGINT) AS oid,
+       c.relkind AS tipo,
+       EXISTS (SELECT 1 FROM pg_index i
+               JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+               WHERE i.indrelid = c.oid AND a.attname = '{COLUMNA_VERSION}') AS indexada,
+       ARRAY(SELECT CAST(CAST(h.inhrelid AS regclass) AS TEXT)
+             FROM pg_inherits h WHERE h.inhparent = c.oid ORDER BY h.inhrelid) AS chunks
+FROM pg_class c
+WHERE c.oid = CAST(:tabla AS regclass);
+"""
+
+def normalizar_sql(sql):
+    """Quita comentarios, espacios repetidos y el ';' final (no cambia mayúsculas: hay literales)."""
+    sql = re.sub(r'--[^\n]*', ' ', str(sql))
+    return re.sub(r'\s+', ' ', sql).strip().rstrip(';').strip()
+
+def tablas_consultadas(sql):
+    """Candidatos a tabla después de FROM/JOIN, sin CTEs ni funciones.
+
+    Puede incluir falsos positivos (p. ej. `EXTRACT(HOUR FROM ts)`); los que no
+    son relaciones se descartan al calcular la versión.
+    """
+    # FROM a, b: la segunda tabla no se detecta, mejor no cachear
+    if re.search(r'\b(?:FROM|JOIN)\s+[A-Za-z_][\w.]*(?:\s+(?:AS\s+)?\w+)?\s*,', sql, flags=re.IGNORECASE):
+        return []
+    ctes = set(re.findall(r'\b(\w+)\s+AS\s*\(', sql, flags=re.IGNORECASE))
+    candidatos = re.findall(r'\b(?:FROM|JOIN)\s+([A-Za-z_][\w.]*)\s*(\()?', sql, flags=re.IGNORECASE)
+    return sorted({nombre for nombre, parentesis in candidatos if not parentesis and nombre not in ctes})
+
+def indexar_tabla(tabla):
+    """Crea el índice por ts que necesita `version_datos` (paso explícito, una vez por tabla)."""
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{tabla}_{COLUMNA_VERSION} ON {tabla} ({COLUMNA_VERSION} DESC);"
+        ))
+
+def version_datos(conn, tablas):
+    """Token de versión de las tablas de la consulta, o None si no se puede cachear.
+
+    Las vistas no tienen versión propia, y una tabla sin índice por ts haría
+    recorrer la tabla entera para calcularla: en ambos casos la consulta se
+    ejecuta siempre (`python cache_consultas.py indexar --tabla ...`).
+    Un UPDATE, o un fix atrasado más viejo que el último de su chunk, no
+    cambia la versión; después de corregir datos hay que limpiar el cache.
+    """
+    version = {}
+    for tabla in tablas:
+        if conn.execute(text("SELECT to_regclass(:tabla)"), {'tabla': tabla}).scalar() is None:
+            continue
+        fila = conn.execute(text(SQL_VERSION_TABLA), {'tabla': tabla}).fetchone()
+        if fila.tipo not in ('r', 'p') or not fila.indexada:
+            return None
+        relaciones = list(fila.chunks) or [tabla]
+        maximos = conn.execute(text("SELECT ARRAY[" + ", ".join(
+            f"(SELECT EXTRACT(EPOCH FROM MAX({COLUMNA_VERSION})) FROM {r})" for r in relaciones
+        ) + "]")).scalar()
+        version[tabla] = [int(fila.oid), [[r, str(m)] for r, m in zip(relaciones, maximos)]]
+    return version or None
+
+class CacheConsultas:
+    """Cache de resultados en dos niveles: LRU en memoria y Parquet en disco.
+
+    Ambos niveles se acotan por tamaño; en disco se elimina primero el archivo
+    usado hace más tiempo (mtime, que se actualiza en cada acierto).
+    """
+
+    def __init__(self, directorio=DIRECTORIO_CACHE_CONSULTAS, max_entradas=MAX_ENTRADAS_MEMORIA,
+                 max_bytes_memoria=MAX_BYTES_MEMORIA, max_bytes_disco=MAX_BYTES_DISCO):
+        self.directorio = directorio
+        self.max_entradas = max_entradas
+        self.max_bytes_memoria = max_bytes_memoria
+        self.max_bytes_disco = max_bytes_disco
+        self._datos = OrderedDict()
+        self._bytes_memoria = 0
+        self.aciertos_memoria = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f'{clave}.parquet')
+
+    def obtener(self, clave):
+        entrada = self._datos.get(clave)
+        if entrada is not None:
+            self._datos.move_to_end(clave)
+            self.aciertos_memoria += 1
+            return entrada[0].copy()
+        ruta = self._ruta(clave)
+        if os.path.exists(ruta):
+            try:
+                df = pd.read_parquet(ruta)
+            except Exception:
+                os.remove(ruta)   # Archivo truncado o de otra versión de pyarrow
+            else:
+                os.utime(ruta)
+                self.aciertos_disco += 1
+                self._guardar_memoria(clave, df)
+                return df.copy()
+        self.fallos += 1
+        return None
+
+    def guardar(self, clave, df):
+        self._guardar_memoria(clave, df.copy())
+        self._guardar_disco(clave, df)
+
+    def _guardar_memoria(self, clave, df):
+        tamano = int(df.memory_usage(deep=True).sum())
+        if tamano > self.max_bytes_memoria:
+            return
+        if clave in self._datos:
+            self._bytes_memoria -= self._datos.pop(clave)[1]
+        self._datos[clave] = (df, tamano)
+        self._bytes_memoria += tamano
+        while len(self._datos) > self.max_entradas or self._bytes_memoria > self.max_bytes_memoria:
+            self._bytes_memoria -= self._datos.popitem(last=False)[1][1]
+
+    def _guardar_disco(self, clave, df):
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = self._ruta(clave)
+        temporal = ruta + '.tmp'
+        try:
+            df.to_parquet(temporal, index=False)
+        except Exception:
+            # Tipos que Parquet no representa (objetos mixtos): solo memoria
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            return
+        os.replace(temporal, ruta)
+        self._podar_disco()
+
+    def _podar_disco(self):
+        archivos = [os.path.join(self.directorio, f) for f in os.listdir(self.directorio)
+                    if f.endswith('.parquet')]
+        archivos.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in archivos)
+        for archivo in archivos:
+            if total <= self.max_bytes_disco:
+                break
+            total -= os.path.getsize(archivo)
+            os.remove(archivo)
+
+    def invalidar(self):
+        self._datos.clear()
+        self._bytes_memoria = 0
+        if os.path.isdir(self.directorio):
+            for f in os.listdir(self.directorio):
+                if f.endswith('.parquet'):
+                    os.remove(os.path.join(self.directorio, f))
+
+    def estadisticas(self):
+        archivos = ([f for f in os.listdir(self.directorio) if f.endswith('.parquet')]
+                    if os.path.isdir(self.directorio) else [])
+        return {
+            'aciertos_memoria': self.aciertos_memoria,
+            'aciertos_disco': self.aciertos_disco,
+            'fallos': self.fallos,
+            'entradas_memoria': len(self._datos),
+            'mb_memoria': self._bytes_memoria / 1024 ** 2,
+            'entradas_disco': len(archivos),
+            'mb_disco': sum(os.path.getsize(os.path.join(self.directorio, f)) for f in archivos) / 1024 ** 2,
+        }
+
+cache_consultas = CacheConsultas()
+
+def leer_sql(sql, con=None, params=None):
+    """`pd.read_sql` con cache, invalidado cuando cambian las tablas consultadas.
+
+    La clave es el SQL normalizado, los parámetros, la base y la versión de
+    cada tabla; si llegan datos nuevos la clave cambia y la consulta se
+    vuelve a ejecutar. Las entradas viejas se van por tamaño.
+    """
+    con = con or engine
+    sql_normalizado = normalizar_sql(sql)
+    with con.connect() as conn:
+        version = version_datos(conn, tablas_consultadas(sql_normalizado))
+    if version is None:
+        return pd.read_sql(sql, con, params=params)
+
+    clave = hashlib.sha256(json.dumps(
+        [con.url.render_as_string(hide_password=True), sql_normalizado, params, version],
+        sort_keys=True, default=str,
+    ).encode()).hexdigest()[:32]
+    df = cache_consultas.obtener(clave)
+    if df is None:
+        df = pd.read_sql(sql, con, params=params)
+        cache_consultas.guardar(clave, df)
+    return df
+
+def medir_cache(sql, repeticiones=5):
+    """Compara la primera ejecución con las repetidas sobre los mismos datos."""
+    cache_consultas.invalidar()
+    t0 = time.perf_counter()
+    leer_sql(sql)
+    primera = time.perf_counter() - t0
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        leer_sql(sql)
+        tiempos.append(time.perf_counter() - t0)
+    print(f"⏱️ Sin cache: {primera * 1000:.1f} ms | con cache: {min(tiempos) * 1000:.1f} ms "
+          f"({primera / min(tiempos):.0f}x)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cache de resultados de consultas")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('estado', help="Entradas y tamaño del cache en disco")
+    sub.add_parser('limpiar', help="Vaciar el cache")
+    p_indexar = sub.add_parser('indexar', help="Crear el índice por ts con que se versiona una tabla")
+    p_indexar.add_argument('--tabla', default='bus_locations')
+    p_medir = sub.add_parser('medir', help="Tiempo de una consulta con y sin cache")
+    p_medir.add_argument('--sql', default="SELECT placa, COUNT(*) AS fixes, AVG(velocidad_kmh) AS velocidad "
+                                          "FROM bus_locations GROUP BY placa")
+    args = parser.parse_args()
+
+    try:
+        if args.comando == 'estado':
+            stats = cache_consultas.estadisticas()
+            print(f"📦 {stats['entradas_disco']} resultados en '{DIRECTORIO_CACHE_CONSULTAS}' "
+                  f"({stats['mb_disco']:.1f} MB de {MAX_BYTES_DISCO / 1024 ** 2:.0f} MB)")
+        elif args.comando == 'limpiar':
+            cache_consultas.invalidar()
+            print(f"🧹 Cache '{DIRECTORIO_CACHE_CONSULTAS}' vaciado")
+        elif args.comando == 'indexar':
+            indexar_tabla(args.tabla)
+            print(f"✅ Índice por {COLUMNA_VERSION} en '{args.tabla}': sus consultas ya se pueden cachear")
+        elif args.comando == 'medir':
+            medir_cache(args.sql)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Está PostgreSQL corriendo?")
+        print("   • ¿Está instalado pyarrow (nivel en disco)?")
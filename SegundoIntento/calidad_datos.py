@@ -0,0 +1,325 @@
+import csv
+import io
+import time
+from datetime import timedelta, timezone
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from instrumentacion import instrumentar
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+TABLA_CUARENTENA = 'fixes_cuarentena'
+
+# Área metropolitana de Arequipa (más holgada que el área de los POIs)
+LAT_MIN, LAT_MAX = -16.55, -16.25
+LON_MIN, LON_MAX = -71.70, -71.40
+VELOCIDAD_MAX_KMH = 120          # Velocidad reportada plausible para un bus urbano
+VELOCIDAD_SALTO_MAX_KMH = 150    # Velocidad implícita entre fixes consecutivos
+VELOCIDAD_MOVIMIENTO_KMH = 15    # Por encima, un fix con velocidad 0 es inconsistente
+DT_MINIMO_S = 1.0                # Evita dividir por ~0 con timestamps casi iguales
+PASADAS_SALTOS = 2               # Al quitar un pico, sus vecinos se vuelven a comparar
+RADIO_TIERRA_M = 6_371_000
+ZONA_HORARIA = timezone(timedelta(hours=-5))   # Los ts naive de los CSV son hora de Perú (sin horario de verano)
+PATRON_OFFSET = r'(?:Z|[+-]\d{2}:?\d{2})$'
+
+# Códigos de motivo (bits: una fila puede tener varios)
+MOTIVOS = {
+    'placa_vacia': 1,
+    'coordenada_invalida': 2,
+    'fuera_bbox': 4,
+    'timestamp_invalido': 8,
+    'velocidad_invalida': 16,
+    'duplicado': 32,
+    'salto_imposible': 64,
+    'velocidad_cero_en_movimiento': 128,
+    'rechazado_bd': 256,          # Lote válido que la BD no aceptó (p. ej. ingesta en vivo)
+    'error_validacion': 512,      # Lote que la validación no pudo procesar
+}
+
+def nombres_motivos(codigo):
+    """Nombres de los motivos contenidos en un código."""
+    return [nombre for nombre, bit in MOTIVOS.items() if codigo & bit]
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distancia en metros entre arreglos de puntos."""
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_M * np.arcsin(np.sqrt(a))
+
+def normalizar_ts(valores):
+    """Timestamps con zona, en `ZONA_HORARIA` (NaT si no se pueden leer).
+
+    Los naive se toman como hora local y los que traen offset se convierten,
+    así un lote con offsets distintos, o con naive y aware mezclados, se
+    compara sin errores y `ts` (timestamptz) recibe el instante correcto sin
+    depender del TimeZone de la sesión.
+    """
+    serie = pd.Series(valores)
+    if isinstance(serie.dtype, pd.DatetimeTZDtype):
+        return serie.dt.tz_convert(ZONA_HORARIA)
+    if pd.api.types.is_datetime64_dtype(serie.dtype):
+        return serie.dt.tz_localize(ZONA_HORARIA)
+    con_offset = serie.astype(str).str.contains(PATRON_OFFSET).to_numpy(dtype=bool)
+    if not con_offset.any():
+        return pd.to_datetime(serie, errors='coerce').dt.tz_localize(ZONA_HORARIA)
+    instantes = pd.to_datetime(serie, errors='coerce', utc=True, format='mixed')
+    naive = instantes.dt.tz_localize(None).dt.tz_localize(ZONA_HORARIA)
+    return instantes.dt.tz_convert(ZONA_HORARIA).where(con_offset, naive)
+
+def _ordenar_por_bus_y_ts(codigos, ts_ns):
+    """Índices que ordenan por (bus, ts).
+
+    Si bus y ts caben juntos en un int64 (el caso normal en un lote) se ordena
+    una sola clave con quicksort, ~3x más rápido que lexsort sobre dos claves.
+    """
+    nat = ts_ns == np.iinfo(np.int64).min
+    validos = ts_ns[~nat]
+    if len(validos) == 0:
+        return np.argsort(codigos, kind='stable')
+    relativo = np.where(nat, 0, ts_ns - validos.min())
+    rango = int(relativo.max()) + 1
+    buses = int(codigos.max()) + 2          # +1 por el código -1 de placas vacías
+    if buses > np.iinfo(np.int64).max // rango:
+        return np.lexsort((ts_ns, codigos))
+    return np.argsort((codigos.astype(np.int64) + 1) * rango + relativo)
+
+def _velocidad_implicita(c, t, lat_r, lon_r, cos_lat):
+    """(mismo_bus, km/h) entre filas consecutivas ya ordenadas; haversine con cosenos precalculados."""
+    mismo = c[1:] == c[:-1]
+    dt = np.maximum((t[1:] - t[:-1]) * 1e-9, DT_MINIMO_S)
+    a = (np.sin((lat_r[1:] - lat_r[:-1]) / 2) ** 2
+         + cos_lat[1:] * cos_lat[:-1] * np.sin((lon_r[1:] - lon_r[:-1]) / 2) ** 2)
+    return mismo, 2 * RADIO_TIERRA_M * np.arcsin(np.sqrt(a)) / dt * 3.6
+
+def validar_arreglos(codigos, lat, lon, velocidad, ts_ns):
+    """Motivos de rechazo por fila (0 = válida), todo vectorizado.
+
+    `codigos` identifica al bus (enteros, p. ej. de pd.factorize) y `ts_ns`
+    son timestamps en nanosegundos (NaT = mínimo int64). Las reglas por bus
+    se evalúan sobre los arreglos ordenados por (bus, ts), donde duplicados y
+    fixes consecutivos quedan contiguos; se reordena una sola vez y los
+    motivos se devuelven en el orden original.
+    """
+    n = len(codigos)
+    orden = _ordenar_por_bus_y_ts(codigos, ts_ns)
+    c, t = codigos[orden], ts_ns[orden]
+    la, lo, v = lat[orden], lon[orden], velocidad[orden]
+
+    m = np.zeros(n, dtype=np.uint16)
+    m[c < 0] |= MOTIVOS['placa_vacia']
+    invalida = ~(np.isfinite(la) & np.isfinite(lo))
+    m[invalida] |= MOTIVOS['coordenada_invalida']
+    with np.errstate(invalid='ignore'):
+        fuera = ~invalida & ((la < LAT_MIN) | (la > LAT_MAX) | (lo < LON_MIN) | (lo > LON_MAX))
+        m[fuera] |= MOTIVOS['fuera_bbox']
+        m[t == np.iinfo(np.int64).min] |= MOTIVOS['timestamp_invalido']
+        m[~((v >= 0) & (v <= VELOCIDAD_MAX_KMH))] |= MOTIVOS['velocidad_invalida']
+
+    # Duplicados (placa, ts): tras ordenar son vecinos. De cada grupo se conserva
+    # la fila de menor índice (la primera recibida), sin depender del orden del sort
+    igual = np.zeros(n, dtype=bool)
+    igual[1:] = (c[1:] == c[:-1]) & (c[1:] >= 0) & (t[1:] == t[:-1])
+    if igual.any():
+        inicios = np.flatnonzero(~igual)
+        primera = np.minimum.reduceat(orden, inicios)[np.cumsum(~igual) - 1]
+        m[orden != primera] |= MOTIVOS['duplicado']
+
+    lat_r, lon_r = np.radians(la), np.radians(lo)
+    cos_lat = np.cos(lat_r)
+
+    # Saltos: velocidad implícita entre fixes válidos consecutivos del mismo bus.
+    # Un pico aislado tiene dos tramos imposibles (entrada y salida): se rechaza
+    # el fix del medio, no sus vecinos. En los extremos de un bus solo hay un
+    # tramo: el último fix cae si su tramo de entrada es imposible y el anterior
+    # no es un pico; el primero, si su tramo de salida es imposible, el siguiente
+    # no es un pico y el tramo que sigue es posible (con dos fixes se descarta
+    # el segundo, p. ej. frente al último aceptado del lote anterior).
+    vivos = np.flatnonzero(m == 0)
+    for _ in range(PASADAS_SALTOS):
+        if len(vivos) < 2:
+            break
+        mismo, kmh = _velocidad_implicita(c[vivos], t[vivos], lat_r[vivos], lon_r[vivos], cos_lat[vivos])
+        imposible = mismo & (kmh > VELOCIDAD_SALTO_MAX_KMH)
+        entra, sale = np.append(False, imposible), np.append(imposible, False)
+        pico = entra & sale
+        ultimo = np.append(~mismo, True) & entra & ~np.append(False, pico[:-1])
+        siguiente_posible = np.append((mismo & ~imposible)[1:], [False, False])
+        primero = np.append(True, ~mismo) & sale & ~np.append(pico[1:], False) & siguiente_posible
+        salto = pico | ultimo | primero
+        if not salto.any():
+            break
+        m[vivos[salto]] |= MOTIVOS['salto_imposible']
+        vivos = vivos[~salto]
+    else:
+        # La última pasada quitó saltos: velocidades sobre los fixes que quedaron
+        if len(vivos) >= 2:
+            mismo, kmh = _velocidad_implicita(c[vivos], t[vivos], lat_r[vivos], lon_r[vivos], cos_lat[vivos])
+
+    # Velocidad 0 reportada mientras el bus se desplaza (sensor trabado)
+    if len(vivos) >= 2:
+        trabado = np.append(False, mismo & (kmh > VELOCIDAD_MOVIMIENTO_KMH)) & (v[vivos] == 0)
+        m[vivos[trabado]] |= MOTIVOS['velocidad_cero_en_movimiento']
+
+    motivos = np.empty(n, dtype=np.uint16)
+    motivos[orden] = m
+    return motivos
+
+class ValidadorCalidad:
+    """Valida lotes sucesivos recordando el último fix aceptado de cada bus.
+
+    Así un salto o un duplicado en el borde entre dos lotes se detecta igual
+    que dentro de un lote.
+    """
+
+    def __init__(self):
+        self.ultimos = pd.DataFrame(columns=['placa', 'latitud', 'longitud', 'velocidad_kmh', 'ts'])
+        self.estadisticas = {'validadas': 0, 'rechazadas': 0, 'segundos': 0.0}
+
+    def validar(self, df):
+        """Devuelve (aceptadas, rechazadas); las rechazadas llevan la columna `motivo`."""
+        t0 = time.perf_counter()
+        ts = normalizar_ts(df['ts'])
+        contexto = len(self.ultimos)
+        placas = pd.concat([self.ultimos['placa'], df['placa']], ignore_index=True)
+        codigos, unicas = pd.factorize(placas)
+        vacias = np.flatnonzero(pd.Index(unicas).astype(str).str.strip() == '')
+        if len(vacias):
+            codigos[np.isin(codigos, vacias)] = -1
+        todas_ts = pd.concat([normalizar_ts(self.ultimos['ts']), ts], ignore_index=True)
+
+        def columna(nombre):
+            return np.concatenate([self.ultimos[nombre].to_numpy(dtype=float),
+                                   pd.to_numeric(df[nombre], errors='coerce').to_numpy(dtype=float)])
+
+        # Los últimos fixes aceptados van primero: un reenvío del mismo (placa, ts)
+        # queda como duplicado y un salto respecto del lote anterior se detecta
+        ts_ns = todas_ts.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        motivos = validar_arreglos(
+            codigos, columna('latitud'), columna('longitud'), columna('velocidad_kmh'), ts_ns,
+        )[contexto:]
+        rechazo = motivos != 0
+        aceptadas = df[~rechazo].assign(ts=ts.set_axis(df.index)[~rechazo])
+        rechazadas = df[rechazo].assign(motivo=motivos[rechazo])
+
+        if len(aceptadas):
+            # Último fix de cada bus: el de ts máximo (entre aceptadas no hay (placa, ts) repetidos)
+            cod, t = codigos[contexto:][~rechazo], ts_ns[contexto:][~rechazo]
+            maximo = np.full(cod.max() + 1, np.iinfo(np.int64).min)
+            np.maximum.at(maximo, cod, t)
+            ultimos = aceptadas[t == maximo[cod]][self.ultimos.columns]
+            self.ultimos = (pd.concat([self.ultimos, ultimos], ignore_index=True)
+                            .sort_values('ts', kind='stable')
+                            .drop_duplicates('placa', keep='last').reset_index(drop=True))
+        self.estadisticas['validadas'] += len(df)
+        self.estadisticas['rechazadas'] += len(rechazadas)
+        self.estadisticas['segundos'] += time.perf_counter() - t0
+        return aceptadas, rechazadas
+
+def crear_tabla_cuarentena():
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_CUARENTENA} (
+            placa TEXT,
+            latitud DOUBLE PRECISION,
+            longitud DOUBLE PRECISION,
+            velocidad_kmh DOUBLE PRECISION,
+            ts TEXT,
+            motivo SMALLINT NOT NULL,
+            motivos TEXT[] NOT NULL,
+            fuente TEXT NOT NULL,
+            recibido TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP
+        );
+        """))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{TABLA_CUARENTENA}_motivo ON {TABLA_CUARENTENA} (motivo);"
+        ))
+
+@instrumentar
+def guardar_cuarentena(rechazadas, fuente, cursor=None):
+    """Copia las filas rechazadas a la tabla de cuarentena con sus motivos.
+
+    `ts` se guarda como texto: un timestamp ilegible también debe poder revisarse.
+    Con `cursor` se escribe dentro de la transacción de quien llama (sin commit).
+    """
+    if rechazadas is None or not len(rechazadas):
+        return 0
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for fila in rechazadas[['placa', 'latitud', 'longitud', 'velocidad_kmh', 'ts', 'motivo']].itertuples(index=False):
+        escritor.writerow([
+            fila.placa, fila.latitud, fila.longitud, fila.velocidad_kmh, fila.ts, int(fila.motivo),
+            '{' + ','.join(nombres_motivos(int(fila.motivo))) + '}', fuente,
+        ])
+    buffer.seek(0)
+    sql_copy = (f"COPY {TABLA_CUARENTENA} (placa, latitud, longitud, velocidad_kmh, ts, motivo, motivos, fuente) "
+                f"FROM STDIN WITH (FORMAT csv)")
+    if cursor is not None:
+        cursor.copy_expert(sql_copy, buffer)
+        return len(rechazadas)
+
+    conexion = engine.raw_connection()
+    try:
+        conexion.cursor().copy_expert(sql_copy, buffer)
+        conexion.commit()
+    except Exception:
+        conexion.rollback()
+        raise
+    finally:
+        conexion.close()
+    return len(rechazadas)
+
+def resumen_motivos(rechazadas):
+    """Conteo de filas por motivo (una fila cuenta en cada motivo que tenga)."""
+    codigos = rechazadas['motivo'].to_numpy()
+    return {nombre: int(np.count_nonzero(codigos & bit)) for nombre, bit in MOTIVOS.items()
+            if np.any(codigos & bit)}
+
+def benchmark_validacion(n=5_000_000, buses=2000, semilla=0):
+    """Filas/s de `validar_arreglos` sobre una flota sintética con outliers inyectados."""
+    rng = np.random.default_rng(semilla)
+    codigos = rng.integers(0, buses, n)
+    ts = (np.datetime64('2025-07-01T06:00:00', 'ns').astype(np.int64)
+          + np.sort(rng.integers(0, 18 * 3600 * 1000, n)) * 1_000_000)
+    lat = -16.40 + rng.normal(0, 0.01, buses)[codigos] + rng.normal(0, 0.0002, n)
+    lon = -71.53 + rng.normal(0, 0.01, buses)[codigos] + rng.normal(0, 0.0002, n)
+    velocidad = rng.uniform(5, 45, n)
+    malas = rng.choice(n, n // 1000, replace=False)
+    lat[malas[::2]] += 0.5                 # Fuera del área / saltos
+    velocidad[malas[1::2]] = -1
+
+    t0 = time.perf_counter()
+    motivos = validar_arreglos(codigos, lat, lon, velocidad, ts)
+    segundos = time.perf_counter() - t0
+    print(f"⚡ {n:,} filas validadas en {segundos:.2f} s ({n / segundos:,.0f} filas/s), "
+          f"{np.count_nonzero(motivos):,} rechazadas")
+    return n / segundos
+
+if __name__ == "__main__":
+    print("🧹 CALIDAD DE DATOS")
+    print("=" * 50)
+    benchmark_validacion()
+
+    try:
+        crear_tabla_cuarentena()
+        df = pd.read_sql(f"""
+        SELECT motivo, motivos, fuente, COUNT(*) AS filas
+        FROM {TABLA_CUARENTENA}
+        GROUP BY 1, 2, 3 ORDER BY filas DESC;
+        """, engine)
+        print(f"\n📋 Filas en cuarentena ({TABLA_CUARENTENA}):")
+        for _, row in df.iterrows():
+            print(f"   {row['fuente']}: {', '.join(row['motivos'])} → {row['filas']:,}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Está PostgreSQL corriendo?")
+        print("   • ¿Las credenciales son correctas?")
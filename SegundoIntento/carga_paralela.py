@@ -0,0 +1,292 @@
+import argparse
+import csv
+import os
+import queue
+import threading
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from calidad_datos import ValidadorCalidad, crear_tabla_cuarentena, guardar_cuarentena, normalizar_ts
+from gestor_cargas import (BYTES_POR_LOTE, crear_staging, copiar_lote, leer_lotes, preparar_tabla_destino,
+                           publicar_ultima_posicion)
+from instrumentacion import instrumentar, registrar_filas
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+WORKERS = 4
+INTERVALO_CHUNK_DEFECTO_S = 7 * 86400   # chunk_time_interval por defecto de TimescaleDB
+FILAS_POR_COPY = 100_000
+LOTES_EN_COLA = 2                       # Por worker: acota la memoria si la BD va más lenta que la lectura
+MUESTRAS_ORDEN = 64                     # Líneas leídas para decidir si el archivo está ordenado por ts
+
+def intervalo_chunk(tabla):
+    """chunk_time_interval del hypertable en segundos (7 días si no es hypertable)."""
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass('timescaledb_information.dimensions')")).scalar() is None:
+            return INTERVALO_CHUNK_DEFECTO_S
+        segundos = conn.execute(text("""
+        SELECT EXTRACT(EPOCH FROM time_interval)
+        FROM timescaledb_information.dimensions
+        WHERE hypertable_name = :tabla AND column_name = 'ts'
+        """), {'tabla': tabla}).scalar()
+    return float(segundos) if segundos else INTERVALO_CHUNK_DEFECTO_S
+
+def _chunk(valores, intervalo_s):
+    """Chunk de cada ts: TimescaleDB alinea los chunks a múltiplos del intervalo desde el epoch (UTC)."""
+    ts_ns = normalizar_ts(valores).to_numpy('datetime64[ns]').astype(np.int64)
+    return np.floor_divide(ts_ns, int(intervalo_s * 1e9))
+
+def segmentos_por_chunk(archivo, intervalo_s, workers):
+    """Rangos de bytes de un CSV ordenado por ts, cada uno con chunks enteros.
+
+    Busca por bisección el byte donde empieza cada chunk y corta en los
+    inicios de chunk más cercanos a `workers` partes iguales. Así cada worker
+    lee y escribe solo sus chunks aunque cada lote de bytes sea de un único
+    chunk. None si las muestras del archivo no están ordenadas por ts.
+    """
+    tamano = os.path.getsize(archivo)
+    with open(archivo, 'rb') as f:
+        encabezado = next(csv.reader([f.readline().decode('utf-8')]))
+        columna = encabezado.index('timestamp' if 'timestamp' in encabezado else 'ts')
+        datos = f.tell()
+
+        def chunk_en(posicion):
+            """(inicio, chunk) de la primera línea que empieza en `posicion` o después."""
+            f.seek(posicion - 1)
+            f.readline()
+            inicio = f.tell()
+            linea = f.readline()
+            if not linea:
+                return inicio, None
+            return inicio, _chunk([next(csv.reader([linea.decode('utf-8')]))[columna]], intervalo_s)[0]
+
+        muestras = [chunk_en(datos + (tamano - datos) * k // MUESTRAS_ORDEN)[1] for k in range(MUESTRAS_ORDEN)]
+        muestras = [m for m in muestras if m is not None]
+        if not muestras or np.any(np.diff(muestras) < 0):
+            return None
+
+        inicios, posicion, actual = [], datos, muestras[0]
+        while True:
+            bajo, alto = posicion, tamano
+            while bajo < alto:
+                medio = (bajo + alto) // 2
+                chunk = chunk_en(medio)[1]
+                if chunk is None or chunk > actual:
+                    alto = medio
+                else:
+                    bajo = medio + 1
+            posicion, actual = chunk_en(bajo)
+            if actual is None:
+                break
+            inicios.append(posicion)
+
+    objetivos = [datos + (tamano - datos) * k / workers for k in range(1, workers)]
+    cortes = sorted({min(inicios, key=lambda b: abs(b - o)) for o in objetivos}) if inicios else []
+    limites = [datos, *cortes, tamano]
+    return list(zip(limites, limites[1:]))
+
+def claves_particion(df, particion, intervalo_s, workers):
+    """Worker asignado a cada fila de un lote y el criterio usado: (claves, 'chunk' | 'placa').
+
+    Para archivos que no están ordenados por ts (los ordenados se reparten
+    con `segmentos_por_chunk`). 'chunk': cada chunk va siempre al mismo worker
+    y dos conexiones nunca escriben en el mismo chunk. 'placa': hash estable
+    de la placa; reparte parejo aunque el lote sea de un solo chunk, a cambio
+    de compartir chunks entre conexiones. 'auto': 'chunk' si el lote toca al
+    menos un chunk por worker, si no 'placa'.
+    """
+    if particion in ('chunk', 'auto'):
+        chunk = _chunk(df['ts'], intervalo_s)
+        if particion == 'chunk' or len(np.unique(chunk)) >= workers:
+            return chunk % workers, 'chunk'
+    return pd.util.hash_array(df['placa'].to_numpy(object)) % workers, 'placa'
+
+class CargadorParalelo:
+    """Carga un CSV con varias conexiones del pool, una por worker.
+
+    Un hilo lee y valida el archivo por lotes de bytes y reparte las filas en
+    colas por worker (un archivo ordenado por ts, en tramos de chunks
+    enteros); cada worker hace COPY a su staging y upsert (ON CONFLICT
+    (placa, ts) DO NOTHING), así una carga repetida o cortada se puede volver
+    a lanzar sin duplicar filas. Hilos y no procesos: el trabajo
+    pesado (parseo del COPY, PostGIS, índices) ocurre en el servidor y psycopg2
+    suelta el GIL mientras espera.
+    """
+
+    def __init__(self, tabla='bus_locations', workers=WORKERS, particion='auto',
+                 bytes_por_lote=BYTES_POR_LOTE, filas_por_copy=FILAS_POR_COPY):
+        self.tabla = tabla
+        self.workers = workers
+        self.particion = particion
+        self.bytes_por_lote = bytes_por_lote
+        self.filas_por_copy = filas_por_copy
+        self.colas = [queue.Queue(maxsize=LOTES_EN_COLA) for _ in range(workers)]
+        self.estadisticas = [{'filas': 0, 'insertadas': 0, 'copias': 0, 'segundos_bd': 0.0}
+                             for _ in range(workers)]
+        self.error = None
+        self.lotes_por_criterio = {'chunk': 0, 'placa': 0}
+        self.filas = self.rechazadas = 0
+
+    def _worker(self, i, columnas):
+        conexion = None
+        try:
+            conexion = engine.raw_connection()
+            cursor = conexion.cursor()
+            crear_staging(cursor)
+            conexion.commit()
+        except Exception as e:
+            self.error = e
+        try:
+            while True:
+                df = self.colas[i].get()
+                if df is None:
+                    break
+                if self.error is not None:
+                    continue   # Seguir vaciando la cola para no bloquear al lector
+                try:
+                    t0 = time.perf_counter()
+                    for inicio in range(0, len(df), self.filas_por_copy):
+                        parte = df.iloc[inicio:inicio + self.filas_por_copy]
+                        insertadas = copiar_lote(cursor, parte, self.tabla, columnas)
+                        conexion.commit()
+                        publicar_ultima_posicion(parte, self.tabla)
+                        self.estadisticas[i]['insertadas'] += insertadas
+                        self.estadisticas[i]['copias'] += 1
+                    self.estadisticas[i]['filas'] += len(df)
+                    self.estadisticas[i]['segundos_bd'] += time.perf_counter() - t0
+                except Exception as e:
+                    conexion.rollback()
+                    self.error = e
+        finally:
+            if conexion is not None:
+                conexion.close()
+
+    def _validar(self, validador, df, fuente):
+        df['ts'] = df['timestamp'] if 'timestamp' in df else df['ts']
+        aceptadas, rechazadas = validador.validar(df)
+        guardar_cuarentena(rechazadas, fuente)
+        self.filas += len(df)
+        self.rechazadas += len(rechazadas)
+        return aceptadas
+
+    def _repartir(self, df, intervalo_s):
+        claves, criterio = claves_particion(df, self.particion, intervalo_s, self.workers)
+        self.lotes_por_criterio[criterio] += 1
+        orden = np.argsort(claves, kind='stable')
+        limites = np.searchsorted(claves[orden], np.arange(self.workers + 1))
+        for i in range(self.workers):
+            if limites[i + 1] > limites[i]:
+                self.colas[i].put(df.iloc[orden[limites[i]:limites[i + 1]]])
+
+    def _cargar_archivo(self, archivo, intervalo_s, fuente):
+        """Lee, valida y reparte un archivo; se corta en cuanto un worker falla."""
+        segmentos = None
+        if self.particion in ('chunk', 'auto'):
+            segmentos = segmentos_por_chunk(archivo, intervalo_s, self.workers)
+            if self.particion == 'auto' and segmentos is not None and len(segmentos) < self.workers:
+                segmentos = None   # Menos chunks que workers: mejor repartir por placa
+
+        if segmentos is None:
+            validador = ValidadorCalidad()
+            for _, _, df in leer_lotes(archivo, bytes_por_lote=self.bytes_por_lote):
+                if self.error is not None:
+                    return
+                aceptadas = self._validar(validador, df, fuente)
+                if len(aceptadas):
+                    self._repartir(aceptadas, intervalo_s)
+            return
+
+        # Un tramo de chunks por worker, leídos por turnos: todos avanzan a la
+        # vez. Cada tramo tiene su validador (el contexto por bus es temporal)
+        lectores = {i: leer_lotes(archivo, inicio, self.bytes_por_lote, fin)
+                    for i, (inicio, fin) in enumerate(segmentos)}
+        validadores = {i: ValidadorCalidad() for i in lectores}
+        while lectores:
+            for i in list(lectores):
+                if self.error is not None:
+                    return
+                lote = next(lectores[i], None)
+                if lote is None:
+                    del lectores[i]
+                    continue
+                aceptadas = self._validar(validadores[i], lote[2], fuente)
+                self.lotes_por_criterio['chunk'] += 1
+                if len(aceptadas):
+                    self.colas[i].put(aceptadas)
+
+    @instrumentar
+    def cargar(self, archivos, fuente='carga_paralela'):
+        crear_tabla_cuarentena()
+        columnas = preparar_tabla_destino(self.tabla)
+        intervalo_s = intervalo_chunk(self.tabla)
+        hilos = [threading.Thread(target=self._worker, args=(i, columnas), daemon=True)
+                 for i in range(self.workers)]
+        for hilo in hilos:
+            hilo.start()
+
+        t0 = time.perf_counter()
+        self.filas = self.rechazadas = 0
+        try:
+            for archivo in archivos:
+                if self.error is not None:
+                    break
+                self._cargar_archivo(archivo, intervalo_s, fuente)
+        finally:
+            for cola in self.colas:
+                cola.put(None)
+            for hilo in hilos:
+                hilo.join()
+        if self.error is not None:
+            raise self.error
+
+        segundos = time.perf_counter() - t0
+        registrar_filas(self.filas)
+        return self._reporte(self.filas, self.rechazadas, segundos, intervalo_s)
+
+    def _reporte(self, filas, rechazadas, segundos, intervalo_s):
+        insertadas = sum(e['insertadas'] for e in self.estadisticas)
+        criterio = ', '.join(f"{lotes} lotes por " + (f"chunks de {intervalo_s / 3600:g} h" if nombre == 'chunk'
+                                                        else "hash de placa")
+                             for nombre, lotes in self.lotes_por_criterio.items() if lotes)
+        print(f"✅ {filas:,} filas en {segundos:.1f} s → {filas / segundos:,.0f} filas/s "
+              f"({self.workers} conexiones, {criterio})")
+        print(f"   {insertadas:,} nuevas, {filas - insertadas - rechazadas:,} ya existían, "
+              f"{rechazadas:,} en cuarentena")
+        for i, e in enumerate(self.estadisticas):
+            ritmo = e['filas'] / e['segundos_bd'] if e['segundos_bd'] else 0
+            print(f"   Worker {i}: {e['filas']:,} filas en {e['copias']} COPY, "
+                  f"{e['segundos_bd']:.1f} s en BD ({ritmo:,.0f} filas/s)")
+        return {'filas': filas, 'insertadas': insertadas, 'rechazadas': rechazadas,
+                'segundos': segundos, 'filas_por_s': filas / segundos if segundos else 0,
+                'workers': self.estadisticas}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga paralela de CSV de fixes con varias conexiones")
+    parser.add_argument('archivos', nargs='+')
+    parser.add_argument('--tabla', default='bus_locations')
+    parser.add_argument('--workers', type=int, default=WORKERS, help="Conexiones simultáneas (según los núcleos del servidor)")
+    parser.add_argument('--particion', choices=['auto', 'chunk', 'placa'], default='auto',
+                        help="chunk = chunks enteros del hypertable por worker; placa = hash de placa; "
+                             "auto = chunk si el archivo alcanza para un chunk por worker")
+    parser.add_argument('--mb-por-lote', type=int, default=BYTES_POR_LOTE // 1024 ** 2)
+    args = parser.parse_args()
+
+    try:
+        cargador = CargadorParalelo(args.tabla, args.workers, args.particion,
+                                    args.mb_por_lote * 1024 ** 2)
+        cargador.cargar(args.archivos)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Está PostgreSQL corriendo?")
+        print("   • ¿max_connections alcanza para los workers?")
+        print("   • La carga es idempotente: se puede volver a ejecutar tras un corte")
@@ -1,8 +1,7 @@
 import pandas as pd
 from sqlalchemy import create_engine
-import geopandas as gpd
-from shapely.geometry import Point
-from geoalchemy2 import Geometry, WKTElement
+from instrumentacion import instrumentar
+from gestor_cargas import cargar_archivo
 
 db_user = 'postgres'
 db_password = '15243'
@@ -12,39 +11,20 @@ db_name = 'MiPrimeraDB'
 
 db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
 
+@instrumentar
 def cargar_datos_realistas():
-    """Carga los datos realistas a la base de datos."""
+    """Carga los datos realistas a la base de datos.
+
+    La carga pasa por el gestor de cargas: validación, staging y upsert por
+    (placa, ts). Volver a ejecutarla no duplica filas ni borra el historial.
+    """
     print("Cargando datos realistas a la base de datos...")
     
-    print("Cargando datos desde CSV...")
-    df = pd.read_csv('datos_buses_aqp_realistas.csv')
-    df['ts'] = pd.to_datetime(df['timestamp'])
-    print(f"Registros cargados: {len(df)}")
-    
-    print("Convirtiendo a formato geoespacial...")
-    gdf = gpd.GeoDataFrame(
-        df,
-        geometry=gpd.points_from_xy(df.longitud, df.latitud),
-        crs="EPSG:4326"
-    ).rename(columns={'geometry': 'location'})
-    
-    final_gdf = gdf[['placa', 'velocidad_kmh', 'location', 'ts', 'origen', 'destino']].copy()
-    final_gdf['location'] = final_gdf['location'].apply(lambda x: WKTElement(x.wkt, srid=4326))
-    
-    print("Conectando a PostgreSQL...")
     try:
         engine = create_engine(db_connection_str)
         
         tabla_nueva = 'bus_locations_realistas'
-        final_gdf.to_sql(
-            tabla_nueva,
-            con=engine,
-            if_exists='replace',
-            index=False,
-            dtype={'location': Geometry('POINT', srid=4326)}
-        )
-        
-        print(f"Datos cargados exitosamente: {len(final_gdf)} registros en tabla '{tabla_nueva}'.")
+        cargar_archivo('datos_buses_aqp_realistas.csv', tabla_nueva, fuente='cargar_datos_realistas')
         
         verificar_carga(engine, tabla_nueva)
         
@@ -52,7 +32,7 @@ def cargar_datos_realistas():
         print(f"Error: {e}")
 
 def verificar_carga(engine, tabla):
-    """Verifica que los datos se cargaron correctamente."""
+    """Verifica que los datos se cargaron correctamente (sin cache: debe ver lo recién cargado)."""
     print(f"Verificando carga en tabla '{tabla}'")
     
     sql_verificacion = f"""
@@ -0,0 +1,255 @@
+import copy
+import os
+import time
+import numpy as np
+import joblib
+from registro_modelos import (
+    DIRECTORIO_MODELOS, ARCHIVO_SERVIR, ARCHIVO_METADATA, version_produccion, cargar_version,
+    leer_metadata, directorio_version, _escribir_json_atomico, _sha256
+)
+
+TOLERANCIA_MAE_KMH = 0.1      # Cuánto puede empeorar el MAE al quitar árboles
+EPSILON_PREDICCION = 1e-9
+ARCHIVO_NODOS = 'compacto_nodos.npy'
+ARCHIVO_RAICES = 'compacto_raices.npy'
+ARCHIVO_SCALER_COMPACTO = 'compacto_scaler.joblib'
+
+# Un nodo por registro: todo el bosque queda en un solo arreglo contiguo
+DTYPE_NODO = np.dtype([
+    ('feature', np.int32),
+    ('izquierdo', np.int32),
+    ('derecho', np.int32),
+    ('umbral', np.float64),
+    ('valor', np.float64),
+])
+
+class ModeloCompacto:
+    """Bosque de regresión como arreglo plano de nodos con predicción en NumPy.
+
+    Recibe las features ya escaladas, igual que el RandomForest original,
+    así que se usa con el mismo scaler.
+    """
+
+    def __init__(self, nodos, raices, profundidad):
+        self.nodos = nodos
+        self.raices = raices
+        self.profundidad = int(profundidad)
+        self.n_arboles = len(raices)
+
+    def predict(self, X):
+        # sklearn compara en float32 contra umbrales float64; se replica para coincidir
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        feature, izquierdo, derecho = self.nodos['feature'], self.nodos['izquierdo'], self.nodos['derecho']
+        umbral = self.nodos['umbral']
+
+        filas = np.arange(len(X))[:, None]
+        idx = np.broadcast_to(self.raices, (len(X), self.n_arboles)).copy()
+        # Las hojas apuntan a sí mismas, así que basta recorrer `profundidad` niveles
+        for _ in range(self.profundidad):
+            va_izquierda = X[filas, feature[idx]] <= umbral[idx]
+            idx = np.where(va_izquierda, izquierdo[idx], derecho[idx])
+        return self.nodos['valor'][idx].mean(axis=1)
+
+def aplanar_bosque(arboles):
+    """Convierte estimadores de sklearn (DecisionTreeRegressor) en un ModeloCompacto."""
+    partes, raices, desplazamiento, profundidad = [], [], 0, 0
+    for arbol in arboles:
+        t = arbol.tree_
+        n = t.node_count
+        propios = np.arange(n)
+        hoja = t.children_left < 0
+
+        nodos = np.empty(n, dtype=DTYPE_NODO)
+        nodos['feature'] = np.where(hoja, 0, t.feature)
+        nodos['izquierdo'] = np.where(hoja, propios, t.children_left) + desplazamiento
+        nodos['derecho'] = np.where(hoja, propios, t.children_right) + desplazamiento
+        nodos['umbral'] = np.where(hoja, np.inf, t.threshold)
+        nodos['valor'] = t.value[:, 0, 0]
+
+        partes.append(nodos)
+        raices.append(desplazamiento)
+        desplazamiento += n
+        profundidad = max(profundidad, t.max_depth)
+    return ModeloCompacto(np.concatenate(partes), np.array(raices, dtype=np.int32), profundidad)
+
+def podar_arboles(model, X_val, y_val, tolerancia_mae=TOLERANCIA_MAE_KMH):
+    """Menor cantidad de árboles cuyo MAE de validación queda dentro de la tolerancia.
+
+    Los árboles de un RandomForest son intercambiables, así que se evalúan
+    prefijos del bosque con una media acumulada de predicciones por árbol.
+    """
+    X_val = np.asarray(X_val, dtype=np.float32)
+    por_arbol = np.stack([arbol.predict(X_val) for arbol in model.estimators_])
+    medias = np.cumsum(por_arbol, axis=0) / np.arange(1, len(por_arbol) + 1)[:, None]
+    maes = np.abs(medias - np.asarray(y_val)[None, :]).mean(axis=1)
+
+    mae_completo = maes[-1]
+    n_arboles = int(np.argmax(maes <= mae_completo + tolerancia_mae)) + 1
+    print(f"🌲 {n_arboles}/{len(maes)} árboles: MAE {maes[n_arboles - 1]:.3f} km/h "
+          f"(bosque completo {mae_completo:.3f}, tolerancia {tolerancia_mae})")
+    return n_arboles, float(maes[n_arboles - 1]), float(mae_completo)
+
+def verificar_predicciones(model, compacto, X, n_arboles, epsilon=EPSILON_PREDICCION):
+    """El modelo compacto debe dar lo mismo que el bosque podado de sklearn."""
+    X = np.asarray(X, dtype=np.float32)
+    esperado = np.mean([arbol.predict(X) for arbol in model.estimators_[:n_arboles]], axis=0)
+    diferencia = float(np.max(np.abs(compacto.predict(X) - esperado)))
+    if diferencia > epsilon:
+        raise ValueError(f"Predicciones del modelo compacto difieren en {diferencia:.2e} (> {epsilon})")
+    return diferencia
+
+def exportar_compacto(X_val, y_val, version=None, tolerancia_mae=TOLERANCIA_MAE_KMH,
+                      directorio=DIRECTORIO_MODELOS):
+    """Poda, aplana y guarda junto a la versión del registro (por defecto la de producción).
+
+    `X_val` son features sin escalar con el esquema de la versión.
+    """
+    version = version or version_produccion(directorio)
+    model, scaler, _ = cargar_version(version, directorio=directorio)
+
+    X_val = scaler.transform(np.asarray(X_val))
+    n_arboles, mae_podado, mae_completo = podar_arboles(model, X_val, y_val, tolerancia_mae)
+    compacto = aplanar_bosque(model.estimators_[:n_arboles])
+    diferencia = verificar_predicciones(model, compacto, X_val, n_arboles)
+
+    ruta = directorio_version(version, directorio)
+    np.save(os.path.join(ruta, ARCHIVO_NODOS), compacto.nodos)
+    np.save(os.path.join(ruta, ARCHIVO_RAICES), compacto.raices)
+    # El scaler aparte evita deserializar el bosque completo al servir el compacto
+    joblib.dump(scaler, os.path.join(ruta, ARCHIVO_SCALER_COMPACTO))
+
+    metadata = leer_metadata(version, directorio)
+    metadata['compacto'] = {
+        'arboles': n_arboles,
+        'profundidad': compacto.profundidad,
+        'nodos': len(compacto.nodos),
+        'mae_validacion': mae_podado,
+        'mae_validacion_completo': mae_completo,
+        'tolerancia_mae': tolerancia_mae,
+        'diferencia_maxima': diferencia,
+        'sha256': _sha256(os.path.join(ruta, ARCHIVO_NODOS)),
+    }
+    _escribir_json_atomico(os.path.join(ruta, ARCHIVO_METADATA), metadata)
+    print(f"✅ Modelo compacto de {version}: {len(compacto.nodos):,} nodos, "
+          f"diferencia máxima {diferencia:.1e}")
+    return compacto
+
+def cargar_compacto(version, directorio=DIRECTORIO_MODELOS):
+    """Carga los arreglos de nodos con mmap (sin deserializar objetos) y el scaler."""
+    ruta = directorio_version(version, directorio)
+    metadata = leer_metadata(version, directorio)
+    if 'compacto' not in metadata:
+        raise ValueError(f"{version} no tiene modelo compacto (python compactar_modelo.py)")
+    nodos = np.load(os.path.join(ruta, ARCHIVO_NODOS), mmap_mode='r')
+    raices = np.load(os.path.join(ruta, ARCHIVO_RAICES))
+    scaler = joblib.load(os.path.join(ruta, ARCHIVO_SCALER_COMPACTO))
+    return ModeloCompacto(nodos, raices, metadata['compacto']['profundidad']), scaler
+
+def _exportar_onnx(model, n_features):
+    """Convierte con skl2onnx si está instalado; devuelve una función de predicción o None."""
+    try:
+        from skl2onnx import convert_sklearn
+        from skl2onnx.common.data_types import FloatTensorType
+        import onnxruntime as ort
+    except ImportError:
+        return None, 0
+    onx = convert_sklearn(model, initial_types=[('X', FloatTensorType([None, n_features]))])
+    bytes_onnx = onx.SerializeToString()
+    sesion = ort.InferenceSession(bytes_onnx, providers=['CPUExecutionProvider'])
+    nombre = sesion.get_inputs()[0].name
+    return (lambda X: sesion.run(None, {nombre: np.asarray(X, dtype=np.float32)})[0].ravel()), len(bytes_onnx)
+
+def _latencia_ms(funcion, X, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion(X)
+        tiempos.append(time.perf_counter() - t0)
+    return float(np.median(tiempos) * 1000)
+
+def benchmark_compactacion(X, version=None, directorio=DIRECTORIO_MODELOS, filas_lote=10000):
+    """Tamaño, tiempo de carga y latencia (1 fila y lote) antes y después."""
+    version = version or version_produccion(directorio)
+    ruta = directorio_version(version, directorio)
+
+    t0 = time.perf_counter()
+    model, scaler, _ = cargar_version(version, directorio=directorio)
+    carga_original = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    compacto, _ = cargar_compacto(version, directorio)
+    carga_compacto = time.perf_counter() - t0
+
+    X = scaler.transform(np.asarray(X))
+    lote = X[np.arange(filas_lote) % len(X)]
+    una = X[:1]
+
+    # Se compara contra el bosque podado con los mismos árboles que el compacto
+    podado = model.estimators_[:compacto.n_arboles]
+    model_podado = copy.copy(model)
+    model_podado.estimators_ = podado
+    model_podado.n_estimators = len(podado)
+
+    candidatos = {
+        'RandomForest original': (model.predict, os.path.getsize(os.path.join(ruta, ARCHIVO_SERVIR)), carga_original),
+        'RandomForest podado': (model_podado.predict, None, None),
+        'Compacto (NumPy)': (compacto.predict, os.path.getsize(os.path.join(ruta, ARCHIVO_NODOS)), carga_compacto),
+    }
+    predictor_onnx, bytes_onnx = _exportar_onnx(model_podado, X.shape[1])
+    if predictor_onnx is not None:
+        candidatos['ONNX Runtime (podado)'] = (predictor_onnx, bytes_onnx, None)
+    else:
+        print("ℹ️ skl2onnx/onnxruntime no instalados: se omite la variante ONNX")
+
+    referencia = model_podado.predict(lote)
+    print(f"\n⏱️ BENCHMARK COMPACTACIÓN ({version}, {compacto.n_arboles}/{len(model.estimators_)} árboles)")
+    print("-" * 90)
+    print(f"{'Variante':<26}{'Tamaño MB':>10}{'Carga ms':>10}{'1 fila ms':>11}"
+          f"{f'{filas_lote} filas ms':>16}{'Dif. máx':>12}")
+    resultados = {}
+    for nombre, (predecir, tamano, carga) in candidatos.items():
+        fila = {
+            'tamano_mb': tamano / 1e6 if tamano else None,
+            'carga_ms': carga * 1000 if carga is not None else None,
+            'una_fila_ms': _latencia_ms(predecir, una, 50),
+            'lote_ms': _latencia_ms(predecir, lote, 3),
+            'diferencia_maxima': float(np.max(np.abs(predecir(lote) - referencia))),
+        }
+        resultados[nombre] = fila
+        tamano_txt = f"{fila['tamano_mb']:.1f}" if fila['tamano_mb'] is not None else "-"
+        carga_txt = f"{fila['carga_ms']:.0f}" if fila['carga_ms'] is not None else "-"
+        print(f"{nombre:<26}{tamano_txt:>10}{carga_txt:>10}{fila['una_fila_ms']:>11.2f}"
+              f"{fila['lote_ms']:>16.1f}{fila['diferencia_maxima']:>12.1e}")
+    return resultados
+
+if __name__ == "__main__":
+    print("🗜️ COMPACTACIÓN DEL MODELO DE VELOCIDAD")
+    print("=" * 50)
+
+    try:
+        from analisis_predictivo_mejorado import cargar_datos_entrenamiento, mascara_prueba
+
+        version = version_produccion()
+        metadata = leer_metadata(version)
+        feature_columns = metadata['feature_columns']
+        df = cargar_datos_entrenamiento()
+        faltantes = [col for col in feature_columns if col not in df.columns]
+        if faltantes:
+            raise ValueError(f"Los datos no tienen las features del modelo {version}: {', '.join(faltantes)}")
+        # Podar contra filas que el modelo no vio al entrenar
+        if metadata['ventana_entrenamiento'].get('particion_prueba') != 'hash_placa_ts':
+            raise ValueError(f"{version} no registró su partición de prueba: reentrenar con "
+                             "analisis_predictivo_mejorado.py")
+        validacion = df[mascara_prueba(df, metadata['ventana_entrenamiento']['fraccion_prueba'])]
+        muestra = validacion.sample(n=min(len(validacion), 20000), random_state=7)
+        X_val, y_val = muestra[feature_columns].to_numpy(dtype=float), muestra['velocidad_kmh'].to_numpy()
+
+        exportar_compacto(X_val, y_val, version)
+        benchmark_compactacion(X_val, version)
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Hay un modelo en producción? (python registro_modelos.py listar)")
+        print("   • ¿Los datos están cargados en 'bus_locations'?")
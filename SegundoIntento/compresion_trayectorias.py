@@ -0,0 +1,326 @@
+import argparse
+import csv
+import io
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from calidad_datos import normalizar_ts
+from features_espaciales import EPSG_UTM, proyectar_utm
+from instrumentacion import instrumentar, registrar_filas
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+TABLA_ARCHIVO = 'trayectorias_archivo'
+TABLA_ESTADO = 'trayectorias_archivo_estado'
+VISTA_HISTORICO = 'bus_locations_historico'
+
+ANTIGUEDAD_DIAS = 30         # Solo se archivan fixes más viejos que esto
+TOLERANCIA_SED_M = 15.0      # Error sincronizado máximo; del orden del error GPS
+PAUSA_MAXIMA_VIAJE_MIN = 10  # Más tiempo sin fixes = viaje nuevo
+HORAS_POR_LOTE = 24
+
+def crear_tablas_archivo(tabla='bus_locations'):
+    """Tabla de trayectorias (una fila por bus-viaje) y vista que la expande a fixes."""
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_ARCHIVO} (
+            placa TEXT NOT NULL,
+            inicio TIMESTAMPTZ NOT NULL,
+            fin TIMESTAMPTZ NOT NULL,
+            puntos_originales INTEGER NOT NULL,
+            velocidades REAL[] NOT NULL,
+            geom geometry(LineStringM, 4326) NOT NULL,
+            PRIMARY KEY (placa, inicio)
+        );
+        """))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{TABLA_ARCHIVO}_geom ON {TABLA_ARCHIVO} USING gist (geom);"
+        ))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{TABLA_ARCHIVO}_intervalo ON {TABLA_ARCHIVO} (inicio, fin);"
+        ))
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_ESTADO} (
+            tabla_origen TEXT PRIMARY KEY,
+            ultima_ts TIMESTAMPTZ
+        );
+        """))
+        # Los mapas y la matriz OD leen fixes: los vértices archivados vuelven a ser
+        # fixes (M = epoch UTC, el mismo instante que `ts`) y se unen a los crudos
+        conn.execute(text(f"""
+        CREATE OR REPLACE VIEW {VISTA_HISTORICO} AS
+        SELECT placa, velocidad_kmh, location, ts, location_utm
+        FROM {tabla}
+        UNION ALL
+        SELECT
+            t.placa,
+            t.velocidades[d.path[1]] AS velocidad_kmh,
+            ST_Force2D(d.geom) AS location,
+            to_timestamp(ST_M(d.geom)) AS ts,
+            ST_Transform(ST_Force2D(d.geom), {EPSG_UTM}) AS location_utm
+        FROM {TABLA_ARCHIVO} t
+        CROSS JOIN LATERAL ST_DumpPoints(t.geom) d;
+        """))
+
+def simplificar_sed(x, y, t, tolerancia_m=TOLERANCIA_SED_M):
+    """Douglas-Peucker con distancia euclidiana sincronizada (SED).
+
+    A diferencia del DP clásico, cada punto se compara con la posición
+    interpolada *en su mismo instante* sobre el segmento, así un bus detenido
+    o que cambia de velocidad conserva los vértices que fijan su horario.
+    Devuelve los índices de los puntos conservados.
+    """
+    n = len(t)
+    if n <= 2:
+        return np.arange(n)
+    conservar = np.zeros(n, dtype=bool)
+    conservar[[0, -1]] = True
+    pila = [(0, n - 1)]
+    while pila:
+        i, j = pila.pop()
+        if j - i < 2:
+            continue
+        k = np.arange(i + 1, j)
+        dt = t[j] - t[i]
+        fraccion = (t[k] - t[i]) / dt if dt > 0 else np.zeros(len(k))
+        sed = np.hypot(x[k] - (x[i] + (x[j] - x[i]) * fraccion),
+                       y[k] - (y[i] + (y[j] - y[i]) * fraccion))
+        m = int(np.argmax(sed))
+        if sed[m] > tolerancia_m:
+            c = int(k[m])
+            conservar[c] = True
+            pila.extend([(i, c), (c, j)])
+    return np.flatnonzero(conservar)
+
+def separar_viajes(placas, epoch, pausa_s=PAUSA_MAXIMA_VIAJE_MIN * 60):
+    """Límites [inicio, fin) de cada bus-viaje en fixes ordenados por placa y ts."""
+    corte = np.ones(len(placas), dtype=bool)
+    corte[1:] = (placas[1:] != placas[:-1]) | (np.diff(epoch) > pausa_s)
+    inicios = np.flatnonzero(corte)
+    return inicios, np.append(inicios[1:], len(placas))
+
+def comprimir_fixes(df, tolerancia_m=TOLERANCIA_SED_M, pausa_s=PAUSA_MAXIMA_VIAJE_MIN * 60):
+    """Fixes (placa, ts, latitud, longitud, velocidad_kmh) ordenados → una fila por viaje."""
+    placas = df['placa'].to_numpy()
+    epoch = pd.to_datetime(df['ts'], utc=True).to_numpy('datetime64[s]').astype(np.int64)
+    lat, lon = df['latitud'].to_numpy(), df['longitud'].to_numpy()
+    velocidad = df['velocidad_kmh'].to_numpy()
+    x, y = proyectar_utm(lon, lat)
+
+    viajes = []
+    for a, b in zip(*separar_viajes(placas, epoch, pausa_s)):
+        # Un fix suelto no forma línea: se devuelve igual para saber si el viaje sigue abierto
+        idx = a + simplificar_sed(x[a:b], y[a:b], epoch[a:b], tolerancia_m)
+        viajes.append({
+            'placa': placas[a],
+            'inicio': df['ts'].iat[a],
+            'fin': df['ts'].iat[b - 1],
+            'puntos_originales': b - a,
+            'velocidades': '{' + ','.join(f"{v:.1f}" for v in velocidad[idx]) + '}',
+            'geom': 'SRID=4326;LINESTRING M (' + ','.join(
+                f"{lon[i]:.6f} {lat[i]:.6f} {epoch[i]}" for i in idx) + ')',
+            'puntos': len(idx),
+        })
+    return viajes
+
+def _copiar_viajes(conn, viajes):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for v in viajes:
+        escritor.writerow([v['placa'], v['inicio'], v['fin'], v['puntos_originales'],
+                           v['velocidades'], v['geom']])
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    cursor.execute(f"CREATE TEMP TABLE viajes_nuevos (LIKE {TABLA_ARCHIVO}) ON COMMIT DROP;")
+    cursor.copy_expert(
+        "COPY viajes_nuevos (placa, inicio, fin, puntos_originales, velocidades, geom) "
+        "FROM STDIN WITH (FORMAT csv)", buffer
+    )
+
+@instrumentar
+def archivar_trayectorias(tabla='bus_locations', antiguedad_dias=ANTIGUEDAD_DIAS,
+                          tolerancia_m=TOLERANCIA_SED_M, horas_por_lote=HORAS_POR_LOTE,
+                          eliminar_fixes=True):
+    """Comprime los fixes viejos en trayectorias LINESTRING M, por lotes desde la marca de agua.
+
+    Un viaje cuyo último fix está a menos de la pausa máxima del borde del lote
+    puede continuar en el siguiente: se deja crudo y el lote siguiente empieza
+    en su primer fix. Cada lote inserta, borra los fixes archivados y mueve la
+    marca de agua en una sola transacción.
+    """
+    crear_tablas_archivo(tabla)
+    pausa_s = PAUSA_MAXIMA_VIAJE_MIN * 60
+    t0 = time.perf_counter()
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{tabla}_placa_ts ON {tabla} (placa, ts DESC);"
+        ))
+        corte = conn.execute(text(
+            f"SELECT now() - INTERVAL '{int(antiguedad_dias)} days'"
+        )).scalar()
+        desde = conn.execute(
+            text(f"SELECT ultima_ts FROM {TABLA_ESTADO} WHERE tabla_origen = :tabla"), {'tabla': tabla}
+        ).scalar()
+        if desde is None:
+            desde = conn.execute(text(f"SELECT MIN(ts) FROM {tabla}")).scalar()
+    if desde is None or desde >= corte:
+        print("Sin fixes más viejos que la antigüedad configurada.")
+        return 0
+
+    total_fixes = total_vertices = total_viajes = 0
+    lote = pd.Timedelta(hours=horas_por_lote)
+    while desde < corte:
+        hasta = min(pd.Timestamp(desde) + lote, pd.Timestamp(corte))
+        # Con --conservar-fixes los fixes ya archivados siguen en la tabla: se saltan
+        df = pd.read_sql(text(f"""
+        SELECT placa, ts, ST_Y(location) AS latitud, ST_X(location) AS longitud, velocidad_kmh
+        FROM {tabla} b
+        WHERE ts >= :desde AND ts < :hasta
+          AND NOT EXISTS (
+              SELECT 1 FROM {TABLA_ARCHIVO} t
+              WHERE t.placa = b.placa AND b.ts BETWEEN t.inicio AND t.fin
+          )
+        ORDER BY placa, ts;
+        """), engine, params={'desde': desde, 'hasta': hasta})
+
+        viajes = comprimir_fixes(df, tolerancia_m, pausa_s) if len(df) else []
+        borde = hasta - pd.Timedelta(seconds=pausa_s)
+        abiertos = [v for v in viajes if v['fin'] >= borde]
+        siguiente = min((v['inicio'] for v in abiertos), default=hasta)
+        if siguiente <= pd.Timestamp(desde):
+            # Un viaje que ocupa todo el lote se corta en el borde para avanzar
+            abiertos, siguiente = [], hasta
+        ids_abiertos = {id(v) for v in abiertos}
+        cerrados = [v for v in viajes if id(v) not in ids_abiertos and v['puntos_originales'] >= 2]
+
+        with engine.begin() as conn:
+            if cerrados:
+                _copiar_viajes(conn, cerrados)
+                conn.execute(text(f"""
+                INSERT INTO {TABLA_ARCHIVO}
+                SELECT * FROM viajes_nuevos
+                ON CONFLICT (placa, inicio) DO NOTHING;
+                """))
+                if eliminar_fixes:
+                    conn.execute(text(f"""
+                    DELETE FROM {tabla} b
+                    USING viajes_nuevos v
+                    WHERE b.placa = v.placa AND b.ts BETWEEN v.inicio AND v.fin;
+                    """))
+            conn.execute(text(f"""
+            INSERT INTO {TABLA_ESTADO} (tabla_origen, ultima_ts) VALUES (:tabla, :ts)
+            ON CONFLICT (tabla_origen) DO UPDATE SET ultima_ts = EXCLUDED.ultima_ts;
+            """), {'tabla': tabla, 'ts': siguiente.to_pydatetime()})
+
+        if cerrados:
+            fixes = sum(v['puntos_originales'] for v in cerrados)
+            vertices = sum(v['puntos'] for v in cerrados)
+            total_fixes += fixes
+            total_vertices += vertices
+            total_viajes += len(cerrados)
+            print(f"   {pd.Timestamp(desde):%Y-%m-%d %H:%M}: {len(cerrados):,} viajes, "
+                  f"{fixes:,} fixes → {vertices:,} vértices")
+        desde = siguiente
+
+    registrar_filas(total_fixes)
+    if total_fixes:
+        print(f"✅ {total_viajes:,} viajes archivados: {total_fixes:,} fixes → {total_vertices:,} vértices "
+              f"({total_fixes / total_vertices:.1f}x) en {time.perf_counter() - t0:.1f} s")
+    return total_viajes
+
+def posicion_en(placa, instante):
+    """Reconstruye la posición de un bus en un instante desde su trayectoria archivada.
+
+    Un instante sin zona se toma como hora local, igual que en la ingesta.
+    """
+    sql_query = f"""
+    SELECT ST_Y(p) AS latitud, ST_X(p) AS longitud
+    FROM (
+        SELECT ST_GeometryN(ST_LocateAlong(geom, EXTRACT(EPOCH FROM CAST(:instante AS TIMESTAMPTZ))), 1) AS p
+        FROM {TABLA_ARCHIVO}
+        WHERE placa = :placa AND CAST(:instante AS TIMESTAMPTZ) BETWEEN inicio AND fin
+    ) q
+    WHERE p IS NOT NULL;
+    """
+    instante = normalizar_ts([instante])[0].to_pydatetime()
+    with engine.connect() as conn:
+        fila = conn.execute(text(sql_query), {'placa': placa, 'instante': instante}).fetchone()
+    return None if fila is None else (fila.latitud, fila.longitud)
+
+def verificar_reconstruccion(tabla='bus_locations', muestra=1000):
+    """Error (m) de ST_LocateAlong contra los fixes originales, antes de borrarlos."""
+    sql_query = f"""
+    SELECT ST_Distance(
+        ST_Transform(b.location, {EPSG_UTM}),
+        ST_Transform(ST_GeometryN(ST_LocateAlong(t.geom, EXTRACT(EPOCH FROM b.ts)), 1), {EPSG_UTM})
+    ) AS error_m
+    FROM {TABLA_ARCHIVO} t
+    JOIN {tabla} b ON b.placa = t.placa AND b.ts BETWEEN t.inicio AND t.fin
+    LIMIT {muestra};
+    """
+    df = pd.read_sql(sql_query, engine)
+    if len(df):
+        print(f"📏 Error de reconstrucción en {len(df):,} fixes: "
+              f"máx {df['error_m'].max():.1f} m, media {df['error_m'].mean():.2f} m")
+    return df
+
+def estadisticas_almacenamiento(tabla='bus_locations'):
+    """Tamaño en disco de los fixes crudos frente a las trayectorias archivadas."""
+    with engine.connect() as conn:
+        filas = conn.execute(text(f"""
+        SELECT
+            (SELECT COUNT(*) FROM {tabla}) AS fixes_crudos,
+            (SELECT COUNT(*) FROM {TABLA_ARCHIVO}) AS viajes,
+            (SELECT COALESCE(SUM(puntos_originales), 0) FROM {TABLA_ARCHIVO}) AS fixes_archivados,
+            (SELECT COALESCE(SUM(ST_NPoints(geom)), 0) FROM {TABLA_ARCHIVO}) AS vertices,
+            pg_total_relation_size('{TABLA_ARCHIVO}') AS bytes_archivo
+        """)).fetchone()
+        # Los hypertables guardan los datos en chunks: su tamaño real es el de todos ellos
+        es_hypertable = conn.execute(text(
+            "SELECT to_regproc('hypertable_size') IS NOT NULL"
+        )).scalar()
+        bytes_crudos = conn.execute(text(
+            f"SELECT hypertable_size('{tabla}')" if es_hypertable else f"SELECT pg_total_relation_size('{tabla}')"
+        )).scalar() or 0
+
+    bytes_por_fix = bytes_crudos / filas.fixes_crudos if filas.fixes_crudos else 0
+    print(f"📦 Crudos: {filas.fixes_crudos:,} fixes, {bytes_crudos / 1024 ** 2:.1f} MB")
+    print(f"📦 Archivo: {filas.viajes:,} viajes con {filas.vertices:,} vértices "
+          f"(de {filas.fixes_archivados:,} fixes), {filas.bytes_archivo / 1024 ** 2:.1f} MB")
+    if bytes_por_fix and filas.bytes_archivo:
+        print(f"   Ahorro estimado: {filas.fixes_archivados * bytes_por_fix / filas.bytes_archivo:.1f}x")
+    return filas
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archivo de trayectorias comprimidas (LINESTRING M)")
+    parser.add_argument('--tabla', default='bus_locations')
+    parser.add_argument('--antiguedad-dias', type=int, default=ANTIGUEDAD_DIAS)
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_SED_M, help="Error SED máximo en metros")
+    parser.add_argument('--conservar-fixes', action='store_true',
+                        help="No borrar los fixes archivados (para verificar la reconstrucción)")
+    args = parser.parse_args()
+
+    print("🗜️ COMPRESIÓN DE TRAYECTORIAS HISTÓRICAS")
+    print("=" * 50)
+    try:
+        archivar_trayectorias(args.tabla, args.antiguedad_dias, args.tolerancia,
+                              eliminar_fixes=not args.conservar_fixes)
+        if args.conservar_fixes:
+            verificar_reconstruccion(args.tabla)
+        estadisticas_almacenamiento(args.tabla)
+        print(f"\n💡 Mapas y matriz OD sobre todo el historial: usar la vista '{VISTA_HISTORICO}'")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Se creó la columna 'location_utm'? (python features_espaciales.py)")
+        print("   • ¿Los datos están cargados en 'bus_locations'?")
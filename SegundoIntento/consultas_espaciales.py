@@ -0,0 +1,195 @@
+import json
+import time
+import pandas as pd
+from sqlalchemy import create_engine, text
+from features_espaciales import EPSG_UTM
+from puntos_interes import buscar_punto
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+TAMANO_LOTE = 50000
+OBJETIVO_LATENCIA_MS = 200
+
+COLUMNAS = """
+    placa,
+    ts,
+    ST_Y(location) AS latitud,
+    ST_X(location) AS longitud,
+    velocidad_kmh
+"""
+
+# Las condiciones espaciales van sobre columnas indexadas con GiST y el
+# filtro por ts permite a TimescaleDB descartar chunks completos.
+def _sql_radio(tabla):
+    return f"""
+    SELECT {COLUMNAS}
+    FROM {tabla}
+    WHERE ts >= :desde AND ts < :hasta
+      AND ST_DWithin(
+          location_utm,
+          ST_Transform(ST_SetSRID(ST_Point(:lon, :lat), 4326), {EPSG_UTM}),
+          :radio_m
+      )
+    ORDER BY placa, ts
+    """
+
+def _sql_bbox(tabla):
+    return f"""
+    SELECT {COLUMNAS}
+    FROM {tabla}
+    WHERE ts >= :desde AND ts < :hasta
+      AND location && ST_MakeEnvelope(:lon_min, :lat_min, :lon_max, :lat_max, 4326)
+    ORDER BY placa, ts
+    """
+
+def _sql_poligono(tabla):
+    return f"""
+    SELECT {COLUMNAS}
+    FROM {tabla}
+    WHERE ts >= :desde AND ts < :hasta
+      AND ST_Intersects(location, ST_GeomFromText(:wkt, 4326))
+    ORDER BY placa, ts
+    """
+
+def _leer_por_lotes(sql, params, tamano_lote):
+    """Ejecuta con cursor del lado del servidor y entrega DataFrames por lotes."""
+    with engine.connect().execution_options(stream_results=True) as conn:
+        for lote in pd.read_sql(text(sql), conn, params=params, chunksize=tamano_lote):
+            yield lote
+
+def buses_en_radio(lat, lon, radio_m, desde, hasta, tabla='bus_locations', tamano_lote=TAMANO_LOTE):
+    """Fixes a menos de `radio_m` metros de un punto entre `desde` y `hasta`."""
+    params = {'lat': lat, 'lon': lon, 'radio_m': radio_m, 'desde': desde, 'hasta': hasta}
+    return _leer_por_lotes(_sql_radio(tabla), params, tamano_lote)
+
+def buses_en_bbox(lat_min, lon_min, lat_max, lon_max, desde, hasta,
+                  tabla='bus_locations', tamano_lote=TAMANO_LOTE):
+    """Fixes dentro de un rectángulo lat/lon entre `desde` y `hasta`."""
+    params = {'lat_min': lat_min, 'lon_min': lon_min, 'lat_max': lat_max, 'lon_max': lon_max,
+              'desde': desde, 'hasta': hasta}
+    return _leer_por_lotes(_sql_bbox(tabla), params, tamano_lote)
+
+def buses_en_poligono(wkt, desde, hasta, tabla='bus_locations', tamano_lote=TAMANO_LOTE):
+    """Fixes dentro de un polígono (WKT en EPSG:4326) entre `desde` y `hasta`."""
+    params = {'wkt': wkt, 'desde': desde, 'hasta': hasta}
+    return _leer_por_lotes(_sql_poligono(tabla), params, tamano_lote)
+
+def buses_cerca_de_poi(nombre, radio_m, desde, hasta, tabla='bus_locations'):
+    """Resumen por bus de los que pasaron cerca de un punto de interés."""
+    punto = buscar_punto(nombre)
+    sql_query = f"""
+    SELECT
+        placa,
+        MIN(ts) AS primer_paso,
+        MAX(ts) AS ultimo_paso,
+        COUNT(*) AS registros,
+        AVG(velocidad_kmh) AS velocidad_promedio
+    FROM ({_sql_radio(tabla)}) cercanos
+    GROUP BY placa
+    ORDER BY primer_paso
+    """
+    params = {'lat': punto['lat'], 'lon': punto['lon'], 'radio_m': radio_m,
+              'desde': desde, 'hasta': hasta}
+    return pd.read_sql(text(sql_query), engine, params=params)
+
+def _nodos_plan(nodo):
+    yield nodo
+    for hijo in nodo.get('Plans', []):
+        yield from _nodos_plan(hijo)
+
+def explicar_consulta(sql, params):
+    """Ejecuta EXPLAIN ANALYZE y resume tipos de scan, chunks tocados y latencia."""
+    with engine.connect() as conn:
+        plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    raiz = plan[0]
+
+    nodos = list(_nodos_plan(raiz['Plan']))
+    scans = [n for n in nodos if 'Relation Name' in n or 'Index Name' in n]
+    tipos = {n['Node Type'] for n in scans}
+    return {
+        'latencia_ms': raiz['Execution Time'],
+        'filas': raiz['Plan'].get('Actual Rows', 0),
+        'tipos_scan': sorted(tipos),
+        'chunks': len({n['Relation Name'] for n in scans if 'Relation Name' in n}),
+        # Bitmap Heap Scan cuenta como uso de índice (viene de un Bitmap Index Scan)
+        'usa_indice': any('Index' in t for t in tipos) and 'Seq Scan' not in tipos,
+    }
+
+def benchmark_consultas(desde, hasta, tabla='bus_locations', objetivo_ms=OBJETIVO_LATENCIA_MS):
+    """Verifica que las tres consultas usen índices y midan menos que el objetivo."""
+    poi = buscar_punto("Óvalo Miraflores")
+    casos = {
+        'Radio 300 m (Óvalo Miraflores)': (
+            _sql_radio(tabla),
+            {'lat': poi['lat'], 'lon': poi['lon'], 'radio_m': 300, 'desde': desde, 'hasta': hasta}
+        ),
+        'Bounding box centro': (
+            _sql_bbox(tabla),
+            {'lat_min': -16.405, 'lon_min': -71.545, 'lat_max': -16.395, 'lon_max': -71.530,
+             'desde': desde, 'hasta': hasta}
+        ),
+        'Polígono Cercado': (
+            _sql_poligono(tabla),
+            {'wkt': 'POLYGON((-71.545 -16.405, -71.530 -16.405, -71.530 -16.395, '
+                    '-71.545 -16.395, -71.545 -16.405))',
+             'desde': desde, 'hasta': hasta}
+        ),
+    }
+
+    print(f"⏱️ BENCHMARK CONSULTAS ESPACIALES ({desde} → {hasta})")
+    print("-" * 50)
+    with engine.connect() as conn:
+        total = conn.execute(text(f"SELECT COUNT(*) FROM {tabla}")).scalar()
+    print(f"Tabla '{tabla}': {total:,} filas")
+
+    resultados = {}
+    for nombre, (sql, params) in casos.items():
+        t0 = time.perf_counter()
+        filas = sum(len(lote) for lote in _leer_por_lotes(sql, params, TAMANO_LOTE))
+        total_ms = (time.perf_counter() - t0) * 1000
+
+        resumen = explicar_consulta(sql, params)
+        resumen['total_cliente_ms'] = total_ms
+        resultados[nombre] = resumen
+
+        estado = "✅" if resumen['usa_indice'] and resumen['latencia_ms'] <= objetivo_ms else "⚠️"
+        print(f"{estado} {nombre}: {filas:,} filas, {resumen['latencia_ms']:.1f} ms en BD, "
+              f"{total_ms:.1f} ms con transferencia, {resumen['chunks']} chunks, "
+              f"scans: {', '.join(resumen['tipos_scan'])}")
+
+    return resultados
+
+if __name__ == "__main__":
+    print("🔎 CONSULTAS ESPACIALES")
+    print("=" * 50)
+
+    try:
+        with engine.connect() as conn:
+            dia = conn.execute(text("SELECT date_trunc('day', MAX(ts)) FROM bus_locations")).scalar()
+        desde = dia + pd.Timedelta(hours=17)
+        hasta = dia + pd.Timedelta(hours=19)
+
+        resumen = buses_cerca_de_poi("Óvalo Miraflores", 300, desde, hasta)
+        print(f"🚌 Buses a menos de 300 m del Óvalo Miraflores entre 17:00 y 19:00: {len(resumen)}")
+        for _, row in resumen.head(10).iterrows():
+            print(f"   {row['placa']}: {row['primer_paso']} → {row['ultimo_paso']} "
+                  f"({row['registros']} registros, {row['velocidad_promedio']:.1f} km/h)")
+
+        print()
+        benchmark_consultas(desde, hasta)
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Se creó la columna 'location_utm'? (python features_espaciales.py)")
+        print("   • ¿Los datos están cargados en 'bus_locations'?")
@@ -0,0 +1,365 @@
+import time
+import numpy as np
+import pandas as pd
+import shapely
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import create_engine, text
+from features_espaciales import EPSG_UTM, proyectar_utm
+from instrumentacion import instrumentar
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+TABLA_EMPAREJAMIENTO = 'bus_emparejamiento'
+
+# Parámetros del HMM (Newson & Krumm, 2009)
+RADIO_BUSQUEDA_M = 50       # Distancia máxima fix -> calle candidata
+MAX_CANDIDATOS = 5          # Calles candidatas por fix
+SIGMA_GPS_M = 10            # Desviación del ruido GPS
+BETA_TRANSICION_M = 30      # Tolerancia entre distancia en ruta y distancia recta
+TOLERANCIA_RETROCESO_M = 5  # Retroceso permitido sobre la misma calle (jitter)
+FACTOR_DESVIO = 1.4         # Estimación de ruta entre calles no contiguas
+PENALIZACION_DESVIO_M = 50
+
+def cargar_aristas(G):
+    """Convierte las calles del grafo en un GeoDataFrame proyectado con edge_id estable."""
+    import osmnx as ox
+
+    aristas = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True).reset_index()
+    aristas = aristas.sort_values(['u', 'v', 'key']).reset_index(drop=True)
+    aristas['edge_id'] = np.arange(len(aristas), dtype=np.int64)
+    # OSM puede etiquetar una calle con varios tipos; nos quedamos con el primero
+    aristas['highway'] = aristas['highway'].apply(lambda h: h[0] if isinstance(h, list) else h)
+    aristas = aristas.to_crs(epsg=EPSG_UTM)
+
+    return aristas[['edge_id', 'u', 'v', 'key', 'highway', 'length', 'geometry']]
+
+def preparar_red(aristas):
+    """Descompone las calles en tramos rectos para medir distancias con NumPy.
+
+    Retorna arreglos serializables entre procesos; el STRtree se arma sobre
+    los tramos y solo se usa para el filtro por caja envolvente.
+    """
+    geometrias = np.asarray(aristas.geometry.values, dtype=object)
+    coords, idx_arista = shapely.get_coordinates(geometrias, return_index=True)
+
+    # Un tramo por par de vértices consecutivos de la misma calle
+    mismo = idx_arista[1:] == idx_arista[:-1]
+    x0, y0 = coords[:-1][mismo].T
+    x1, y1 = coords[1:][mismo].T
+    tramo_arista = idx_arista[:-1][mismo]
+    largo_tramo = np.hypot(x1 - x0, y1 - y0)
+
+    # Distancia acumulada desde el inicio de la calle hasta cada tramo
+    acumulado = np.cumsum(largo_tramo)
+    inicio_arista = np.searchsorted(tramo_arista, np.arange(len(geometrias)))
+    base = np.concatenate([[0.0], acumulado])[inicio_arista]
+    inicio_tramo = np.concatenate([[0.0], acumulado[:-1]]) - base[tramo_arista]
+
+    return {
+        'edge_id': aristas['edge_id'].to_numpy(),
+        'u': aristas['u'].to_numpy(),
+        'v': aristas['v'].to_numpy(),
+        'longitud': np.bincount(tramo_arista, weights=largo_tramo, minlength=len(geometrias)),
+        'tramos': np.column_stack([x0, y0, x1, y1]),
+        'tramo_arista': tramo_arista,
+        'tramo_inicio': inicio_tramo,
+        'tramo_largo': largo_tramo,
+    }
+
+def construir_arbol(red):
+    """STRtree de los tramos rectos de todas las calles."""
+    t = red['tramos']
+    return shapely.STRtree(shapely.linestrings(t.reshape(-1, 2, 2)))
+
+def buscar_candidatos(red, arbol, x, y):
+    """Busca hasta MAX_CANDIDATOS calles por fix.
+
+    El STRtree filtra por caja envolvente y la proyección punto-tramo se
+    resuelve en NumPy para todos los pares a la vez. Retorna matrices (n, K)
+    con el índice de arista, distancia, offset y posición proyectada sobre la
+    calle; -1 / inf donde no hay candidato.
+    """
+    n = len(x)
+    r = RADIO_BUSQUEDA_M
+    idx_punto, idx_tramo = arbol.query(shapely.box(x - r, y - r, x + r, y + r))
+
+    # Proyección de cada punto sobre su tramo (parámetro s en [0, 1])
+    x0, y0, x1, y1 = red['tramos'][idx_tramo].T
+    dx, dy = x1 - x0, y1 - y0
+    px, py = x[idx_punto], y[idx_punto]
+    largo2 = dx * dx + dy * dy
+    s = np.clip(((px - x0) * dx + (py - y0) * dy) / np.where(largo2 > 0, largo2, 1), 0, 1)
+    qx, qy = x0 + s * dx, y0 + s * dy
+    distancias = np.hypot(px - qx, py - qy)
+
+    cerca = distancias <= r
+    idx_punto, idx_tramo, distancias = idx_punto[cerca], idx_tramo[cerca], distancias[cerca]
+    qx, qy, s = qx[cerca], qy[cerca], s[cerca]
+    idx_arista = red['tramo_arista'][idx_tramo]
+    offsets = red['tramo_inicio'][idx_tramo] + s * red['tramo_largo'][idx_tramo]
+
+    # Un punto puede caer cerca de varios tramos de la misma calle: quedarse con el más cercano.
+    # Claves numéricas combinadas en vez de lexsort (mucho más rápido en millones de pares)
+    par = idx_punto.astype(np.int64) * len(red['longitud']) + idx_arista
+    orden = np.argsort(par + distancias / (2 * r + 1))
+    primero = np.ones(len(orden), dtype=bool)
+    primero[1:] = par[orden][1:] != par[orden][:-1]
+    orden = orden[primero]
+
+    # Ordenar por (fix, distancia) y quedarse con los K más cercanos de cada fix
+    orden = orden[np.argsort(idx_punto[orden] * (2.0 * r + 1) + distancias[orden], kind='stable')]
+    idx_punto, idx_arista, distancias = idx_punto[orden], idx_arista[orden], distancias[orden]
+    offsets, qx, qy = offsets[orden], qx[orden], qy[orden]
+    inicio_grupo = np.searchsorted(idx_punto, idx_punto, side='left')
+    rango = np.arange(len(idx_punto)) - inicio_grupo
+    mantener = rango < MAX_CANDIDATOS
+    idx_punto, rango = idx_punto[mantener], rango[mantener]
+
+    cand = {
+        'arista': np.full((n, MAX_CANDIDATOS), -1, dtype=np.int64),
+        'distancia': np.full((n, MAX_CANDIDATOS), np.inf),
+        'offset': np.zeros((n, MAX_CANDIDATOS)),
+        'px': np.zeros((n, MAX_CANDIDATOS)),
+        'py': np.zeros((n, MAX_CANDIDATOS)),
+    }
+    cand['arista'][idx_punto, rango] = idx_arista[mantener]
+    cand['distancia'][idx_punto, rango] = distancias[mantener]
+    cand['offset'][idx_punto, rango] = offsets[mantener]
+    cand['px'][idx_punto, rango] = qx[mantener]
+    cand['py'][idx_punto, rango] = qy[mantener]
+    return cand
+
+def _log_transicion(red, c, t, x, y):
+    """Log-probabilidad de transición (B, K, K) entre los pasos t-1 y t.
+
+    La distancia en ruta se aproxima sin Dijkstra: misma calle -> diferencia
+    de offsets, calles contiguas (v == u) -> resto de la primera más offset de
+    la segunda, en otro caso distancia recta con un factor de desvío.
+    """
+    a_prev, a_act = c['arista'][:, t - 1, :, None], c['arista'][:, t, None, :]
+    off_prev, off_act = c['offset'][:, t - 1, :, None], c['offset'][:, t, None, :]
+
+    recta_gps = np.hypot(x[:, t] - x[:, t - 1], y[:, t] - y[:, t - 1])[:, None, None]
+
+    valido_prev = a_prev >= 0
+    valido_act = a_act >= 0
+    a_prev_s = np.where(valido_prev, a_prev, 0)
+    a_act_s = np.where(valido_act, a_act, 0)
+
+    misma = a_prev == a_act
+    contigua = red['v'][a_prev_s] == red['u'][a_act_s]
+    recta_calles = np.hypot(
+        c['px'][:, t, None, :] - c['px'][:, t - 1, :, None],
+        c['py'][:, t, None, :] - c['py'][:, t - 1, :, None],
+    )
+
+    ruta = recta_calles * FACTOR_DESVIO + PENALIZACION_DESVIO_M
+    ruta = np.where(contigua, red['longitud'][a_prev_s] - off_prev + off_act, ruta)
+    avance = off_act - off_prev
+    ruta = np.where(misma & (avance >= -TOLERANCIA_RETROCESO_M), np.maximum(avance, 0), ruta)
+
+    log_t = -np.abs(ruta - recta_gps) / BETA_TRANSICION_M
+    return np.where(valido_prev & valido_act, log_t, -np.inf)
+
+def viterbi_lote(red, cand, x, y, longitudes):
+    """Viterbi vectorizado sobre un lote de trayectorias rellenas a (B, T, K).
+
+    Itera sobre el paso de tiempo, no sobre buses: cada iteración resuelve
+    todas las trayectorias del lote a la vez.
+    """
+    B, T, K = cand['arista'].shape
+    log_e = -0.5 * (cand['distancia'] / SIGMA_GPS_M) ** 2
+
+    delta = log_e[:, 0, :].copy()
+    retroceso = np.zeros((B, T, K), dtype=np.int8)
+
+    for t in range(1, T):
+        activos = longitudes > t
+        puntajes = delta[:, :, None] + _log_transicion(red, cand, t, x, y)
+        mejor_prev = np.argmax(puntajes, axis=1)
+        nuevo = np.take_along_axis(puntajes, mejor_prev[:, None, :], axis=1)[:, 0, :] + log_e[:, t, :]
+
+        # Sin transición posible: la trayectoria se corta y se reinicia en t
+        corte = ~np.isfinite(nuevo).any(axis=1)
+        if corte.any():
+            nuevo[corte] = log_e[corte, t, :]
+            mejor_prev[corte] = np.argmax(delta[corte], axis=1)[:, None]
+
+        nuevo -= np.max(np.where(np.isfinite(nuevo), nuevo, -1e300), axis=1, keepdims=True)
+        retroceso[:, t, :] = mejor_prev
+        delta = np.where(activos[:, None], nuevo, delta)
+
+    # Backtracking desde el último paso válido de cada trayectoria
+    estados = np.zeros((B, T), dtype=np.int64)
+    filas = np.arange(B)
+    ultimo = longitudes - 1
+    estados[filas, ultimo] = np.argmax(delta, axis=1)
+    for t in range(T - 1, 0, -1):
+        activos = ultimo >= t
+        previo = retroceso[filas, t, estados[:, t]]
+        estados[:, t - 1] = np.where(activos, previo, estados[:, t - 1])
+
+    return estados
+
+def emparejar_trayectorias(red, x, y, inicios, arbol=None):
+    """Empareja fixes proyectados (ordenados por placa, ts) con calles del grafo.
+
+    `inicios` contiene el índice del primer fix de cada trayectoria más el
+    total al final (estilo CSR). Retorna arreglos por fix: índice de arista
+    (-1 si no hay calle cercana), offset y distancia en metros.
+    """
+    if arbol is None:
+        arbol = construir_arbol(red)
+
+    n = len(x)
+    cand = buscar_candidatos(red, arbol, x, y)
+    emparejable = cand['arista'][:, 0] >= 0
+
+    # Solo los fixes con alguna calle cercana entran al HMM
+    traj_de_fix = np.repeat(np.arange(len(inicios) - 1), np.diff(inicios))
+    sel = np.flatnonzero(emparejable)
+    traj_sel = traj_de_fix[sel]
+    longitudes = np.bincount(traj_sel, minlength=len(inicios) - 1)
+    con_datos = longitudes > 0
+
+    arista = np.full(n, -1, dtype=np.int64)
+    offset = np.full(n, np.nan)
+    distancia = np.full(n, np.nan)
+    if len(sel) == 0:
+        return arista, offset, distancia
+
+    # Rellenar a (B, T, K) para resolver todas las trayectorias a la vez
+    _, traj_compacta = np.unique(traj_sel, return_inverse=True)
+    longitudes = longitudes[con_datos]
+    B, T = len(longitudes), longitudes.max()
+    inicio_compacto = np.concatenate([[0], np.cumsum(longitudes)[:-1]])
+    posicion = np.arange(len(sel)) - inicio_compacto[traj_compacta]
+
+    lote = {}
+    for clave, valores in cand.items():
+        relleno = -1 if clave == 'arista' else (np.inf if clave == 'distancia' else 0.0)
+        matriz = np.full((B, T, MAX_CANDIDATOS), relleno, dtype=valores.dtype)
+        matriz[traj_compacta, posicion] = valores[sel]
+        lote[clave] = matriz
+    x_lote = np.zeros((B, T))
+    y_lote = np.zeros((B, T))
+    x_lote[traj_compacta, posicion] = x[sel]
+    y_lote[traj_compacta, posicion] = y[sel]
+
+    estados = viterbi_lote(red, lote, x_lote, y_lote, longitudes)
+    k = estados[traj_compacta, posicion]
+
+    arista[sel] = cand['arista'][sel, k]
+    offset[sel] = cand['offset'][sel, k]
+    distancia[sel] = cand['distancia'][sel, k]
+    return arista, offset, distancia
+
+# Estado por proceso para no reconstruir el STRtree en cada lote
+_red_proceso = None
+_arbol_proceso = None
+
+def _inicializar_proceso(red):
+    global _red_proceso, _arbol_proceso
+    _red_proceso = red
+    _arbol_proceso = construir_arbol(red)
+
+def _emparejar_lote(args):
+    x, y, inicios = args
+    return emparejar_trayectorias(_red_proceso, x, y, inicios, _arbol_proceso)
+
+def emparejar_en_paralelo(red, x, y, inicios, procesos=None, buses_por_lote=200):
+    """Reparte las trayectorias en lotes de buses y los empareja en varios procesos."""
+    cortes = list(range(0, len(inicios) - 1, buses_por_lote)) + [len(inicios) - 1]
+    lotes = []
+    for a, b in zip(cortes[:-1], cortes[1:]):
+        i0, i1 = inicios[a], inicios[b]
+        lotes.append((x[i0:i1], y[i0:i1], inicios[a:b + 1] - i0))
+
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_proceso,
+                             initargs=(red,)) as ejecutor:
+        resultados = list(ejecutor.map(_emparejar_lote, lotes))
+
+    return tuple(np.concatenate(partes) for partes in zip(*resultados))
+
+def cargar_trayectorias(tabla='bus_locations'):
+    """Lee los fixes ordenados por (placa, ts), usando el índice de ese orden."""
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{tabla}_placa_ts ON {tabla} (placa, ts DESC);"
+        ))
+
+    sql_query = f"""
+    SELECT
+        placa,
+        ts,
+        ST_X(location) AS longitud,
+        ST_Y(location) AS latitud
+    FROM {tabla}
+    ORDER BY placa, ts;
+    """
+    return pd.read_sql(sql_query, engine)
+
+@instrumentar
+def emparejar_tabla(G, tabla='bus_locations', procesos=None):
+    """Empareja todas las trayectorias de la tabla y guarda edge_id y offset por fix."""
+    print("🛣️ EMPAREJAMIENTO DE FIXES GPS CON CALLES")
+    print("=" * 50)
+
+    aristas = cargar_aristas(G)
+    red = preparar_red(aristas)
+    print(f"Calles en el grafo: {len(aristas):,}")
+
+    df = cargar_trayectorias(tabla)
+    print(f"Fixes cargados: {len(df):,}")
+
+    x, y = proyectar_utm(df['longitud'].to_numpy(), df['latitud'].to_numpy())
+    placas = df['placa'].to_numpy()
+    cambios = np.flatnonzero(placas[1:] != placas[:-1]) + 1
+    inicios = np.concatenate([[0], cambios, [len(df)]])
+
+    t0 = time.perf_counter()
+    idx_arista, offset, distancia = emparejar_en_paralelo(red, x, y, inicios, procesos)
+    duracion = time.perf_counter() - t0
+    print(f"⚡ Emparejados {len(df):,} fixes en {duracion:.2f} s "
+          f"({len(df) / max(duracion, 1e-9):,.0f} fixes/s)")
+
+    valido = idx_arista >= 0
+    resultado = pd.DataFrame({
+        'placa': placas,
+        'ts': df['ts'],
+        'edge_id': np.where(valido, red['edge_id'][np.maximum(idx_arista, 0)], -1),
+        'offset_m': offset,
+        'distancia_m': distancia,
+    })
+    resultado = resultado[valido]
+    print(f"Fixes con calle asignada: {valido.sum():,} ({valido.mean() * 100:.1f}%)")
+
+    resultado.to_sql(TABLA_EMPAREJAMIENTO, con=engine, if_exists='replace',
+                     index=False, chunksize=50_000)
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{TABLA_EMPAREJAMIENTO}_placa_ts "
+            f"ON {TABLA_EMPAREJAMIENTO} (placa, ts);"
+        ))
+    print(f"✅ Resultado guardado en tabla '{TABLA_EMPAREJAMIENTO}'")
+    return resultado
+
+if __name__ == "__main__":
+    from generador_datos_realistas import cargar_red_calles_cacheada
+
+    try:
+        G = cargar_red_calles_cacheada()
+        emparejar_tabla(G)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Está PostgreSQL corriendo?")
+        print("   • ¿Los datos están cargados en 'bus_locations'?")
@@ -0,0 +1,181 @@
+import time
+import numpy as np
+import pandas as pd
+from features_espaciales import proyectar_utm
+from puntos_interes import buscar_punto
+from generador_datos_realistas import (
+    cargar_red_calles_cacheada, encontrar_nodos_cercanos, generar_ruta_realista
+)
+from analisis_predictivo_mejorado import crear_features_para_prediccion_lote
+from registro_modelos import cargar_modelo_produccion
+
+VELOCIDAD_MINIMA_KMH = 3.0   # Evita tiempos infinitos si el modelo predice ~0
+ITERACIONES_ETA = 3          # Pasadas para que la hora de cada tramo sea la de llegada
+INTERVALO_RECALCULO_S = 5.0
+PARADAS_DEMO = ["Plaza de Armas", "Óvalo Miraflores", "Terminal Terrestre"]
+
+def preparar_ruta(G, lat, lon, paradas):
+    """Ruta restante desde una posición pasando por las paradas en orden.
+
+    Se calcula una sola vez por bus; cada tramo entre dos nodos consecutivos
+    queda con su largo y su punto medio para consultar el modelo.
+    """
+    nodos = [encontrar_nodos_cercanos(G, lat, lon)]
+    indice_parada = []
+    for nombre in paradas:
+        punto = buscar_punto(nombre)
+        destino = encontrar_nodos_cercanos(G, punto['lat'], punto['lon'])
+        tramo = generar_ruta_realista(G, nodos[-1], destino)
+        nodos.extend(tramo[1:])
+        indice_parada.append(len(nodos) - 1)
+
+    lat_nodos = np.array([G.nodes[n]['y'] for n in nodos])
+    lon_nodos = np.array([G.nodes[n]['x'] for n in nodos])
+    x, y = proyectar_utm(lon_nodos, lat_nodos)
+
+    return {
+        'nodos': nodos,
+        'x': x,
+        'y': y,
+        'largo_m': np.hypot(np.diff(x), np.diff(y)),
+        'lat_medio': (lat_nodos[:-1] + lat_nodos[1:]) / 2,
+        'lon_medio': (lon_nodos[:-1] + lon_nodos[1:]) / 2,
+        'paradas': list(paradas),
+        'indice_parada': np.array(indice_parada),
+    }
+
+def ubicar_en_ruta(ruta, lat, lon, desde=0):
+    """Índice del nodo de la ruta más cercano a la posición, sin retroceder de `desde`."""
+    x, y = proyectar_utm(lon, lat)
+    d2 = (ruta['x'][desde:] - x) ** 2 + (ruta['y'][desde:] - y) ** 2
+    return desde + int(np.argmin(d2))
+
+def predecir_velocidades(lat, lon, instantes, model, scaler, feature_columns):
+    """Una sola llamada al modelo para todos los tramos, cada uno con su hora futura."""
+    instantes = pd.DatetimeIndex(instantes)
+    X = crear_features_para_prediccion_lote(
+        lat, lon, instantes.hour.to_numpy(), feature_columns,
+        minuto=instantes.minute.to_numpy(),
+        # Mismo criterio que EXTRACT(DOW ...) en PostgreSQL: domingo = 0
+        dia_semana=(instantes.dayofweek.to_numpy() + 1) % 7
+    )
+    return np.maximum(model.predict(scaler.transform(X)), VELOCIDAD_MINIMA_KMH)
+
+def _acumulado_por_bus(valores, inicios):
+    """Suma acumulada que reinicia en cada bus (arreglo concatenado de tramos)."""
+    total = np.cumsum(valores)
+    base = np.concatenate([[0.0], total])[inicios]
+    largos = np.diff(np.append(inicios, len(valores)))
+    return total - np.repeat(base, largos)
+
+def calcular_etas_flota(rutas, posiciones, ahora, model, scaler, feature_columns,
+                        iteraciones=ITERACIONES_ETA):
+    """ETAs de toda la flota a todas sus paradas pendientes.
+
+    `rutas` es {placa: ruta de preparar_ruta} y `posiciones` un DataFrame con
+    placa, latitud, longitud (p. ej. posicion_actual.consultar_flota_actual()).
+    Devuelve una fila por (placa, parada) y el índice actual de cada bus en su ruta.
+    """
+    ahora = pd.Timestamp(ahora)
+    placas, inicios, indices = [], [], {}
+    lat, lon, largo = [], [], []
+    paradas_placa, paradas_nombre, paradas_pos = [], [], []
+    n = 0
+
+    for pos in posiciones.itertuples(index=False):
+        ruta = rutas.get(pos.placa)
+        if ruta is None:
+            continue
+        i = ubicar_en_ruta(ruta, pos.latitud, pos.longitud, ruta.get('indice_actual', 0))
+        indices[pos.placa] = i
+        pendientes = ruta['indice_parada'] > i
+        if not pendientes.any():
+            continue
+
+        placas.append(pos.placa)
+        inicios.append(n)
+        lat.append(ruta['lat_medio'][i:])
+        lon.append(ruta['lon_medio'][i:])
+        largo.append(ruta['largo_m'][i:])
+        for nombre, k in zip(np.array(ruta['paradas'])[pendientes], ruta['indice_parada'][pendientes]):
+            paradas_placa.append(pos.placa)
+            paradas_nombre.append(nombre)
+            # El tramo que termina en el nodo k es el k-1 de la ruta
+            paradas_pos.append(n + k - 1 - i)
+        n += len(ruta['largo_m']) - i
+
+    columnas = ['placa', 'parada', 'eta', 'minutos', 'distancia_m']
+    if n == 0:
+        return pd.DataFrame(columns=columnas), indices
+
+    inicios = np.array(inicios)
+    lat, lon, largo = np.concatenate(lat), np.concatenate(lon), np.concatenate(largo)
+
+    # Punto fijo: la hora de cada tramo depende de cuándo se llega a él
+    inicio_tramo_s = np.zeros(n)
+    for _ in range(iteraciones):
+        instantes = ahora + pd.to_timedelta(inicio_tramo_s, unit='s')
+        velocidad = predecir_velocidades(lat, lon, instantes, model, scaler, feature_columns)
+        duracion_s = largo / (velocidad / 3.6)
+        fin_tramo_s = _acumulado_por_bus(duracion_s, inicios)
+        inicio_tramo_s = fin_tramo_s - duracion_s
+
+    distancia_m = _acumulado_por_bus(largo, inicios)
+    paradas_pos = np.array(paradas_pos, dtype=int)
+    segundos = fin_tramo_s[paradas_pos]
+    return pd.DataFrame({
+        'placa': paradas_placa,
+        'parada': paradas_nombre,
+        'eta': ahora + pd.to_timedelta(segundos, unit='s'),
+        'minutos': segundos / 60,
+        'distancia_m': distancia_m[paradas_pos],
+    }, columns=columnas), indices
+
+def servir_etas(rutas, model, scaler, feature_columns, intervalo_s=INTERVALO_RECALCULO_S, ciclos=None):
+    """Recalcula las ETAs de toda la flota cada `intervalo_s` segundos."""
+    from posicion_actual import consultar_flota_actual
+
+    ciclo = 0
+    while ciclos is None or ciclo < ciclos:
+        t0 = time.perf_counter()
+        posiciones = consultar_flota_actual()
+        etas, indices = calcular_etas_flota(
+            rutas, posiciones, pd.Timestamp.now(), model, scaler, feature_columns
+        )
+        # Los buses no retroceden en su ruta entre un ciclo y el siguiente
+        for placa, i in indices.items():
+            rutas[placa]['indice_actual'] = i
+
+        duracion = time.perf_counter() - t0
+        print(f"⏱️ {len(etas)} ETAs para {len(indices)} buses en {duracion * 1000:.0f} ms")
+        ciclo += 1
+        yield etas
+        time.sleep(max(0.0, intervalo_s - duracion))
+
+if __name__ == "__main__":
+    print("🕒 ETA DE BUSES A PARADAS")
+    print("=" * 50)
+
+    try:
+        from posicion_actual import consultar_flota_actual
+
+        model, scaler, feature_columns = cargar_modelo_produccion()
+        G = cargar_red_calles_cacheada()
+
+        posiciones = consultar_flota_actual()
+        print(f"Preparando rutas para {len(posiciones)} buses...")
+        rutas = {
+            row['placa']: preparar_ruta(G, row['latitud'], row['longitud'], PARADAS_DEMO)
+            for _, row in posiciones.iterrows()
+        }
+
+        for etas in servir_etas(rutas, model, scaler, feature_columns, ciclos=3):
+            for _, row in etas.head(10).iterrows():
+                print(f"   {row['placa']} → {row['parada']}: {row['eta']:%H:%M:%S} "
+                      f"({row['minutos']:.1f} min, {row['distancia_m'] / 1000:.1f} km)")
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Hay un modelo en producción? (python analisis_predictivo_mejorado.py y luego registro_modelos.py promover)")
+        print("   • ¿Existe 'bus_latest'? (python posicion_actual.py)")
@@ -0,0 +1,160 @@
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+# UTM zona 19S (EPSG:32719): metros para toda Arequipa
+EPSG_UTM = 32719
+CENTRO_LAT = -16.3989  # Plaza de Armas
+CENTRO_LON = -71.5367
+
+# --- PROYECCIÓN UTM PRECALCULADA (serie de Krüger, orden 6; error < 1 mm) ---
+_A_WGS84 = 6378137.0
+_F_WGS84 = 1 / 298.257223563
+_K0 = 0.9996
+_FALSO_ESTE = 500000.0
+_FALSO_NORTE = 10000000.0  # Hemisferio sur
+_MERIDIANO_CENTRAL = np.radians(-69.0)  # Zona 19
+
+_n = _F_WGS84 / (2 - _F_WGS84)
+_E = np.sqrt(_F_WGS84 * (2 - _F_WGS84))
+_A_RECT = _A_WGS84 / (1 + _n) * (1 + _n**2 / 4 + _n**4 / 64 + _n**6 / 256)
+_ALFA = np.array([
+    _n / 2 - 2 * _n**2 / 3 + 5 * _n**3 / 16 + 41 * _n**4 / 180 - 127 * _n**5 / 288 + 7891 * _n**6 / 37800,
+    13 * _n**2 / 48 - 3 * _n**3 / 5 + 557 * _n**4 / 1440 + 281 * _n**5 / 630 - 1983433 * _n**6 / 1935360,
+    61 * _n**3 / 240 - 103 * _n**4 / 140 + 15061 * _n**5 / 26880 + 167603 * _n**6 / 181440,
+    49561 * _n**4 / 161280 - 179 * _n**5 / 168 + 6601661 * _n**6 / 7257600,
+    34729 * _n**5 / 80640 - 3418889 * _n**6 / 1995840,
+    212378941 * _n**6 / 319334400,
+])
+_J2 = 2 * np.arange(1, 7)
+
+def proyectar_utm(lon, lat):
+    """Proyecta lon/lat (grados, WGS84) a UTM 19S en metros, vectorizado.
+
+    Coincide con ST_Transform(..., 32719) de PostGIS por debajo del milímetro.
+    """
+    phi = np.radians(np.asarray(lat, dtype=np.float64))
+    lam = np.radians(np.asarray(lon, dtype=np.float64)) - _MERIDIANO_CENTRAL
+
+    sin_phi = np.sin(phi)
+    t = np.sinh(np.arctanh(sin_phi) - _E * np.arctanh(_E * sin_phi))
+    xi_p = np.arctan2(t, np.cos(lam))
+    eta_p = np.arctanh(np.sin(lam) / np.sqrt(1 + t * t))
+
+    xi_j = np.multiply.outer(xi_p, _J2)
+    eta_j = np.multiply.outer(eta_p, _J2)
+    xi = xi_p + np.sum(_ALFA * np.sin(xi_j) * np.cosh(eta_j), axis=-1)
+    eta = eta_p + np.sum(_ALFA * np.cos(xi_j) * np.sinh(eta_j), axis=-1)
+
+    x = _FALSO_ESTE + _K0 * _A_RECT * eta
+    y = _FALSO_NORTE + _K0 * _A_RECT * xi
+    return x, y
+
+CENTRO_X, CENTRO_Y = (float(v) for v in proyectar_utm(CENTRO_LON, CENTRO_LAT))
+
+def distancia_centro_m(lat, lon):
+    """Distancia en metros a la Plaza de Armas, igual a la calculada en SQL."""
+    x, y = proyectar_utm(lon, lat)
+    return np.hypot(x - CENTRO_X, y - CENTRO_Y)
+
+def sql_distancia_centro(columna='location_utm'):
+    """Expresión SQL de distancia al centro en metros sobre la columna proyectada."""
+    return (f"ST_Distance({columna}, ST_Transform(ST_SetSRID("
+            f"ST_Point({CENTRO_LON}, {CENTRO_LAT}), 4326), {EPSG_UTM}))")
+
+def agregar_columna_utm(tabla='bus_locations'):
+    """Agrega `location_utm` (generada desde `location`) con su índice GiST.
+
+    Al ser una columna generada, los loaders existentes no necesitan cambios:
+    PostgreSQL la calcula en cada INSERT/COPY.
+    """
+    print(f"Agregando columna proyectada UTM 19S a '{tabla}'...")
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+        ALTER TABLE {tabla}
+        ADD COLUMN IF NOT EXISTS location_utm geometry(Point, {EPSG_UTM})
+        GENERATED ALWAYS AS (ST_Transform(location, {EPSG_UTM})) STORED;
+        """))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{tabla}_location_utm ON {tabla} USING gist (location_utm);"
+        ))
+        conn.execute(text(f"ANALYZE {tabla};"))
+    print(f"✅ Columna 'location_utm' lista en '{tabla}'")
+
+def verificar_consistencia(tabla='bus_locations', muestra=10000):
+    """Compara la distancia al centro calculada en SQL y en NumPy."""
+    sql_query = f"""
+    SELECT
+        ST_Y(location) AS latitud,
+        ST_X(location) AS longitud,
+        {sql_distancia_centro()} AS distancia_sql
+    FROM {tabla}
+    LIMIT {muestra};
+    """
+    df = pd.read_sql(sql_query, engine)
+    distancia_np = distancia_centro_m(df['latitud'].to_numpy(), df['longitud'].to_numpy())
+    diferencia = np.abs(distancia_np - df['distancia_sql'].to_numpy())
+
+    print(f"📏 Diferencia SQL vs NumPy en {len(df):,} puntos: "
+          f"máx {diferencia.max() * 100:.3f} cm, media {diferencia.mean() * 100:.4f} cm")
+    return diferencia.max()
+
+def benchmark_distancias(tabla='bus_locations', repeticiones=3):
+    """Compara el costo de la distancia al centro por cada camino disponible."""
+    variantes = {
+        'Columna proyectada (location_utm)': sql_distancia_centro(),
+        'Cast a geography al vuelo': (f"ST_Distance(location::geography, "
+                                      f"ST_SetSRID(ST_Point({CENTRO_LON}, {CENTRO_LAT}), 4326)::geography)"),
+        'Transformación UTM al vuelo': sql_distancia_centro(f"ST_Transform(location, {EPSG_UTM})"),
+    }
+
+    print(f"\n⏱️ BENCHMARK DISTANCIA AL CENTRO ({repeticiones} repeticiones)")
+    print("-" * 50)
+    resultados = {}
+    with engine.connect() as conn:
+        total = conn.execute(text(f"SELECT COUNT(*) FROM {tabla}")).scalar()
+        for nombre, expresion in variantes.items():
+            tiempos = []
+            for _ in range(repeticiones):
+                t0 = time.perf_counter()
+                conn.execute(text(f"SELECT SUM({expresion}) FROM {tabla}")).scalar()
+                tiempos.append(time.perf_counter() - t0)
+            resultados[nombre] = min(tiempos)
+            print(f"   {nombre}: {min(tiempos) * 1000:.1f} ms ({total / min(tiempos):,.0f} filas/s)")
+
+        df = pd.read_sql(f"SELECT ST_Y(location) AS lat, ST_X(location) AS lon FROM {tabla}", conn)
+
+    t0 = time.perf_counter()
+    distancia_centro_m(df['lat'].to_numpy(), df['lon'].to_numpy())
+    resultados['NumPy (proyección precalculada)'] = time.perf_counter() - t0
+    print(f"   NumPy (proyección precalculada): {resultados['NumPy (proyección precalculada)'] * 1000:.1f} ms")
+
+    base = resultados['Cast a geography al vuelo']
+    rapido = resultados['Columna proyectada (location_utm)']
+    print(f"🚀 Columna proyectada vs geography: {base / rapido:.1f}x más rápido")
+    return resultados
+
+if __name__ == "__main__":
+    print("📐 FEATURES ESPACIALES EN METROS")
+    print("=" * 50)
+
+    try:
+        agregar_columna_utm()
+        verificar_consistencia()
+        benchmark_distancias()
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Está PostgreSQL corriendo con PostGIS?")
+        print("   • ¿Los datos están cargados en 'bus_locations'?")
@@ -0,0 +1,153 @@
+import time
+import pandas as pd
+from sqlalchemy import create_engine, text
+from features_espaciales import EPSG_UTM, sql_distancia_centro
+from instrumentacion import instrumentar
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+TABLA_FEATURES = 'features_trayectoria'
+UMBRAL_DETENIDO_M = 15  # Desplazamiento menor al jitter GPS = bus detenido
+
+# Features de historia reciente del bus, para análisis: el modelo servido no las usa
+# porque predice tramos futuros de la ruta, donde esa historia todavía no existe
+COLUMNAS_TRAYECTORIA = [
+    'dt_prev_s', 'distancia_prev_m', 'velocidad_prev_kmh', 'aceleracion_prev_ms2',
+    'rumbo_sin', 'rumbo_cos', 'tiempo_detenido_s'
+]
+
+def sql_features_trayectoria(tabla='bus_locations'):
+    """SQL con LAG/LEAD sobre PARTITION BY placa ORDER BY ts.
+
+    Las columnas por fila replican las de `cargar_datos_mejorados` para poder
+    comparar la historia del bus con las features del modelo. La aceleración usa las dos
+    velocidades anteriores, no la actual, para no filtrar el objetivo.
+    """
+    return f"""
+    WITH base AS (
+        SELECT
+            placa,
+            ts,
+            location,
+            velocidad_kmh,
+            LAG(ts) OVER w AS ts_prev,
+            LAG(ts, 2) OVER w AS ts_prev2,
+            LAG(location) OVER w AS location_prev,
+            LAG(velocidad_kmh) OVER w AS velocidad_prev,
+            LAG(velocidad_kmh, 2) OVER w AS velocidad_prev2,
+            LEAD(ts) OVER w AS ts_sig,
+            LEAD(velocidad_kmh) OVER w AS velocidad_sig
+        FROM {tabla}
+        WINDOW w AS (PARTITION BY placa ORDER BY ts)
+    ),
+    deltas AS (
+        SELECT
+            *,
+            EXTRACT(EPOCH FROM ts - ts_prev) AS dt_s,
+            EXTRACT(EPOCH FROM ts_prev - ts_prev2) AS dt_prev_s_anterior,
+            ST_Distance(location::geography, location_prev::geography) AS distancia_m,
+            degrees(ST_Azimuth(location_prev::geography, location::geography)) AS rumbo
+        FROM base
+    ),
+    detenciones AS (
+        SELECT
+            *,
+            -- Cada desplazamiento real abre un nuevo grupo; los fixes quietos heredan el grupo
+            SUM(CASE WHEN distancia_m IS NULL OR distancia_m > {UMBRAL_DETENIDO_M} THEN 1 ELSE 0 END)
+                OVER (PARTITION BY placa ORDER BY ts) AS grupo_detencion
+        FROM deltas
+    )
+    SELECT
+        placa,
+        ts,
+        ST_Y(location) AS latitud,
+        ST_X(location) AS longitud,
+        velocidad_kmh,
+        EXTRACT(HOUR FROM ts) AS hora,
+        EXTRACT(DOW FROM ts) AS dia_semana,
+        EXTRACT(MINUTE FROM ts) AS minuto,
+        {sql_distancia_centro(f'ST_Transform(location, {EPSG_UTM})')} AS distancia_centro,
+        CASE WHEN EXTRACT(DOW FROM ts) IN (0, 6) THEN 1 ELSE 0 END AS es_fin_semana,
+        CASE
+            WHEN EXTRACT(HOUR FROM ts) BETWEEN 7 AND 9 THEN 1
+            WHEN EXTRACT(HOUR FROM ts) BETWEEN 13 AND 14 THEN 1
+            WHEN EXTRACT(HOUR FROM ts) BETWEEN 17 AND 20 THEN 1
+            ELSE 0
+        END AS es_hora_punta,
+        -- Historia reciente del bus
+        COALESCE(dt_s, 0) AS dt_prev_s,
+        COALESCE(distancia_m, 0) AS distancia_prev_m,
+        COALESCE(velocidad_prev, 0) AS velocidad_prev_kmh,
+        COALESCE((velocidad_prev - velocidad_prev2) / 3.6 / NULLIF(dt_prev_s_anterior, 0), 0) AS aceleracion_prev_ms2,
+        COALESCE(sin(radians(rumbo)), 0) AS rumbo_sin,
+        COALESCE(cos(radians(rumbo)), 0) AS rumbo_cos,
+        EXTRACT(EPOCH FROM ts - MIN(ts) OVER (PARTITION BY placa, grupo_detencion)) AS tiempo_detenido_s,
+        -- Información futura: solo para etiquetas, nunca como feature
+        EXTRACT(EPOCH FROM ts_sig - ts) AS dt_siguiente_s,
+        velocidad_sig AS velocidad_siguiente_kmh
+    FROM detenciones
+    """
+
+@instrumentar
+def materializar_features(tabla='bus_locations'):
+    """Crea o refresca la vista materializada de features dentro de la BD."""
+    print("Materializando features de trayectoria en la base de datos...")
+    t0 = time.perf_counter()
+
+    with engine.begin() as conn:
+        # El índice (placa, ts) permite recorrer cada bus en orden sin ordenar la tabla
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{tabla}_placa_ts ON {tabla} (placa, ts DESC);"
+        ))
+        existe = conn.execute(text(f"SELECT to_regclass('{TABLA_FEATURES}')")).scalar()
+
+        if existe is None:
+            conn.execute(text(
+                f"CREATE MATERIALIZED VIEW {TABLA_FEATURES} AS {sql_features_trayectoria(tabla)};"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX idx_{TABLA_FEATURES}_placa_ts ON {TABLA_FEATURES} (placa, ts);"
+            ))
+        else:
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW {TABLA_FEATURES};"))
+
+        total = conn.execute(text(f"SELECT COUNT(*) FROM {TABLA_FEATURES}")).scalar()
+
+    print(f"✅ {total:,} filas en '{TABLA_FEATURES}' ({time.perf_counter() - t0:.1f} s)")
+    return total
+
+def existe_tabla_features(engine_consulta=None):
+    """Indica si la vista materializada ya fue creada."""
+    with (engine_consulta or engine).connect() as conn:
+        return conn.execute(text(f"SELECT to_regclass('{TABLA_FEATURES}')")).scalar() is not None
+
+def leer_features_trayectoria(engine_lectura=None):
+    """Lee la vista de features completa."""
+    return pd.read_sql(f"SELECT * FROM {TABLA_FEATURES};", engine_lectura or engine)
+
+if __name__ == "__main__":
+    print("🧭 FEATURES DE TRAYECTORIA")
+    print("=" * 50)
+
+    try:
+        materializar_features()
+
+        muestra = pd.read_sql(
+            f"SELECT placa, ts, {', '.join(COLUMNAS_TRAYECTORIA)} FROM {TABLA_FEATURES} LIMIT 5;",
+            engine
+        )
+        print(muestra)
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Está PostgreSQL corriendo?")
+        print("   • ¿Los datos están cargados en 'bus_locations'?")
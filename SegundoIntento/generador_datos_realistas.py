@@ -1,16 +1,18 @@
+import os
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import osmnx as ox
 import networkx as nx
 from geopy.distance import geodesic
+from puntos_interes import PUNTOS_INTERES
+from instrumentacion import instrumentar
 
 NUM_BUSES = 15
 PUNTOS_POR_BUS = 400
 FECHA_INICIO = "2025-07-12 06:00:00"
 ARCHIVO_SALIDA = "datos_buses_aqp_realistas.csv"
-
-print("Generador de datos realistas para buses de Arequipa")
+ARCHIVO_RED_CALLES = "red_calles_arequipa.graphml"
 
 def descargar_red_calles_arequipa():
     """Descarga la red de calles de Arequipa desde OpenStreetMap."""
@@ -31,6 +33,17 @@ def descargar_red_calles_arequipa():
         print(f"Red descargada: {len(G.nodes)} nodos, {len(G.edges)} calles")
         return G
 
+def cargar_red_calles_cacheada(archivo=ARCHIVO_RED_CALLES):
+    """Carga la red de calles desde disco, descargándola solo la primera vez."""
+    if os.path.exists(archivo):
+        print(f"Cargando red de calles cacheada: {archivo}")
+        return ox.load_graphml(archivo)
+    
+    G = descargar_red_calles_arequipa()
+    ox.save_graphml(G, archivo)
+    print(f"Red de calles guardada en cache: {archivo}")
+    return G
+
 def encontrar_nodos_cercanos(G, lat, lon):
     """Encuentra el nodo más cercano en la red de calles."""
     return ox.nearest_nodes(G, lon, lat)
@@ -44,6 +57,16 @@ def generar_ruta_realista(G, nodo_inicio, nodo_fin):
         print("No se encontró ruta directa, usando ruta básica...")
         return [nodo_inicio, nodo_fin]
 
+def tipo_calle_arista(G, nodo_a, nodo_b):
+    """Devuelve el tipo de calle (atributo `highway` de OSM) entre dos nodos."""
+    datos = G.get_edge_data(nodo_a, nodo_b)
+    if not datos:
+        return "residential"
+    highway = next(iter(datos.values())).get('highway', "residential")
+    if isinstance(highway, list):
+        highway = highway[0]
+    return highway.replace("_link", "")
+
 def get_velocidad_segun_hora_y_calle(hora, tipo_calle="residential"):
     """Calcula velocidad según hora y tipo de calle."""
     velocidades_base = {
@@ -66,21 +89,13 @@ def get_velocidad_segun_hora_y_calle(hora, tipo_calle="residential"):
     velocidad_final = np.random.uniform(vel_min, vel_max) * factor_congestion
     return max(5, int(velocidad_final))
 
+@instrumentar
 def generar_datos_realistas():
     """Genera datos siguiendo calles reales."""
     
-    G = descargar_red_calles_arequipa()
+    G = cargar_red_calles_cacheada()
     
-    puntos_interes = [
-        {"nombre": "Plaza de Armas", "lat": -16.3989, "lon": -71.5367},
-        {"nombre": "Mall Plaza Cayma", "lat": -16.3795, "lon": -71.5492},
-        {"nombre": "Terminal Terrestre", "lat": -16.4195, "lon": -71.5179},
-        {"nombre": "Óvalo Miraflores", "lat": -16.4113, "lon": -71.5235},
-        {"nombre": "Estadio Melgar", "lat": -16.4150, "lon": -71.5280},
-        {"nombre": "Universidad San Agustín", "lat": -16.4068, "lon": -71.5223},
-        {"nombre": "Mercado San Camilo", "lat": -16.4021, "lon": -71.5341},
-        {"nombre": "Parque Lambramani", "lat": -16.4067, "lon": -71.5381}
-    ]
+    puntos_interes = PUNTOS_INTERES
     
     datos_generados = []
     print(f"Generando datos para {NUM_BUSES} buses...")
@@ -108,13 +123,18 @@ def generar_datos_realistas():
         
         puntos_interpolados = interpolar_ruta(coordenadas_ruta, PUNTOS_POR_BUS)
         
+        # Tipo de calle de cada tramo de la ruta, en el mismo orden que la interpolación
+        tipos_calle = [tipo_calle_arista(G, a, b) for a, b in zip(ruta_nodos[:-1], ruta_nodos[1:])]
+        puntos_por_segmento = max(1, PUNTOS_POR_BUS // max(1, len(coordenadas_ruta) - 1))
+        
         timestamp_actual = datetime.fromisoformat(FECHA_INICIO) + timedelta(minutes=np.random.randint(0, 60))
         
         for j, (lat, lon) in enumerate(puntos_interpolados):
             intervalo_segundos = np.random.randint(30, 60)
             timestamp_actual += timedelta(seconds=intervalo_segundos)
             
-            velocidad = get_velocidad_segun_hora_y_calle(timestamp_actual.hour)
+            tipo_calle = tipos_calle[min(j // puntos_por_segmento, len(tipos_calle) - 1)] if tipos_calle else "residential"
+            velocidad = get_velocidad_segun_hora_y_calle(timestamp_actual.hour, tipo_calle)
             
             datos_generados.append({
                 "placa": placa,
@@ -160,6 +180,8 @@ def interpolar_ruta(coordenadas, num_puntos_deseados):
     return puntos_interpolados[:num_puntos_deseados]
 
 if __name__ == "__main__":
+    print("Generador de datos realistas para buses de Arequipa")
+    
     try:
         print("Iniciando generación de datos realistas...")
         
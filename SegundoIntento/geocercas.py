@@ -0,0 +1,392 @@
+import argparse
+import io
+import time
+import numpy as np
+import pandas as pd
+import shapely
+from sqlalchemy import create_engine, text
+from puntos_interes import PUNTOS_INTERES
+from instrumentacion import instrumentar, registrar_filas
+from calidad_datos import normalizar_ts
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+TABLA_GEOCERCAS = 'geocercas'
+TABLA_EVENTOS = 'eventos_geocerca'
+RADIO_POI_M = 150
+UMBRAL_PERMANENCIA_S = 300     # Un bus 5 min dentro de una geocerca genera un evento de permanencia
+TAMANO_LOTE = 500_000
+
+# Mismos cortes que usaba crear_features_adicionales; el orden en que se
+# aplicaban (este/oeste pisan a norte/sur) queda como cajas disjuntas.
+LAT_MIN, LAT_MAX = -17.0, -16.0
+LON_MIN, LON_MAX = -72.0, -71.0
+CORTE_SUR, CORTE_NORTE = -16.41, -16.39
+CORTE_ESTE, CORTE_OESTE = -71.54, -71.53
+ZONAS = {
+    'centro': shapely.box(CORTE_ESTE, CORTE_SUR, CORTE_OESTE, CORTE_NORTE),
+    'norte': shapely.box(CORTE_ESTE, CORTE_NORTE, CORTE_OESTE, LAT_MAX),
+    'sur': shapely.box(CORTE_ESTE, LAT_MIN, CORTE_OESTE, CORTE_SUR),
+    'este': shapely.box(LON_MIN, LAT_MIN, CORTE_ESTE, LAT_MAX),
+    'oeste': shapely.box(CORTE_OESTE, LAT_MIN, LON_MAX, LAT_MAX),
+}
+
+TIPOS_EVENTO = np.array(['entrada', 'salida', 'permanencia'], dtype=object)
+
+def circulo_lonlat(lat, lon, radio_m, lados=32):
+    """Círculo de `radio_m` metros alrededor de (lat, lon) como polígono en grados."""
+    angulos = np.linspace(0, 2 * np.pi, lados, endpoint=False)
+    dlat = radio_m / 111_320
+    dlon = radio_m / (111_320 * np.cos(np.radians(lat)))
+    return shapely.polygons(np.column_stack([lon + dlon * np.cos(angulos), lat + dlat * np.sin(angulos)]))
+
+def geocercas_por_defecto(radio_poi_m=RADIO_POI_M):
+    """Zonas de la ciudad y un círculo por punto de interés."""
+    filas = [{'nombre': nombre, 'tipo': 'zona', 'geom': geom} for nombre, geom in ZONAS.items()]
+    filas += [{'nombre': poi['nombre'], 'tipo': 'poi', 'geom': circulo_lonlat(poi['lat'], poi['lon'], radio_poi_m)}
+              for poi in PUNTOS_INTERES]
+    return pd.DataFrame(filas)
+
+def clasificar_zona(lat, lon):
+    """Zona de cada fix según los polígonos de `ZONAS` ('centro' fuera de todos)."""
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    zona = np.full(lat.shape, 'centro', dtype=object)
+    for nombre, geom in ZONAS.items():
+        zona[shapely.contains_xy(geom, lon, lat)] = nombre
+    return zona
+
+class Geocercas:
+    """Polígonos preparados con su caja envolvente para evaluar lotes de fixes.
+
+    Cada geocerca primero filtra por caja con NumPy y solo los candidatos pasan
+    por `shapely.contains_xy` (GEOS con geometría preparada). Un STRtree sobre
+    las geocercas decide cuáles mirar cuando el lote cubre un área chica.
+    """
+
+    def __init__(self, tabla):
+        self.nombres = tabla['nombre'].to_numpy(object)
+        self.tipos = tabla['tipo'].to_numpy(object)
+        self.geometrias = np.asarray(tabla['geom'].to_numpy(), dtype=object)
+        shapely.prepare(self.geometrias)
+        self.cajas = shapely.bounds(self.geometrias)
+        self.arbol = shapely.STRtree(self.geometrias)
+
+    def __len__(self):
+        return len(self.nombres)
+
+    def pertenencia(self, lon, lat):
+        """Matriz booleana (fixes × geocercas): el fix i está dentro de la geocerca j."""
+        dentro = np.zeros((len(lon), len(self)), dtype=bool)
+        if len(lon) == 0:
+            return dentro
+        extension = shapely.box(lon.min(), lat.min(), lon.max(), lat.max())
+        for j in self.arbol.query(extension):
+            xmin, ymin, xmax, ymax = self.cajas[j]
+            candidatos = np.flatnonzero((lon >= xmin) & (lon <= xmax) & (lat >= ymin) & (lat <= ymax))
+            dentro[candidatos, j] = shapely.contains_xy(self.geometrias[j], lon[candidatos], lat[candidatos])
+        return dentro
+
+class MotorGeocercas:
+    """Detecta entradas, salidas y permanencias por bus sobre lotes de fixes.
+
+    El estado por (bus, geocerca) se guarda entre lotes en arreglos: si está
+    dentro, desde cuándo y si ya se emitió la permanencia de esa visita. Los
+    lotes deben llegar en orden de tiempo por bus; un fix más viejo que el
+    último visto de su bus se descarta.
+    """
+
+    def __init__(self, geocercas=None, umbral_permanencia_s=UMBRAL_PERMANENCIA_S):
+        self.geocercas = geocercas if geocercas is not None else Geocercas(geocercas_por_defecto())
+        self.umbral_s = umbral_permanencia_s
+        g = len(self.geocercas)
+        self.placas = pd.Index([], dtype=object)
+        self.dentro = np.zeros((0, g), dtype=bool)
+        self.t_entrada = np.zeros((0, g), dtype=np.int64)
+        self.permanencia = np.zeros((0, g), dtype=bool)
+        self.ultimo_ts = np.zeros(0, dtype=np.int64)
+        self.fixes = 0
+        self.eventos = 0
+
+    def _codigos(self, placas):
+        unicas, inversa = np.unique(np.asarray(placas, dtype=object), return_inverse=True)
+        codigos = self.placas.get_indexer(unicas)
+        nuevas = codigos < 0
+        if nuevas.any():
+            g = len(self.geocercas)
+            n = int(nuevas.sum())
+            codigos[nuevas] = np.arange(len(self.placas), len(self.placas) + n)
+            self.placas = self.placas.append(pd.Index(unicas[nuevas], dtype=object))
+            self.dentro = np.vstack([self.dentro, np.zeros((n, g), dtype=bool)])
+            self.t_entrada = np.vstack([self.t_entrada, np.zeros((n, g), dtype=np.int64)])
+            self.permanencia = np.vstack([self.permanencia, np.zeros((n, g), dtype=bool)])
+            self.ultimo_ts = np.concatenate([self.ultimo_ts, np.full(n, np.iinfo(np.int64).min)])
+        return codigos[inversa]
+
+    def procesar_arreglos(self, placas, lat, lon, ts_s):
+        """Evalúa un lote y devuelve sus eventos como DataFrame.
+
+        `ts_s` son segundos epoch (int64). Todo es vectorizado: la única
+        dimensión en Python es el bucle sobre las geocercas que tocan el lote.
+        """
+        bus = self._codigos(placas)
+        ts_s = np.asarray(ts_s, dtype=np.int64)
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+
+        # Orden (bus, ts) con una sola clave y descarte de fixes fuera de orden
+        base = ts_s.min() if len(ts_s) else 0
+        rango = int(ts_s.max() - base) + 1 if len(ts_s) else 1
+        orden = np.argsort(bus.astype(np.int64) * rango + (ts_s - base), kind='stable')
+        bus, lat, lon, ts_s = bus[orden], lat[orden], lon[orden], ts_s[orden]
+        vigentes = ts_s > self.ultimo_ts[bus]
+        if not vigentes.all():
+            bus, lat, lon, ts_s = bus[vigentes], lat[vigentes], lon[vigentes], ts_s[vigentes]
+        n = len(bus)
+        self.fixes += n
+        if n == 0:
+            return self._eventos_vacios()
+
+        dentro = self.geocercas.pertenencia(lon, lat)
+        inicio = np.ones(n, dtype=bool)
+        inicio[1:] = bus[1:] != bus[:-1]
+        fin = np.ones(n, dtype=bool)
+        fin[:-1] = inicio[1:]
+        fila_inicio = np.flatnonzero(inicio)
+        segmento = np.cumsum(inicio) - 1
+        bus_segmento = bus[fila_inicio]
+
+        # Estado previo: la fila anterior del mismo bus o lo que quedó del lote anterior
+        previo = np.empty_like(dentro)
+        previo[1:] = dentro[:-1]
+        previo[fila_inicio] = self.dentro[bus_segmento]
+        entrada = dentro & ~previo
+        salida = ~dentro & previo
+
+        # Hora de entrada de la visita en curso: la última entrada del bus en el
+        # lote (acumulando el índice de fila) o la que venía del lote anterior
+        columnas = np.arange(dentro.shape[1])
+        marca = entrada | inicio[:, None]
+        idx = np.where(marca, np.arange(n)[:, None], 0)
+        np.maximum.accumulate(idx, axis=0, out=idx)
+        t_entrada = np.where(entrada[idx, columnas], ts_s[idx],
+                             self.t_entrada[bus_segmento][segmento[idx], columnas])
+
+        # Permanencia: primera fila de la visita que supera el umbral
+        supera = dentro & (ts_s[:, None] - t_entrada >= self.umbral_s)
+        supera_previo = np.empty_like(supera)
+        supera_previo[1:] = supera[:-1]
+        supera_previo[fila_inicio] = self.permanencia[bus_segmento] & self.dentro[bus_segmento]
+        supera_previo &= ~entrada
+        permanencia = supera & ~supera_previo
+
+        # Estado para el próximo lote
+        fila_fin = np.flatnonzero(fin)
+        bus_fin = bus[fila_fin]
+        self.dentro[bus_fin] = dentro[fila_fin]
+        self.t_entrada[bus_fin] = t_entrada[fila_fin]
+        self.permanencia[bus_fin] = supera[fila_fin]
+        self.ultimo_ts[bus_fin] = ts_s[fila_fin]
+
+        partes = []
+        for codigo, matriz in enumerate((entrada, salida, permanencia)):
+            fila, geocerca = np.nonzero(matriz)
+            partes.append((np.full(len(fila), codigo, dtype=np.int8), fila, geocerca))
+        tipo = np.concatenate([p[0] for p in partes])
+        fila = np.concatenate([p[1] for p in partes])
+        geocerca = np.concatenate([p[2] for p in partes])
+        self.eventos += len(fila)
+        orden_eventos = np.lexsort((tipo, ts_s[fila]))
+        tipo, fila, geocerca = tipo[orden_eventos], fila[orden_eventos], geocerca[orden_eventos]
+        duracion = np.where(tipo == 0, 0, ts_s[fila] - t_entrada[fila, geocerca])
+        return pd.DataFrame({
+            'placa': self.placas.to_numpy()[bus[fila]],
+            'geocerca': self.geocercas.nombres[geocerca],
+            'tipo_geocerca': self.geocercas.tipos[geocerca],
+            'evento': TIPOS_EVENTO[tipo],
+            'ts': pd.to_datetime(ts_s[fila], unit='s', utc=True),
+            'latitud': lat[fila],
+            'longitud': lon[fila],
+            'duracion_s': duracion,
+        })
+
+    def _eventos_vacios(self):
+        return pd.DataFrame(columns=['placa', 'geocerca', 'tipo_geocerca', 'evento', 'ts',
+                                     'latitud', 'longitud', 'duracion_s'])
+
+    def procesar_df(self, df):
+        # Epoch UTC: el historial (timestamptz) y el hook de ingesta dan el mismo instante
+        ts_s = normalizar_ts(df['ts']).dt.tz_convert(None).to_numpy('datetime64[s]').astype(np.int64)
+        return self.procesar_arreglos(df['placa'].to_numpy(), df['latitud'].to_numpy(),
+                                      df['longitud'].to_numpy(), ts_s)
+
+    def procesar_fixes(self, fixes):
+        """Hook de `ServicioIngesta.al_escribir`: evalúa el lote recién escrito y guarda sus eventos."""
+        df = pd.DataFrame(fixes, columns=['placa', 'latitud', 'longitud', 'velocidad_kmh', 'ts'])
+        eventos = self.procesar_df(df)
+        guardar_eventos(eventos)
+        return eventos
+
+def crear_tablas_geocercas():
+    """Tabla de geocercas (GiST) y de eventos; esta última como hypertable si hay TimescaleDB."""
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_GEOCERCAS} (
+            nombre TEXT PRIMARY KEY,
+            tipo TEXT NOT NULL,
+            geom geometry(Polygon, 4326) NOT NULL
+        );
+        """))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{TABLA_GEOCERCAS}_geom ON {TABLA_GEOCERCAS} USING GIST (geom);"
+        ))
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_EVENTOS} (
+            placa TEXT NOT NULL,
+            geocerca TEXT NOT NULL,
+            tipo_geocerca TEXT NOT NULL,
+            evento TEXT NOT NULL,
+            ts TIMESTAMPTZ NOT NULL,
+            latitud DOUBLE PRECISION,
+            longitud DOUBLE PRECISION,
+            duracion_s INTEGER
+        );
+        """))
+        if conn.execute(text("SELECT to_regproc('create_hypertable') IS NOT NULL")).scalar():
+            conn.execute(text(f"SELECT create_hypertable('{TABLA_EVENTOS}', 'ts', if_not_exists => TRUE);"))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{TABLA_EVENTOS}_geocerca_ts ON {TABLA_EVENTOS} (geocerca, ts DESC);"
+        ))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{TABLA_EVENTOS}_placa_ts ON {TABLA_EVENTOS} (placa, ts DESC);"
+        ))
+
+def publicar_geocercas(tabla=None):
+    """Sube (o actualiza) las geocercas a PostGIS para usarlas desde SQL."""
+    tabla = geocercas_por_defecto() if tabla is None else tabla
+    crear_tablas_geocercas()
+    with engine.begin() as conn:
+        for fila in tabla.itertuples():
+            conn.execute(text(f"""
+            INSERT INTO {TABLA_GEOCERCAS} (nombre, tipo, geom)
+            VALUES (:nombre, :tipo, ST_GeomFromText(:wkt, 4326))
+            ON CONFLICT (nombre) DO UPDATE SET tipo = EXCLUDED.tipo, geom = EXCLUDED.geom;
+            """), {'nombre': fila.nombre, 'tipo': fila.tipo, 'wkt': shapely.to_wkt(fila.geom)})
+    print(f"✅ {len(tabla)} geocercas en '{TABLA_GEOCERCAS}'")
+
+def cargar_geocercas():
+    """Geocercas desde PostGIS (para editarlas con QGIS u otra herramienta)."""
+    df = pd.read_sql(f"SELECT nombre, tipo, ST_AsText(geom) AS wkt FROM {TABLA_GEOCERCAS} ORDER BY tipo, nombre",
+                     engine)
+    df['geom'] = shapely.from_wkt(df['wkt'].to_numpy())
+    return Geocercas(df)
+
+def guardar_eventos(eventos):
+    """COPY de los eventos a la tabla de eventos."""
+    if eventos is None or not len(eventos):
+        return 0
+    buffer = io.StringIO()
+    eventos[['placa', 'geocerca', 'tipo_geocerca', 'evento', 'ts', 'latitud', 'longitud', 'duracion_s']].to_csv(
+        buffer, index=False, header=False
+    )
+    buffer.seek(0)
+    conexion = engine.raw_connection()
+    try:
+        conexion.cursor().copy_expert(
+            f"COPY {TABLA_EVENTOS} (placa, geocerca, tipo_geocerca, evento, ts, latitud, longitud, duracion_s) "
+            f"FROM STDIN WITH (FORMAT csv)", buffer
+        )
+        conexion.commit()
+    except Exception:
+        conexion.rollback()
+        raise
+    finally:
+        conexion.close()
+    return len(eventos)
+
+@instrumentar
+def reproducir_historial(desde, hasta, tabla='bus_locations', desde_bd=False, tamano_lote=TAMANO_LOTE):
+    """Recorre los fixes de [desde, hasta) en orden de tiempo y guarda sus eventos.
+
+    Sin offset, `desde` y `hasta` son hora local; el borrado y la lectura usan
+    los mismos instantes, así la ventana reemplazada es la que se recorre.
+    """
+    crear_tablas_geocercas()
+    motor = MotorGeocercas(cargar_geocercas() if desde_bd else None)
+    desde, hasta = (t.to_pydatetime() for t in normalizar_ts([desde, hasta]))
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {TABLA_EVENTOS} WHERE ts >= :desde AND ts < :hasta"),
+                     {'desde': desde, 'hasta': hasta})
+
+    sql = f"""
+    SELECT placa, ST_Y(location) AS latitud, ST_X(location) AS longitud, ts
+    FROM {tabla}
+    WHERE ts >= :desde AND ts < :hasta
+    ORDER BY ts;
+    """
+    t0 = time.perf_counter()
+    with engine.connect().execution_options(stream_results=True) as conn:
+        for lote in pd.read_sql(text(sql), conn, params={'desde': desde, 'hasta': hasta}, chunksize=tamano_lote):
+            guardar_eventos(motor.procesar_df(lote))
+    segundos = time.perf_counter() - t0
+    registrar_filas(motor.fixes)
+    print(f"✅ {motor.fixes:,} fixes → {motor.eventos:,} eventos en {segundos:.1f} s "
+          f"({motor.fixes / max(segundos, 1e-9):,.0f} fixes/s con lectura y escritura)")
+    return motor
+
+def benchmark_geocercas(n=2_000_000, buses=2000, lote=TAMANO_LOTE, semilla=0):
+    """Fixes/s del motor sobre una flota sintética que cruza zonas y POIs."""
+    rng = np.random.default_rng(semilla)
+    por_bus = n // buses
+    placas = np.repeat(np.char.add('V', np.arange(buses).astype(str)).astype(object), por_bus)
+    pasos = rng.normal(0, 0.0004, (2, buses, por_bus)).cumsum(axis=2)
+    lat = (-16.405 + rng.normal(0, 0.01, buses)[:, None] + pasos[0]).ravel()
+    lon = (-71.535 + rng.normal(0, 0.01, buses)[:, None] + pasos[1]).ravel()
+    ts = (1_751_349_600 + np.arange(por_bus) * 30 + rng.integers(0, 30, buses)[:, None]).ravel()
+    # Entregado en orden de tiempo, como llega de la ingesta o de reproducir_historial
+    orden = np.argsort(ts, kind='stable')
+    placas, lat, lon, ts = placas[orden], lat[orden], lon[orden], ts[orden]
+
+    motor = MotorGeocercas()
+    t0 = time.perf_counter()
+    eventos = 0
+    for i in range(0, len(ts), lote):
+        eventos += len(motor.procesar_arreglos(placas[i:i + lote], lat[i:i + lote], lon[i:i + lote], ts[i:i + lote]))
+    segundos = time.perf_counter() - t0
+    print(f"⚡ {len(ts):,} fixes contra {len(motor.geocercas)} geocercas en {segundos:.2f} s "
+          f"({len(ts) / segundos:,.0f} fixes/s), {eventos:,} eventos")
+    return len(ts) / segundos
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Geocercas: eventos de entrada, salida y permanencia")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('publicar', help="Subir zonas y POIs a la tabla de geocercas")
+    p_reproducir = sub.add_parser('reproducir', help="Generar eventos desde el historial")
+    p_reproducir.add_argument('desde')
+    p_reproducir.add_argument('hasta')
+    p_reproducir.add_argument('--tabla', default='bus_locations')
+    p_reproducir.add_argument('--desde-bd', action='store_true', help="Usar las geocercas de PostGIS")
+    p_benchmark = sub.add_parser('benchmark', help="Fixes/s del motor sin BD")
+    p_benchmark.add_argument('--fixes', type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    try:
+        if args.comando == 'publicar':
+            publicar_geocercas()
+        elif args.comando == 'reproducir':
+            reproducir_historial(args.desde, args.hasta, args.tabla, args.desde_bd)
+        else:
+            benchmark_geocercas(args.fixes)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Está PostgreSQL corriendo con PostGIS?")
+        print("   • ¿Se publicaron las geocercas? (python geocercas.py publicar)")
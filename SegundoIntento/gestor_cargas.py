@@ -0,0 +1,337 @@
+import argparse
+import hashlib
+import io
+import os
+import time
+import pandas as pd
+from sqlalchemy import create_engine, text
+from calidad_datos import ValidadorCalidad, crear_tabla_cuarentena, guardar_cuarentena
+from instrumentacion import instrumentar, registrar_filas
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+TABLA_MANIFIESTO = 'cargas_manifiesto'
+TABLA_LOTES = 'cargas_lotes'
+BYTES_POR_LOTE = 64 * 1024 ** 2     # ~1 M filas del CSV de buses por transacción
+BYTES_MUESTRA_HUELLA = 1024 ** 2
+
+# Columnas que puede recibir la tabla destino, en el orden del INSERT
+COLUMNAS_DESTINO = {
+    'placa': 'placa',
+    'velocidad_kmh': 'velocidad_kmh',
+    'location': 'ST_SetSRID(ST_MakePoint(longitud, latitud), 4326)',
+    'ts': 'ts',
+    'origen': 'origen',
+    'destino': 'destino',
+}
+# Staging trae ts con zona; una tabla con `ts` sin zona (bus_locations_realistas)
+# guarda hora local, la de ZONA_HORARIA, sin depender del TimeZone de la sesión
+TS_HORA_LOCAL = "ts AT TIME ZONE INTERVAL '-05:00'"
+
+def huella_archivo(archivo, completa=False):
+    """SHA-256 que identifica el archivo.
+
+    Por defecto se calcula sobre el tamaño y el primer y último MB, para no
+    releer 50 GB en cada reanudación; `completa=True` lee el archivo entero.
+    """
+    h = hashlib.sha256()
+    tamano = os.path.getsize(archivo)
+    h.update(str(tamano).encode())
+    with open(archivo, 'rb') as f:
+        if completa or tamano <= 2 * BYTES_MUESTRA_HUELLA:
+            for bloque in iter(lambda: f.read(BYTES_MUESTRA_HUELLA), b''):
+                h.update(bloque)
+        else:
+            h.update(f.read(BYTES_MUESTRA_HUELLA))
+            f.seek(-BYTES_MUESTRA_HUELLA, os.SEEK_END)
+            h.update(f.read())
+    return h.hexdigest()
+
+def leer_lotes(archivo, desde=None, bytes_por_lote=BYTES_POR_LOTE, hasta=None):
+    """Lee el CSV en lotes de ~`bytes_por_lote` cortados en fin de línea.
+
+    Entrega (byte_inicio, byte_fin, DataFrame); los rangos de bytes son los que
+    se guardan en el manifiesto para reanudar sin volver a leer lo confirmado.
+    `hasta`, si se da, debe ser un inicio de línea.
+    """
+    with open(archivo, 'rb') as f:
+        encabezado = f.readline()
+        f.seek(desde if desde is not None else len(encabezado))
+        while True:
+            inicio = f.tell()
+            datos = f.read(bytes_por_lote if hasta is None else min(bytes_por_lote, hasta - inicio))
+            if not datos:
+                break
+            if not datos.endswith(b'\n'):
+                datos += f.readline()
+            df = pd.read_csv(io.BytesIO(encabezado + datos), dtype={'placa': str})
+            yield inicio, f.tell(), df
+
+def crear_tablas_manifiesto():
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_MANIFIESTO} (
+            huella TEXT NOT NULL,
+            tabla_destino TEXT NOT NULL,
+            archivo TEXT NOT NULL,
+            tamano_bytes BIGINT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'en_curso',
+            filas BIGINT,
+            insertadas BIGINT,
+            rechazadas BIGINT,
+            iniciado TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+            terminado TIMESTAMP,
+            PRIMARY KEY (huella, tabla_destino)
+        );
+        """))
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_LOTES} (
+            huella TEXT NOT NULL,
+            tabla_destino TEXT NOT NULL,
+            lote INTEGER NOT NULL,
+            byte_inicio BIGINT NOT NULL,
+            byte_fin BIGINT NOT NULL,
+            filas INTEGER NOT NULL,
+            insertadas INTEGER NOT NULL,
+            rechazadas INTEGER NOT NULL,
+            confirmado TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+            PRIMARY KEY (huella, tabla_destino, lote)
+        );
+        """))
+
+def preparar_tabla_destino(tabla):
+    """Crea la tabla si no existe y asegura el índice único (placa, ts) del upsert.
+
+    Si la tabla ya tenía duplicados (cargas repetidas con 'append'), se
+    eliminan antes de crear el índice dejando una fila por (placa, ts).
+    Devuelve {columna: expresión sobre staging} para las columnas que tiene.
+    """
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {tabla} (
+            placa TEXT NOT NULL,
+            velocidad_kmh DOUBLE PRECISION,
+            location geometry(Point, 4326),
+            ts TIMESTAMPTZ NOT NULL,
+            origen TEXT,
+            destino TEXT
+        );
+        """))
+        if conn.execute(text(f"SELECT to_regclass('uq_{tabla}_placa_ts')")).scalar() is None:
+            eliminados = conn.execute(text(f"""
+            DELETE FROM {tabla} a
+            USING {tabla} b
+            WHERE a.placa = b.placa AND a.ts = b.ts AND a.ctid > b.ctid;
+            """)).rowcount
+            if eliminados:
+                print(f"🧹 {eliminados:,} filas duplicadas eliminadas de '{tabla}'")
+            # Incluye `ts`, así también es válido en un hypertable de TimescaleDB
+            conn.execute(text(f"CREATE UNIQUE INDEX uq_{tabla}_placa_ts ON {tabla} (placa, ts);"))
+        existentes = dict(conn.execute(text("""
+        SELECT column_name, data_type FROM information_schema.columns WHERE table_name = :tabla
+        """), {'tabla': tabla}).fetchall())
+    columnas = {c: expresion for c, expresion in COLUMNAS_DESTINO.items() if c in existentes}
+    if existentes.get('ts') == 'timestamp without time zone':
+        columnas['ts'] = TS_HORA_LOCAL
+    return columnas
+
+def crear_staging(cursor):
+    """Tabla temporal de la sesión por la que pasa cada lote antes del upsert."""
+    cursor.execute("""
+    CREATE TEMP TABLE IF NOT EXISTS staging_carga (
+        placa TEXT, latitud DOUBLE PRECISION, longitud DOUBLE PRECISION,
+        velocidad_kmh DOUBLE PRECISION, ts TIMESTAMPTZ, origen TEXT, destino TEXT
+    ) ON COMMIT DELETE ROWS;
+    """)
+
+def copiar_lote(cursor, aceptadas, tabla, columnas):
+    """COPY del lote a la tabla de staging y upsert a la tabla destino."""
+    staging = aceptadas.reindex(columns=['placa', 'latitud', 'longitud', 'velocidad_kmh', 'ts', 'origen', 'destino'])
+    buffer = io.StringIO()
+    staging.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert("COPY staging_carga FROM STDIN WITH (FORMAT csv)", buffer)
+    cursor.execute(f"""
+    INSERT INTO {tabla} ({', '.join(columnas)})
+    SELECT {', '.join(columnas.values())}
+    FROM staging_carga
+    ON CONFLICT (placa, ts) DO NOTHING;
+    """)
+    return cursor.rowcount
+
+def publicar_ultima_posicion(aceptadas, tabla):
+    """Lleva `bus_latest` al día con un lote ya confirmado en bus_locations.
+
+    Va en una transacción corta aparte: dentro de la del lote, las filas de
+    bus_latest quedarían bloqueadas hasta su commit y frenarían a los demás
+    escritores. Si falla, el lote ya está escrito: solo se avisa
+    (`python posicion_actual.py` la reconstruye desde el historial).
+    """
+    from posicion_actual import TABLA_HISTORIAL, actualizar_ultima_posicion
+    if tabla != TABLA_HISTORIAL or not len(aceptadas):
+        return
+    try:
+        actualizar_ultima_posicion(aceptadas)
+    except Exception as e:
+        print(f"⚠️ No se pudo actualizar la última posición ({e})")
+
+@instrumentar
+def insertar_lote(aceptadas, tabla, columnas):
+    """Staging y upsert de un lote ya validado, en su propia transacción.
+
+    Es la escritura de quien no lleva manifiesto (ingesta en vivo, simulador).
+    Pasar por staging convierte velocidad y ts al tipo de la tabla destino;
+    después se actualiza `bus_latest`.
+    """
+    conexion = engine.raw_connection()
+    try:
+        cursor = conexion.cursor()
+        crear_staging(cursor)
+        insertadas = copiar_lote(cursor, aceptadas, tabla, columnas)
+        conexion.commit()
+    except Exception:
+        conexion.rollback()
+        raise
+    finally:
+        conexion.close()
+    publicar_ultima_posicion(aceptadas, tabla)
+    return insertadas
+
+@instrumentar
+def cargar_archivo(archivo, tabla='bus_locations', bytes_por_lote=BYTES_POR_LOTE,
+                   huella_completa=False, fuente=None):
+    """Carga idempotente y reanudable de un CSV de fixes.
+
+    Cada lote se valida, pasa por una tabla de staging y entra con
+    ON CONFLICT (placa, ts) DO NOTHING; el registro del lote en el manifiesto
+    se confirma en la misma transacción. Tras una caída se retoma desde el
+    byte final del último lote confirmado, y un archivo ya completo se omite.
+    """
+    crear_tablas_manifiesto()
+    crear_tabla_cuarentena()
+    columnas = preparar_tabla_destino(tabla)
+    huella = huella_archivo(archivo, huella_completa)
+    fuente = fuente or os.path.basename(archivo)
+    clave = {'huella': huella, 'tabla': tabla}
+
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+        INSERT INTO {TABLA_MANIFIESTO} (huella, tabla_destino, archivo, tamano_bytes)
+        VALUES (:huella, :tabla, :archivo, :tamano)
+        ON CONFLICT (huella, tabla_destino) DO NOTHING;
+        """), {**clave, 'archivo': os.path.abspath(archivo), 'tamano': os.path.getsize(archivo)})
+        estado = conn.execute(text(f"""
+        SELECT estado FROM {TABLA_MANIFIESTO} WHERE huella = :huella AND tabla_destino = :tabla
+        """), clave).scalar()
+        ultimo = conn.execute(text(f"""
+        SELECT lote, byte_fin FROM {TABLA_LOTES}
+        WHERE huella = :huella AND tabla_destino = :tabla
+        ORDER BY lote DESC LIMIT 1
+        """), clave).fetchone()
+
+    if estado == 'completo':
+        print(f"⏭️ '{archivo}' ya fue cargado en '{tabla}' (huella {huella[:12]})")
+        return 0
+    lote, desde = (ultimo.lote + 1, ultimo.byte_fin) if ultimo else (0, None)
+    if ultimo:
+        print(f"↩️ Reanudando '{archivo}' desde el lote {lote} (byte {desde:,})")
+
+    tamano = os.path.getsize(archivo)
+    validador = ValidadorCalidad()
+    t0 = time.perf_counter()
+    conexion = engine.raw_connection()
+    try:
+        cursor = conexion.cursor()
+        crear_staging(cursor)
+        conexion.commit()
+
+        for byte_inicio, byte_fin, df in leer_lotes(archivo, desde, bytes_por_lote):
+            df['ts'] = df['timestamp'] if 'timestamp' in df else df['ts']
+            aceptadas, rechazadas = validador.validar(df)
+            try:
+                insertadas = copiar_lote(cursor, aceptadas, tabla, columnas) if len(aceptadas) else 0
+                guardar_cuarentena(rechazadas, fuente, cursor)
+                cursor.execute(f"""
+                INSERT INTO {TABLA_LOTES}
+                    (huella, tabla_destino, lote, byte_inicio, byte_fin, filas, insertadas, rechazadas)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
+                """, (huella, tabla, lote, byte_inicio, byte_fin, len(df), insertadas, len(rechazadas)))
+                conexion.commit()
+            except Exception:
+                conexion.rollback()
+                raise
+            publicar_ultima_posicion(aceptadas, tabla)
+            print(f"   Lote {lote}: {len(df):,} filas, {insertadas:,} nuevas, {len(rechazadas):,} rechazadas "
+                  f"({byte_fin / tamano:.0%} del archivo)")
+            lote += 1
+
+        cursor.execute(f"""
+        UPDATE {TABLA_MANIFIESTO} m
+        SET estado = 'completo', terminado = LOCALTIMESTAMP,
+            filas = l.filas, insertadas = l.insertadas, rechazadas = l.rechazadas
+        FROM (
+            SELECT SUM(filas) AS filas, SUM(insertadas) AS insertadas, SUM(rechazadas) AS rechazadas
+            FROM {TABLA_LOTES} WHERE huella = %s AND tabla_destino = %s
+        ) l
+        WHERE m.huella = %s AND m.tabla_destino = %s
+        RETURNING m.filas, m.insertadas, m.rechazadas;
+        """, (huella, tabla, huella, tabla))
+        filas, insertadas, rechazadas = cursor.fetchone()
+        conexion.commit()
+    finally:
+        conexion.close()
+
+    registrar_filas(filas or 0)
+    print(f"✅ '{archivo}' → '{tabla}': {filas or 0:,} filas, {insertadas or 0:,} nuevas, "
+          f"{rechazadas or 0:,} en cuarentena ({time.perf_counter() - t0:.1f} s)")
+    return insertadas or 0
+
+def mostrar_manifiesto():
+    """Archivos cargados (o a medio cargar) con su avance."""
+    df = pd.read_sql(f"""
+    SELECT m.archivo, m.tabla_destino, m.estado, m.tamano_bytes, m.iniciado, m.terminado,
+           COUNT(l.lote) AS lotes, COALESCE(MAX(l.byte_fin), 0) AS bytes_cargados,
+           COALESCE(SUM(l.insertadas), 0) AS insertadas
+    FROM {TABLA_MANIFIESTO} m
+    LEFT JOIN {TABLA_LOTES} l ON l.huella = m.huella AND l.tabla_destino = m.tabla_destino
+    GROUP BY 1, 2, 3, 4, 5, 6
+    ORDER BY m.iniciado;
+    """, engine)
+    for _, row in df.iterrows():
+        avance = row['bytes_cargados'] / row['tamano_bytes'] if row['tamano_bytes'] else 1
+        marca = "✅" if row['estado'] == 'completo' else "⏸️"
+        print(f"{marca} {row['archivo']} → {row['tabla_destino']}: {row['lotes']} lotes, "
+              f"{row['insertadas']:,} filas nuevas, {avance:.0%}")
+    return df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cargas idempotentes y reanudables de CSV de fixes")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    p_cargar = sub.add_parser('cargar', help="Cargar (o retomar) uno o más CSV")
+    p_cargar.add_argument('archivos', nargs='+')
+    p_cargar.add_argument('--tabla', default='bus_locations')
+    p_cargar.add_argument('--mb-por-lote', type=int, default=BYTES_POR_LOTE // 1024 ** 2)
+    p_cargar.add_argument('--huella-completa', action='store_true', help="SHA-256 de todo el archivo")
+    sub.add_parser('estado', help="Mostrar el manifiesto de cargas")
+    args = parser.parse_args()
+
+    try:
+        if args.comando == 'cargar':
+            for archivo in args.archivos:
+                cargar_archivo(archivo, args.tabla, args.mb_por_lote * 1024 ** 2, args.huella_completa)
+        elif args.comando == 'estado':
+            mostrar_manifiesto()
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Está PostgreSQL corriendo?")
+        print("   • ¿Las credenciales son correctas?")
+        print("   • Si el proceso se cortó, volver a ejecutar el mismo comando retoma la carga")
@@ -0,0 +1,272 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import shapely
+import folium
+from sqlalchemy import create_engine, text
+from geoalchemy2 import Geometry, WKTElement
+from features_espaciales import proyectar_utm
+from instrumentacion import instrumentar
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+TABLA_HOTSPOTS = 'hotspots_congestion'
+COLUMNAS_CLUSTER = ['bucket', 'cluster_id', 'geom_wkt', 'fixes', 'buses', 'placas',
+                    'velocidad_promedio', 'inicio', 'fin']
+UMBRAL_LENTO_KMH = 15      # Mismo umbral que "Congestión severa" en el modelo
+INTERVALO_BUCKET = '15 minutes'
+EPS_M = 150                # Radio DBSCAN en metros
+MIN_PUNTOS = 5
+MIN_BUSES = 2              # Un solo bus detenido no es un hotspot
+MARGEN_POLIGONO_M = 30
+HILOS_SQL = 4
+
+COLORES_SEVERIDAD = {'severa': 'darkred', 'alta': 'red', 'moderada': 'orange'}
+
+def clasificar_severidad(velocidad_promedio, buses):
+    """Severidad según velocidad media del cluster y cantidad de buses afectados."""
+    velocidad_promedio = np.asarray(velocidad_promedio, dtype=float)
+    buses = np.asarray(buses)
+    return np.where(
+        (velocidad_promedio < 8) | (buses >= 10), 'severa',
+        np.where((velocidad_promedio < 12) | (buses >= 5), 'alta', 'moderada')
+    )
+
+def _sql_hotspots(tabla):
+    # ST_ClusterDBSCAN corre como función de ventana: un clustering por bucket
+    return f"""
+    WITH lentos AS (
+        SELECT placa, ts, velocidad_kmh, location_utm,
+               time_bucket(CAST(:intervalo AS INTERVAL), ts) AS bucket
+        FROM {tabla}
+        WHERE ts >= :desde AND ts < :hasta AND velocidad_kmh < :umbral
+    ),
+    clusters AS (
+        SELECT *,
+               ST_ClusterDBSCAN(location_utm, {EPS_M}, {MIN_PUNTOS}) OVER (PARTITION BY bucket) AS cluster_id
+        FROM lentos
+    )
+    SELECT
+        bucket,
+        cluster_id,
+        ST_AsText(ST_Transform(
+            ST_Buffer(ST_ConvexHull(ST_Collect(location_utm)), {MARGEN_POLIGONO_M}), 4326
+        )) AS geom_wkt,
+        COUNT(*) AS fixes,
+        COUNT(DISTINCT placa) AS buses,
+        ARRAY_AGG(DISTINCT placa) AS placas,
+        AVG(velocidad_kmh) AS velocidad_promedio,
+        MIN(ts) AS inicio,
+        MAX(ts) AS fin
+    FROM clusters
+    WHERE cluster_id IS NOT NULL
+    GROUP BY bucket, cluster_id
+    HAVING COUNT(DISTINCT placa) >= {MIN_BUSES}
+    """
+
+def enlazar_episodios(df):
+    """Número de episodio de cada cluster, uniendo buckets consecutivos.
+
+    Un cluster continúa a otro del bucket anterior si sus polígonos se tocan;
+    las cadenas (con fusiones y divisiones) se resuelven como componentes
+    conexas de ese grafo.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    n = len(df)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    geometrias = shapely.from_wkt(df['geom_wkt'].to_numpy())
+    buckets = pd.to_datetime(df['bucket']).to_numpy('datetime64[ns]').astype(np.int64)
+    i, j = shapely.STRtree(geometrias).query(geometrias, predicate='intersects')
+    consecutivos = buckets[j] - buckets[i] == pd.Timedelta(INTERVALO_BUCKET).value
+    grafo = coo_matrix((np.ones(consecutivos.sum()), (i[consecutivos], j[consecutivos])), shape=(n, n))
+    return connected_components(grafo, directed=False)[1]
+
+def _completar_hotspots(df):
+    df = df.sort_values(['bucket', 'cluster_id']).reset_index(drop=True)
+    # La duración es la del episodio completo, no la del bucket
+    episodio = enlazar_episodios(df)
+    df['inicio_episodio'] = pd.to_datetime(df['inicio']).groupby(episodio).transform('min')
+    df['fin_episodio'] = pd.to_datetime(df['fin']).groupby(episodio).transform('max')
+    df['duracion_min'] = (df['fin_episodio'] - df['inicio_episodio']).dt.total_seconds() / 60
+    df['severidad'] = clasificar_severidad(df['velocidad_promedio'], df['buses'])
+    return df
+
+@instrumentar
+def detectar_hotspots_sql(desde, hasta, tabla='bus_locations', hilos=HILOS_SQL):
+    """Clustering en el servidor, repartiendo el rango de tiempo entre varias conexiones.
+
+    Los cortes se alinean a los buckets para que ninguno quede partido entre dos hilos.
+    """
+    desde, hasta = pd.Timestamp(desde), pd.Timestamp(hasta)
+    paso = pd.Timedelta(INTERVALO_BUCKET)
+    buckets = pd.date_range(desde.floor(paso), hasta, freq=paso)
+    tramos = [t for t in np.array_split(buckets, hilos) if len(t)]
+    rangos = [(t[0], min(t[-1] + paso, hasta)) for t in tramos]
+
+    def consultar(rango):
+        params = {'intervalo': INTERVALO_BUCKET, 'desde': rango[0], 'hasta': rango[1],
+                  'umbral': UMBRAL_LENTO_KMH}
+        return pd.read_sql(text(_sql_hotspots(tabla)), engine, params=params)
+
+    if not rangos:
+        return _completar_hotspots(pd.DataFrame(columns=COLUMNAS_CLUSTER))
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        partes = list(ejecutor.map(consultar, rangos))
+
+    return _completar_hotspots(pd.concat(partes, ignore_index=True))
+
+def _clusterizar_bucket(args):
+    """DBSCAN (BallTree) de los fixes lentos de un bucket, en coordenadas UTM."""
+    from sklearn.cluster import DBSCAN
+
+    bucket, placas, ts, lat, lon, velocidad = args
+    x, y = proyectar_utm(lon, lat)
+    etiquetas = DBSCAN(eps=EPS_M, min_samples=MIN_PUNTOS, algorithm='ball_tree').fit_predict(
+        np.column_stack([x, y])
+    )
+
+    filas = []
+    for cluster_id in np.unique(etiquetas[etiquetas >= 0]):
+        m = etiquetas == cluster_id
+        placas_cluster = np.unique(placas[m])
+        if len(placas_cluster) < MIN_BUSES:
+            continue
+        # El casco convexo en lat/lon es prácticamente el mismo que en UTM a esta escala
+        casco = shapely.convex_hull(shapely.multipoints(np.column_stack([lon[m], lat[m]])))
+        casco = shapely.buffer(casco, MARGEN_POLIGONO_M / 111_320)
+        filas.append({
+            'bucket': bucket, 'cluster_id': int(cluster_id), 'geom_wkt': casco.wkt,
+            'fixes': int(m.sum()), 'buses': len(placas_cluster), 'placas': list(placas_cluster),
+            'velocidad_promedio': float(velocidad[m].mean()),
+            'inicio': ts[m].min(), 'fin': ts[m].max(),
+        })
+    return filas
+
+@instrumentar
+def detectar_hotspots_df(df, procesos=None):
+    """Misma detección en Python para un DataFrame (p. ej. el CSV del generador).
+
+    Cada bucket de tiempo se clusteriza en un proceso distinto.
+    """
+    lentos = df[df['velocidad_kmh'] < UMBRAL_LENTO_KMH]
+    lentos = lentos.assign(ts=pd.to_datetime(lentos['ts']))
+    lentos = lentos.assign(bucket=lentos['ts'].dt.floor(pd.Timedelta(INTERVALO_BUCKET)))
+
+    tareas = [
+        (bucket, g['placa'].to_numpy(), g['ts'].to_numpy(), g['latitud'].to_numpy(),
+         g['longitud'].to_numpy(), g['velocidad_kmh'].to_numpy())
+        for bucket, g in lentos.groupby('bucket') if len(g) >= MIN_PUNTOS
+    ]
+    with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+        filas = [fila for resultado in ejecutor.map(_clusterizar_bucket, tareas) for fila in resultado]
+
+    return _completar_hotspots(pd.DataFrame(filas, columns=COLUMNAS_CLUSTER))
+
+def guardar_hotspots(hotspots, desde, hasta):
+    """Reemplaza los hotspots del rango en la tabla de resultados."""
+    final_df = hotspots.drop(columns=['geom_wkt']).copy()
+    final_df['geom'] = hotspots['geom_wkt'].apply(lambda w: WKTElement(w, srid=4326))
+    final_df['placas'] = final_df['placas'].apply(lambda p: ','.join(p))
+
+    with engine.begin() as conn:
+        # Mismo tipo que bus_locations.ts: los buckets de time_bucket son timestamptz
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_HOTSPOTS} (
+            bucket TIMESTAMPTZ NOT NULL,
+            cluster_id INTEGER NOT NULL,
+            fixes INTEGER,
+            buses INTEGER,
+            placas TEXT,
+            velocidad_promedio DOUBLE PRECISION,
+            inicio TIMESTAMPTZ,
+            fin TIMESTAMPTZ,
+            inicio_episodio TIMESTAMPTZ,
+            fin_episodio TIMESTAMPTZ,
+            duracion_min DOUBLE PRECISION,
+            severidad TEXT,
+            geom geometry(Geometry, 4326)
+        );
+        """))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{TABLA_HOTSPOTS}_bucket ON {TABLA_HOTSPOTS} (bucket);"))
+        conn.execute(text(f"DELETE FROM {TABLA_HOTSPOTS} WHERE bucket >= :desde AND bucket < :hasta"),
+                     {'desde': desde, 'hasta': hasta})
+
+    final_df.to_sql(TABLA_HOTSPOTS, con=engine, if_exists='append', index=False,
+                    dtype={'geom': Geometry('GEOMETRY', srid=4326)})
+    print(f"✅ {len(final_df)} hotspots guardados en '{TABLA_HOTSPOTS}'")
+
+def cargar_hotspots(desde=None, hasta=None, engine_consulta=None):
+    """Lee hotspots guardados para dibujarlos en los mapas."""
+    sql_query = f"""
+    SELECT bucket, cluster_id, ST_AsText(geom) AS geom_wkt, buses, placas,
+           velocidad_promedio, inicio, fin, inicio_episodio, fin_episodio, duracion_min, severidad
+    FROM {TABLA_HOTSPOTS}
+    WHERE (%(desde)s IS NULL OR bucket >= %(desde)s)
+      AND (%(hasta)s IS NULL OR bucket < %(hasta)s)
+    ORDER BY bucket;
+    """
+    return pd.read_sql(sql_query, engine_consulta or engine, params={'desde': desde, 'hasta': hasta})
+
+def agregar_capa_hotspots(mapa, hotspots, nombre='Hotspots de congestión'):
+    """Agrega los polígonos de hotspots como capa conmutable de un mapa folium."""
+    capa = folium.FeatureGroup(name=nombre)
+    for _, row in hotspots.iterrows():
+        color = COLORES_SEVERIDAD.get(row['severidad'], 'orange')
+        placas = row['placas'] if isinstance(row['placas'], str) else ', '.join(row['placas'])
+        folium.GeoJson(
+            shapely.geometry.mapping(shapely.from_wkt(row['geom_wkt'])),
+            style_function=lambda _, color=color: {'color': color, 'fillColor': color,
+                                                   'weight': 2, 'fillOpacity': 0.35},
+            popup=folium.Popup(
+                f"🚦 Congestión {row['severidad']}<br>"
+                f"{row['bucket']}<br>"
+                f"Velocidad media: {row['velocidad_promedio']:.1f} km/h<br>"
+                f"Duración: {row['duracion_min']:.0f} min<br>"
+                f"Buses ({row['buses']}): {placas}",
+                max_width=300
+            )
+        ).add_to(capa)
+    capa.add_to(mapa)
+    return capa
+
+if __name__ == "__main__":
+    print("🚦 DETECCIÓN DE HOTSPOTS DE CONGESTIÓN")
+    print("=" * 50)
+
+    try:
+        with engine.connect() as conn:
+            dia = conn.execute(text("SELECT date_trunc('day', MAX(ts)) FROM bus_locations")).scalar()
+        desde, hasta = dia, dia + pd.Timedelta(days=1)
+
+        t0 = time.perf_counter()
+        hotspots = detectar_hotspots_sql(desde, hasta)
+        print(f"⚡ {len(hotspots)} hotspots en {time.perf_counter() - t0:.1f} s para el día {dia:%Y-%m-%d}")
+        for severidad, grupo in hotspots.groupby('severidad'):
+            print(f"   {severidad}: {len(grupo)} hotspots, {grupo['buses'].sum()} buses afectados")
+
+        guardar_hotspots(hotspots, desde, hasta)
+
+        mapa = folium.Map(location=[-16.4009, -71.5378], zoom_start=13, tiles='OpenStreetMap')
+        agregar_capa_hotspots(mapa, hotspots)
+        folium.LayerControl().add_to(mapa)
+        archivo = "mapa_hotspots.html"
+        mapa.save(archivo)
+        print(f"✅ Mapa de hotspots guardado: {archivo}")
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Se creó la columna 'location_utm'? (python features_espaciales.py)")
+        print("   • ¿Los datos están cargados en 'bus_locations'?")
@@ -0,0 +1,398 @@
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+import pandas as pd
+from psycopg2 import InterfaceError, OperationalError
+from sqlalchemy import exc
+from calidad_datos import (MOTIVOS, ZONA_HORARIA, ValidadorCalidad, crear_tabla_cuarentena, guardar_cuarentena,
+                           normalizar_ts)
+from gestor_cargas import insertar_lote, preparar_tabla_destino
+
+TABLA_DESTINO = 'bus_locations'
+PUERTO_INGESTA = 5555
+TAMANO_LOTE = 5000           # Fixes por COPY
+INTERVALO_FLUSH_S = 1.0      # Flush aunque el lote no esté lleno
+MAX_PENDIENTES = 50000       # Tope de la cola en memoria (backpressure)
+DIRECTORIO_COLA = 'cola_ingesta'
+INTERVALO_REINTENTO_S = 5.0
+COLUMNAS_FIX = ['placa', 'latitud', 'longitud', 'velocidad_kmh', 'ts']
+
+# BD caída o inalcanzable: el lote se guarda en disco y se reintenta. Cualquier
+# otro error es del lote mismo y reintentarlo fallaría siempre igual
+ERRORES_CONEXION = (OperationalError, InterfaceError, exc.OperationalError, exc.InterfaceError)
+
+# Límites groseros de validación; la limpieza fina es otra etapa
+LAT_MIN, LAT_MAX = -17.0, -16.0
+LON_MIN, LON_MAX = -72.0, -71.0
+VELOCIDAD_MAX_KMH = 150
+
+def parsear_linea(linea):
+    """Convierte una línea JSON o CSV (placa,lat,lon,velocidad,timestamp) en un fix."""
+    linea = linea.strip()
+    if not linea:
+        return None
+    if linea.startswith('{'):
+        dato = json.loads(linea)
+        if not isinstance(dato, dict):
+            raise ValueError("el JSON no es un objeto")
+        return (dato['placa'], float(dato['latitud']), float(dato['longitud']),
+                float(dato['velocidad_kmh']), dato['timestamp'])
+    placa, lat, lon, velocidad, ts = next(csv.reader([linea]))
+    return placa, float(lat), float(lon), float(velocidad), ts
+
+def validar_fix(fix):
+    """Valida rango de coordenadas, velocidad y formato de timestamp."""
+    placa, lat, lon, velocidad, ts = fix
+    if not placa or not (LAT_MIN <= lat <= LAT_MAX) or not (LON_MIN <= lon <= LON_MAX):
+        return None
+    if not (0 <= velocidad <= VELOCIDAD_MAX_KMH):
+        return None
+    ts = datetime.fromisoformat(ts)
+    # `ts` es timestamptz: un fix sin offset es hora local y se escribe con la
+    # zona explícita, así el instante no depende del TimeZone del servidor
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=ZONA_HORARIA)
+    return placa, lat, lon, velocidad, ts
+
+def lote_a_csv(fixes):
+    """Serializa un lote para la cola en disco, con el mismo formato CSV del feed."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for placa, lat, lon, velocidad, ts in fixes:
+        escritor.writerow([placa, lat, lon, velocidad, ts.isoformat(sep=' ')])
+    return buffer.getvalue()
+
+def csv_a_lote(contenido):
+    """Lee un lote de la cola en disco (ValueError si el archivo está dañado)."""
+    fixes = filter(None, map(parsear_linea, contenido.splitlines()))
+    return [(placa, lat, lon, velocidad, datetime.fromisoformat(ts)) for placa, lat, lon, velocidad, ts in fixes]
+
+def lote_a_dataframe(fixes):
+    return pd.DataFrame(fixes, columns=COLUMNAS_FIX)
+
+class ColaDisco:
+    """Cola durable en disco para lotes que no se pudieron escribir en la BD."""
+
+    def __init__(self, directorio=DIRECTORIO_COLA):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+        self._secuencia = 0
+
+    def guardar(self, contenido):
+        """Escribe el lote de forma atómica y devuelve su nombre."""
+        self._secuencia += 1
+        nombre = f"lote_{time.time_ns()}_{self._secuencia:06d}.csv"
+        temporal = os.path.join(self.directorio, nombre + '.tmp')
+        with open(temporal, 'w', encoding='utf-8') as f:
+            f.write(contenido)
+            f.flush()
+            os.fsync(f.fileno())
+        # Renombrar es atómico: nunca queda un lote a medio escribir
+        os.replace(temporal, os.path.join(self.directorio, nombre))
+        return nombre
+
+    def apartar(self, nombre):
+        """Mueve un lote que la BD rechaza a `rechazados/`, fuera de la cola."""
+        apartados = os.path.join(self.directorio, 'rechazados')
+        os.makedirs(apartados, exist_ok=True)
+        os.replace(os.path.join(self.directorio, nombre), os.path.join(apartados, nombre))
+
+    def pendientes(self):
+        return sorted(f for f in os.listdir(self.directorio) if f.endswith('.csv'))
+
+    def leer(self, nombre):
+        with open(os.path.join(self.directorio, nombre), encoding='utf-8') as f:
+            return f.read()
+
+    def eliminar(self, nombre):
+        os.remove(os.path.join(self.directorio, nombre))
+
+class ServicioIngesta:
+    """Recibe fixes por TCP/UDP, los agrupa por tiempo/tamaño y los escribe con COPY."""
+
+    def __init__(self, tabla=TABLA_DESTINO, tamano_lote=TAMANO_LOTE,
+                 intervalo_flush=INTERVALO_FLUSH_S, max_pendientes=MAX_PENDIENTES):
+        self.tabla = tabla
+        self.tamano_lote = tamano_lote
+        self.intervalo_flush = intervalo_flush
+        self.cola = asyncio.Queue(maxsize=max_pendientes)
+        self.cola_disco = ColaDisco()
+        self.db_disponible = True
+        self.estadisticas = {'recibidos': 0, 'rechazados': 0, 'descartados_udp': 0,
+                             'escritos': 0, 'derramados': 0}
+        # Funciones extra a ejecutar con cada lote escrito (p. ej. geocercas); bus_latest
+        # ya lo actualiza gestor_cargas.insertar_lote
+        self.al_escribir = []
+        # Reglas por bus (saltos, duplicados) sobre cada lote, con memoria entre lotes
+        self.validador = ValidadorCalidad()
+        self.cuarentena_lista = False
+        self.columnas = None
+
+    def procesar_linea(self, linea):
+        try:
+            fix = validar_fix(parsear_linea(linea))
+        except (ValueError, KeyError, TypeError, StopIteration):
+            # TypeError: campos null o timestamp numérico; no debe cortar la conexión
+            fix = None
+        if fix is None:
+            self.estadisticas['rechazados'] += 1
+        return fix
+
+    async def atender_tcp(self, lector, escritor):
+        """Una conexión TCP: si la cola está llena, `put` espera y el cliente se frena."""
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea:
+                    break
+                fix = self.procesar_linea(linea.decode('utf-8', errors='replace'))
+                if fix is not None:
+                    self.estadisticas['recibidos'] += 1
+                    await self.cola.put(fix)
+        finally:
+            escritor.close()
+
+    def recibir_udp(self, datos):
+        """UDP no tiene control de flujo: con la cola llena, el fix se descarta."""
+        for linea in datos.decode('utf-8', errors='replace').splitlines():
+            fix = self.procesar_linea(linea)
+            if fix is None:
+                continue
+            try:
+                self.cola.put_nowait(fix)
+                self.estadisticas['recibidos'] += 1
+            except asyncio.QueueFull:
+                self.estadisticas['descartados_udp'] += 1
+
+    def a_cuarentena(self, df, fuente='ingesta'):
+        if not self.cuarentena_lista:
+            crear_tabla_cuarentena()
+            self.cuarentena_lista = True
+        guardar_cuarentena(df, fuente)
+
+    def filtrar_lote(self, fixes):
+        """Aplica la validación vectorizada al lote y manda los rechazos a cuarentena."""
+        aceptadas, rechazadas = self.validador.validar(lote_a_dataframe(fixes))
+        if len(rechazadas):
+            self.estadisticas['rechazados'] += len(rechazadas)
+            try:
+                self.a_cuarentena(rechazadas)
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar la cuarentena ({e})")
+        return aceptadas
+
+    def escribir_validadas(self, aceptadas):
+        """Staging + upsert de un lote ya validado.
+
+        Devuelve False solo si la BD no responde (el lote debe guardarse para
+        reintentar). Un lote que la BD rechaza va a cuarentena; si tampoco se
+        puede, queda en `rechazados/` de la cola en disco.
+        """
+        try:
+            if self.columnas is None:
+                self.columnas = preparar_tabla_destino(self.tabla)
+            insertar_lote(aceptadas, self.tabla, self.columnas)
+        except ERRORES_CONEXION as e:
+            if self.db_disponible:
+                print(f"⚠️ BD no disponible ({e}); derivando lotes a '{self.cola_disco.directorio}'")
+            self.db_disponible = False
+            return False
+        except Exception as e:
+            print(f"⚠️ La BD rechazó un lote de {len(aceptadas)} fixes ({e}); va a cuarentena")
+            self.cuarentenar_lote(aceptadas, 'rechazado_bd')
+            return True
+
+        if not self.db_disponible:
+            print("✅ BD disponible nuevamente, drenando cola en disco")
+        self.db_disponible = True
+        self.estadisticas['escritos'] += len(aceptadas)
+        # Un fallo en un hook no debe reenviar un lote que ya está en la tabla
+        fixes = self.a_fixes(aceptadas)
+        for funcion in self.al_escribir:
+            try:
+                funcion(fixes)
+            except Exception as e:
+                print(f"⚠️ Error en {funcion.__name__}: {e}")
+        return True
+
+    def cuarentenar_lote(self, df, motivo):
+        """Manda un lote entero a cuarentena; sin BD, lo aparta en `rechazados/`."""
+        try:
+            self.a_cuarentena(df.assign(motivo=MOTIVOS[motivo]))
+        except Exception:
+            nombre = self.cola_disco.guardar(lote_a_csv(df.itertuples(index=False)))
+            self.cola_disco.apartar(nombre)
+        self.estadisticas['rechazados'] += len(df)
+
+    @staticmethod
+    def a_fixes(df):
+        return list(zip(df['placa'], df['latitud'], df['longitud'], df['velocidad_kmh'],
+                        df['ts'].dt.to_pydatetime()))
+
+    def escribir_lote(self, fixes):
+        """Valida y escribe un lote en la BD; si no responde, lo deja en la cola en disco."""
+        try:
+            aceptadas = self.filtrar_lote(fixes)
+        except Exception as e:
+            # No debe tumbar el servicio, y sin validar tampoco puede llegar a la tabla
+            print(f"⚠️ No se pudo validar un lote de {len(fixes)} fixes ({e}); va a cuarentena")
+            self.cuarentenar_lote(lote_a_dataframe(fixes), 'error_validacion')
+            return
+        if not len(aceptadas):
+            return
+        if not self.escribir_validadas(aceptadas):
+            self.cola_disco.guardar(lote_a_csv(self.a_fixes(aceptadas)))
+            self.estadisticas['derramados'] += len(aceptadas)
+
+    async def vaciar_periodicamente(self):
+        """Junta fixes hasta llenar el lote o cumplir el intervalo y hace COPY."""
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = [await self.cola.get()]
+            limite = loop.time() + self.intervalo_flush
+            while len(lote) < self.tamano_lote:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(await asyncio.wait_for(self.cola.get(), restante))
+                except asyncio.TimeoutError:
+                    break
+            # El COPY es bloqueante: se ejecuta en un hilo para no frenar la recepción
+            try:
+                await loop.run_in_executor(None, self.escribir_lote, lote)
+            except Exception as e:
+                print(f"❌ Se perdió un lote de {len(lote)} fixes: {e}")
+
+    def reintentar_pendientes(self):
+        """Reenvía los lotes guardados en disco, del más antiguo al más nuevo.
+
+        Se detiene cuando la BD no responde; un archivo ilegible o un lote que
+        la BD rechaza se saca de la cola para no bloquear los siguientes. El
+        upsert hace que reenviar un lote ya escrito (caída entre el commit y
+        `eliminar`) no duplique filas.
+        """
+        for nombre in self.cola_disco.pendientes():
+            try:
+                fixes = csv_a_lote(self.cola_disco.leer(nombre))
+            except (ValueError, KeyError, TypeError, StopIteration) as e:
+                print(f"⚠️ Lote '{nombre}' ilegible ({e}); se aparta en 'rechazados/'")
+                self.cola_disco.apartar(nombre)
+                continue
+            if fixes:
+                aceptadas = lote_a_dataframe(fixes).assign(ts=lambda d: normalizar_ts(d['ts']))
+                if not self.escribir_validadas(aceptadas):
+                    return
+            self.cola_disco.eliminar(nombre)
+
+    async def drenar_cola_disco(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self.reintentar_pendientes)
+            await asyncio.sleep(INTERVALO_REINTENTO_S)
+
+    async def reportar(self, intervalo=10):
+        anterior = 0
+        while True:
+            await asyncio.sleep(intervalo)
+            e = self.estadisticas
+            tasa = (e['escritos'] - anterior) / intervalo
+            anterior = e['escritos']
+            print(f"📡 recibidos={e['recibidos']:,} escritos={e['escritos']:,} ({tasa:,.0f}/s) "
+                  f"rechazados={e['rechazados']:,} en_cola={self.cola.qsize():,} "
+                  f"en_disco={len(self.cola_disco.pendientes())}")
+
+    async def ejecutar(self, host='0.0.0.0', puerto=PUERTO_INGESTA):
+        loop = asyncio.get_running_loop()
+        servidor = await asyncio.start_server(self.atender_tcp, host, puerto)
+        servicio = self
+
+        class ProtocoloUDP(asyncio.DatagramProtocol):
+            def datagram_received(self, datos, direccion):
+                servicio.recibir_udp(datos)
+
+        transporte, _ = await loop.create_datagram_endpoint(ProtocoloUDP, local_addr=(host, puerto))
+        print(f"🚌 Ingesta escuchando en {host}:{puerto} (TCP y UDP) -> '{self.tabla}'")
+
+        try:
+            async with servidor:
+                await asyncio.gather(
+                    servidor.serve_forever(),
+                    self.vaciar_periodicamente(),
+                    self.drenar_cola_disco(),
+                    self.reportar(),
+                )
+        finally:
+            transporte.close()
+
+async def reproducir_feed(archivo, host='127.0.0.1', puerto=PUERTO_INGESTA, factor=10.0):
+    """Reproduce el CSV del generador como feed en vivo a `factor`× la velocidad real.
+
+    Los timestamps se reescriben al reloj actual para que los datos lleguen
+    como si fueran nuevos; con factor=0 se envía todo sin esperas (prueba de carga).
+    """
+    df = pd.read_csv(archivo, parse_dates=['timestamp']).sort_values('timestamp')
+    lector, escritor = await asyncio.open_connection(host, puerto)
+
+    inicio_datos = df['timestamp'].iloc[0]
+    inicio_real = time.monotonic()
+    ahora = datetime.now(ZONA_HORARIA)
+    print(f"▶️ Reproduciendo {len(df):,} fixes de '{archivo}' a {factor}x")
+
+    enviados = 0
+    for fila in df.itertuples(index=False):
+        transcurrido = (fila.timestamp - inicio_datos).total_seconds()
+        if factor > 0:
+            espera = transcurrido / factor - (time.monotonic() - inicio_real)
+            if espera > 0:
+                await escritor.drain()
+                await asyncio.sleep(espera)
+        ts = ahora + (fila.timestamp - inicio_datos)
+        escritor.write(
+            f"{fila.placa},{fila.latitud},{fila.longitud},{fila.velocidad_kmh},{ts.isoformat(sep=' ')}\n"
+            .encode('utf-8')
+        )
+        enviados += 1
+        if enviados % 10000 == 0:
+            await escritor.drain()
+
+    await escritor.drain()
+    escritor.close()
+    duracion = time.monotonic() - inicio_real
+    print(f"✅ {enviados:,} fixes enviados en {duracion:.1f} s ({enviados / max(duracion, 1e-9):,.0f} fixes/s)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingesta en tiempo real de fixes GPS")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p_servir = sub.add_parser('servir', help="Levanta el servicio de ingesta")
+    p_servir.add_argument('--puerto', type=int, default=PUERTO_INGESTA)
+    p_servir.add_argument('--tabla', default=TABLA_DESTINO)
+    p_servir.add_argument('--geocercas', action='store_true',
+                          help="Generar eventos de entrada/salida/permanencia en geocercas")
+
+    p_reproducir = sub.add_parser('reproducir', help="Reproduce un CSV del generador como feed en vivo")
+    p_reproducir.add_argument('archivo', nargs='?', default='datos_buses_aqp_realistas.csv')
+    p_reproducir.add_argument('--host', default='127.0.0.1')
+    p_reproducir.add_argument('--puerto', type=int, default=PUERTO_INGESTA)
+    p_reproducir.add_argument('--factor', type=float, default=10.0,
+                              help="Velocidad de reproducción (0 = sin esperas)")
+
+    args = parser.parse_args()
+    try:
+        if args.comando == 'servir':
+            servicio = ServicioIngesta(tabla=args.tabla)
+            if args.geocercas:
+                from geocercas import MotorGeocercas, crear_tablas_geocercas
+                crear_tablas_geocercas()
+                servicio.al_escribir.append(MotorGeocercas().procesar_fixes)
+            asyncio.run(servicio.ejecutar(puerto=args.puerto))
+        else:
+            asyncio.run(reproducir_feed(args.archivo, args.host, args.puerto, args.factor))
+    except KeyboardInterrupt:
+        print("\n⏹️ Ingesta detenida")
@@ -0,0 +1,182 @@
+import atexit
+import cProfile
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Tiempos, filas y memoria de cada etapa del pipeline. Se activa con variables
+# de entorno, sin tocar los scripts:
+#   METRICAS_FORMATO=json        una línea JSON por etapa (a stderr o METRICAS_ARCHIVO)
+#   METRICAS_FORMATO=prometheus  archivo de texto OpenMetrics al terminar el proceso
+#   METRICAS_PERFIL=1            cProfile de la etapa más lenta en perfil_<etapa>.pstats
+FORMATO = os.environ.get('METRICAS_FORMATO', '').lower()
+ARCHIVO = os.environ.get('METRICAS_ARCHIVO')
+PERFILAR = os.environ.get('METRICAS_PERFIL', '') not in ('', '0')
+ARCHIVO_PROMETHEUS = 'metricas_pipeline.prom'
+MAX_REGISTROS = 10000        # Procesos largos (ingesta) no acumulan memoria sin límite
+
+registros = deque(maxlen=MAX_REGISTROS)
+_acumulado = {}
+_local = threading.local()
+_lock = threading.Lock()
+_perfil_mas_lento = {'segundos': -1.0, 'etapa': None, 'perfil': None}
+
+def _pico_rss_mb():
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024
+
+def _pila():
+    if not hasattr(_local, 'pila'):
+        _local.pila = []
+    return _local.pila
+
+def _contar_filas(resultado):
+    """Filas de lo que devuelve una etapa (DataFrame, arreglo, lista o conteo)."""
+    if isinstance(resultado, tuple) and resultado:
+        resultado = resultado[0]
+    if isinstance(resultado, bool):
+        return None
+    if isinstance(resultado, int):
+        return resultado
+    if hasattr(resultado, 'shape') and len(resultado.shape):
+        return int(resultado.shape[0])
+    if isinstance(resultado, list):
+        return len(resultado)
+    return None
+
+def registrar_filas(filas):
+    """Fija las filas procesadas por la etapa en curso (si la función no las devuelve)."""
+    pila = _pila()
+    if pila:
+        pila[-1]['filas'] = int(filas)
+
+@contextmanager
+def medir(etapa):
+    """Mide tiempo de pared, CPU, filas y pico de memoria de un bloque."""
+    pila = _pila()
+    registro = {
+        'etapa': etapa,
+        'padre': pila[-1]['etapa'] if pila else None,
+        'inicio': datetime.now().isoformat(timespec='milliseconds'),
+        'filas': None,
+    }
+    # cProfile no admite perfiles anidados: solo se perfila la etapa más externa
+    perfil = cProfile.Profile() if PERFILAR and not pila else None
+    pila.append(registro)
+    pico_antes = _pico_rss_mb()
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    if perfil is not None:
+        perfil.enable()
+    error = None
+    try:
+        yield registro
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        if perfil is not None:
+            perfil.disable()
+        segundos = time.perf_counter() - t0
+        registro.update({
+            'segundos': segundos,
+            'cpu_segundos': time.process_time() - cpu0,
+            'pico_rss_mb': _pico_rss_mb(),
+            'incremento_pico_mb': _pico_rss_mb() - pico_antes,
+            'filas_por_segundo': registro['filas'] / segundos if registro['filas'] and segundos > 0 else None,
+            'error': f"{type(error).__name__}: {error}" if error is not None else None,
+        })
+        pila.pop()
+        with _lock:
+            registros.append(registro)
+            _acumular(registro)
+            if perfil is not None and segundos > _perfil_mas_lento['segundos']:
+                _perfil_mas_lento.update(segundos=segundos, etapa=etapa, perfil=perfil)
+        if FORMATO == 'json':
+            _escribir_json(registro)
+
+def instrumentar(funcion=None, etapa=None):
+    """Decorador: `@instrumentar` o `@instrumentar(etapa='nombre')`."""
+    if funcion is None:
+        return functools.partial(instrumentar, etapa=etapa)
+    nombre = etapa or f"{funcion.__module__}.{funcion.__name__}"
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        with medir(nombre) as registro:
+            resultado = funcion(*args, **kwargs)
+            if registro['filas'] is None:
+                registro['filas'] = _contar_filas(resultado)
+            return resultado
+    return envoltura
+
+def _escribir_json(registro):
+    linea = json.dumps(registro, ensure_ascii=False, default=str)
+    if ARCHIVO:
+        with open(ARCHIVO, 'a', encoding='utf-8') as f:
+            f.write(linea + '\n')
+    else:
+        print(linea, file=sys.stderr)
+
+def _nombre_metrica(etapa):
+    return etapa.replace('.', '_')
+
+def _acumular(r):
+    a = _acumulado.setdefault(_nombre_metrica(r['etapa']),
+                              {'llamadas': 0, 'segundos': 0.0, 'cpu': 0.0, 'filas': 0, 'pico': 0.0})
+    a['llamadas'] += 1
+    a['segundos'] += r['segundos']
+    a['cpu'] += r['cpu_segundos']
+    a['filas'] += r['filas'] or 0
+    a['pico'] = max(a['pico'], r['pico_rss_mb'])
+
+def formato_prometheus():
+    """Texto OpenMetrics con las métricas acumuladas por etapa."""
+    metricas = [
+        ('pipeline_etapa_llamadas', 'counter', 'Ejecuciones de la etapa', 'llamadas'),
+        ('pipeline_etapa_segundos', 'counter', 'Tiempo de pared acumulado', 'segundos'),
+        ('pipeline_etapa_cpu_segundos', 'counter', 'Tiempo de CPU acumulado', 'cpu'),
+        ('pipeline_etapa_filas', 'counter', 'Filas procesadas', 'filas'),
+        ('pipeline_etapa_pico_rss_megabytes', 'gauge', 'Pico de memoria del proceso al terminar la etapa', 'pico'),
+    ]
+    lineas = []
+    for nombre, tipo, ayuda, clave in metricas:
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for etapa, a in sorted(_acumulado.items()):
+            sufijo = '_total' if tipo == 'counter' else ''
+            lineas.append(f'{nombre}{sufijo}{{etapa="{etapa}"}} {a[clave]:.6g}')
+    lineas.append("# EOF")
+    return '\n'.join(lineas) + '\n'
+
+def resumen():
+    """Tabla de etapas ordenadas por tiempo (para imprimir al final de un script)."""
+    lineas = [f"{'Etapa':<55}{'Seg.':>9}{'CPU':>9}{'Filas':>12}{'Pico MB':>10}"]
+    for r in sorted(registros, key=lambda r: -r['segundos']):
+        etapa = ('  ' if r['padre'] else '') + r['etapa']
+        filas = f"{r['filas']:,}" if r['filas'] is not None else "-"
+        lineas.append(f"{etapa[:55]:<55}{r['segundos']:>9.2f}{r['cpu_segundos']:>9.2f}"
+                      f"{filas:>12}{r['pico_rss_mb']:>10.0f}")
+    return '\n'.join(lineas)
+
+def _al_salir():
+    if FORMATO == 'prometheus' and registros:
+        archivo = ARCHIVO or ARCHIVO_PROMETHEUS
+        temporal = f"{archivo}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            f.write(formato_prometheus())
+        os.replace(temporal, archivo)   # El textfile collector nunca ve un archivo a medias
+    if _perfil_mas_lento['perfil'] is not None:
+        archivo = f"perfil_{_nombre_metrica(_perfil_mas_lento['etapa'])}.pstats"
+        _perfil_mas_lento['perfil'].dump_stats(archivo)
+        print(f"🔬 Perfil de la etapa más lenta ({_perfil_mas_lento['etapa']}, "
+              f"{_perfil_mas_lento['segundos']:.1f} s): {archivo} "
+              f"(python -m pstats {archivo} o snakeviz)", file=sys.stderr)
+
+atexit.register(_al_salir)
@@ -1,6 +1,8 @@
 import pandas as pd
 import folium
 from sqlalchemy import create_engine
+from almacen_trayectorias import AlmacenTrayectorias
+from instrumentacion import instrumentar, registrar_filas
 
 # --- CONFIGURACIÓN DE LA CONEXIÓN ---
 db_user = 'postgres'
@@ -12,6 +14,7 @@ db_name = 'MiPrimeraDB'
 db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
 engine = create_engine(db_connection_str)
 
+@instrumentar
 def crear_mapa_simple():
     """Crea un mapa simple y liviano que funcione en Simple Browser"""
     print("📍 Creando mapa simplificado...")
@@ -30,6 +33,7 @@ def crear_mapa_simple():
     """
     
     df = pd.read_sql(sql_query, engine)
+    registrar_filas(len(df))
     print(f"Datos cargados: {len(df)} registros")
     
     # Centro en Arequipa
@@ -44,19 +48,20 @@ def crear_mapa_simple():
     )
     
     # Agregar solo algunos puntos principales
-    placas = df['placa'].unique()[:5]  # Solo 5 buses
+    almacen = AlmacenTrayectorias.desde_dataframe(df)
     colores = ['red', 'blue', 'green', 'purple', 'orange']
     
-    for i, placa in enumerate(placas):
-        datos_bus = df[df['placa'] == placa]
+    for i in range(min(almacen.n_buses, 5)):  # Solo 5 buses
+        bus = almacen.vista(i)
+        placa = bus.placa
         color = colores[i]
         
         # Solo marcadores, sin líneas (más simple)
-        for _, row in datos_bus.head(20).iterrows():  # Solo 20 puntos por bus
+        for lat, lon, vel in zip(bus.latitud[:20], bus.longitud[:20], bus.velocidad_kmh[:20]):  # Solo 20 puntos por bus
             folium.CircleMarker(
-                location=[row['latitud'], row['longitud']],
+                location=[float(lat), float(lon)],
                 radius=3,
-                popup=f"{placa}: {row['velocidad_kmh']} km/h",
+                popup=f"{placa}: {vel:.1f} km/h",
                 color=color,
                 fill=True,
                 fillOpacity=0.7
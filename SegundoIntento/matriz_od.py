@@ -0,0 +1,220 @@
+import time
+import pandas as pd
+from sqlalchemy import create_engine, text
+from features_espaciales import EPSG_UTM
+from puntos_interes import PUNTOS_INTERES
+from instrumentacion import instrumentar
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+TABLA_ZONAS_POI = 'poi_zonas'
+TABLA_VIAJES = 'viajes_od'
+TABLA_MATRIZ = 'matriz_od'
+TABLA_ESTADO = 'viajes_od_estado'
+
+RADIO_POI_M = 200              # Un bus "está en" el POI dentro de este radio
+PAUSA_MAXIMA_VISITA_MIN = 10   # Más tiempo sin fixes dentro del POI = visita nueva
+DURACION_MAXIMA_VIAJE = '3 hours'
+HORAS_POR_FRANJA = 3
+
+def crear_zonas_poi(radio_m=RADIO_POI_M):
+    """Carga los POIs como polígonos (buffer en metros) con índice GiST."""
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_ZONAS_POI} (
+            nombre TEXT PRIMARY KEY,
+            geom_utm geometry(Polygon, {EPSG_UTM}) NOT NULL
+        );
+        """))
+        conn.execute(text(f"TRUNCATE {TABLA_ZONAS_POI};"))
+        for poi in PUNTOS_INTERES:
+            conn.execute(text(f"""
+            INSERT INTO {TABLA_ZONAS_POI} (nombre, geom_utm)
+            VALUES (:nombre, ST_Buffer(ST_Transform(ST_SetSRID(ST_Point(:lon, :lat), 4326), {EPSG_UTM}), :radio))
+            """), {'nombre': poi['nombre'], 'lat': poi['lat'], 'lon': poi['lon'], 'radio': radio_m})
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{TABLA_ZONAS_POI}_geom ON {TABLA_ZONAS_POI} USING gist (geom_utm);"
+        ))
+    print(f"✅ {len(PUNTOS_INTERES)} zonas de POI con radio {radio_m} m en '{TABLA_ZONAS_POI}'")
+
+def crear_tablas_od():
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_VIAJES} (
+            placa TEXT NOT NULL,
+            origen TEXT NOT NULL,
+            destino TEXT NOT NULL,
+            salida TIMESTAMPTZ NOT NULL,
+            llegada TIMESTAMPTZ NOT NULL,
+            duracion_s DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (placa, salida)
+        );
+        """))
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_ESTADO} (
+            tabla_origen TEXT PRIMARY KEY,
+            ultima_ts TIMESTAMPTZ
+        );
+        """))
+        conn.execute(text(f"""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS {TABLA_MATRIZ} AS
+        SELECT
+            origen,
+            destino,
+            -- Hora de salida en Arequipa (UTC-5), no en el TimeZone de la sesión que refresca
+            (FLOOR(EXTRACT(HOUR FROM salida AT TIME ZONE INTERVAL '-05:00') / {HORAS_POR_FRANJA})
+                * {HORAS_POR_FRANJA})::int AS franja_hora,
+            COUNT(*) AS viajes,
+            AVG(duracion_s) / 60 AS minutos_promedio,
+            percentile_cont(0.50) WITHIN GROUP (ORDER BY duracion_s) / 60 AS minutos_p50,
+            percentile_cont(0.85) WITHIN GROUP (ORDER BY duracion_s) / 60 AS minutos_p85
+        FROM {TABLA_VIAJES}
+        GROUP BY 1, 2, 3
+        WITH NO DATA;
+        """))
+
+def sql_viajes(tabla):
+    """Detecta viajes entre POIs solo con SQL.
+
+    1. Fixes dentro de alguna zona de POI (join espacial con índice GiST).
+    2. Visitas: fixes consecutivos del mismo bus en el mismo POI (gaps & islands).
+    3. Viajes: salida de una visita y llegada a la siguiente visita en otro POI.
+    """
+    return f"""
+    WITH en_poi AS (
+        -- Si dos zonas se solapan, el fix se asigna al POI más cercano
+        SELECT DISTINCT ON (b.placa, b.ts) b.placa, b.ts, z.nombre AS poi
+        FROM {tabla} b
+        JOIN {TABLA_ZONAS_POI} z ON ST_Intersects(b.location_utm, z.geom_utm)
+        WHERE b.ts >= :desde
+        ORDER BY b.placa, b.ts, ST_Distance(b.location_utm, ST_Centroid(z.geom_utm))
+    ),
+    marcas AS (
+        SELECT
+            *,
+            CASE
+                WHEN LAG(poi) OVER w IS DISTINCT FROM poi THEN 1
+                WHEN ts - LAG(ts) OVER w > INTERVAL '{PAUSA_MAXIMA_VISITA_MIN} minutes' THEN 1
+                ELSE 0
+            END AS nueva_visita
+        FROM en_poi
+        WINDOW w AS (PARTITION BY placa ORDER BY ts)
+    ),
+    visitas AS (
+        SELECT placa, poi, MIN(ts) AS llegada, MAX(ts) AS salida
+        FROM (
+            SELECT *, SUM(nueva_visita) OVER (PARTITION BY placa ORDER BY ts) AS id_visita
+            FROM marcas
+        ) v
+        GROUP BY placa, poi, id_visita
+    ),
+    consecutivas AS (
+        SELECT
+            placa,
+            poi AS origen,
+            salida,
+            LEAD(poi) OVER w AS destino,
+            LEAD(llegada) OVER w AS llegada
+        FROM visitas
+        WINDOW w AS (PARTITION BY placa ORDER BY llegada)
+    )
+    SELECT
+        placa, origen, destino, salida, llegada,
+        EXTRACT(EPOCH FROM llegada - salida) AS duracion_s
+    FROM consecutivas
+    WHERE destino IS NOT NULL
+      AND destino <> origen
+      AND llegada - salida <= INTERVAL '{DURACION_MAXIMA_VIAJE}'
+    """
+
+@instrumentar
+def refrescar_viajes(tabla='bus_locations'):
+    """Recalcula viajes solo desde la marca de agua menos la duración máxima de viaje."""
+    crear_tablas_od()
+    t0 = time.perf_counter()
+
+    with engine.begin() as conn:
+        existe_zonas = conn.execute(text(f"SELECT COUNT(*) FROM {TABLA_ZONAS_POI}")).scalar()
+        if not existe_zonas:
+            raise RuntimeError(f"Tabla '{TABLA_ZONAS_POI}' vacía: ejecutar crear_zonas_poi()")
+
+        ultima_ts = conn.execute(
+            text(f"SELECT ultima_ts FROM {TABLA_ESTADO} WHERE tabla_origen = :tabla"), {'tabla': tabla}
+        ).scalar()
+        nueva_ts = conn.execute(text(f"SELECT MAX(ts) FROM {tabla}")).scalar()
+        if nueva_ts is None or (ultima_ts is not None and nueva_ts <= ultima_ts):
+            print("Sin datos nuevos: matriz OD al día.")
+            return 0
+
+        if ultima_ts is None:
+            desde = conn.execute(text(f"SELECT MIN(ts) FROM {tabla}")).scalar()
+        else:
+            # Un viaje que empezó antes de la marca de agua puede haber terminado después
+            desde = conn.execute(
+                text(f"SELECT CAST(:ts AS TIMESTAMPTZ) - INTERVAL '{DURACION_MAXIMA_VIAJE}'"), {'ts': ultima_ts}
+            ).scalar()
+
+        conn.execute(text(f"DELETE FROM {TABLA_VIAJES} WHERE salida >= :desde"), {'desde': desde})
+        resultado = conn.execute(text(f"""
+        INSERT INTO {TABLA_VIAJES} (placa, origen, destino, salida, llegada, duracion_s)
+        SELECT * FROM ({sql_viajes(tabla)}) viajes
+        WHERE salida >= :desde
+        ON CONFLICT (placa, salida) DO NOTHING;
+        """), {'desde': desde})
+
+        conn.execute(text(f"""
+        INSERT INTO {TABLA_ESTADO} (tabla_origen, ultima_ts) VALUES (:tabla, :ts)
+        ON CONFLICT (tabla_origen) DO UPDATE SET ultima_ts = EXCLUDED.ultima_ts;
+        """), {'tabla': tabla, 'ts': nueva_ts})
+
+        # La matriz se agrega sobre viajes (pocas filas), no sobre los fixes
+        conn.execute(text(f"REFRESH MATERIALIZED VIEW {TABLA_MATRIZ};"))
+
+    print(f"✅ {resultado.rowcount:,} viajes recalculados desde {desde} "
+          f"({time.perf_counter() - t0:.2f} s)")
+    return resultado.rowcount
+
+def consultar_matriz(franja_hora=None, estadistico='minutos_p50'):
+    """Matriz origen × destino de tiempos de viaje (minutos) para una franja horaria."""
+    sql_query = f"""
+    SELECT origen, destino, SUM(viajes) AS viajes,
+           SUM({estadistico} * viajes) / SUM(viajes) AS minutos
+    FROM {TABLA_MATRIZ}
+    WHERE %(franja)s IS NULL OR franja_hora = %(franja)s
+    GROUP BY origen, destino;
+    """
+    df = pd.read_sql(sql_query, engine, params={'franja': franja_hora})
+    nombres = [p['nombre'] for p in PUNTOS_INTERES]
+    return df.pivot(index='origen', columns='destino', values='minutos').reindex(index=nombres, columns=nombres)
+
+if __name__ == "__main__":
+    print("🧭 MATRIZ ORIGEN-DESTINO ENTRE PUNTOS DE INTERÉS")
+    print("=" * 50)
+
+    try:
+        crear_tablas_od()
+        with engine.connect() as conn:
+            zonas = conn.execute(text(f"SELECT to_regclass('{TABLA_ZONAS_POI}')")).scalar()
+        if zonas is None:
+            crear_zonas_poi()
+
+        refrescar_viajes()
+
+        pd.set_option('display.width', 200)
+        for franja in (6, 18):
+            print(f"\n⏱️ Mediana de minutos, salidas de {franja:02d}:00 a {franja + HORAS_POR_FRANJA:02d}:00")
+            print(consultar_matriz(franja).round(1))
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Se creó la columna 'location_utm'? (python features_espaciales.py)")
+        print("   • ¿Los datos están cargados en 'bus_locations'?")
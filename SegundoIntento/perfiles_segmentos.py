@@ -0,0 +1,209 @@
+import pandas as pd
+from sqlalchemy import create_engine, text
+from geoalchemy2 import Geometry, WKTElement
+from instrumentacion import instrumentar
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+TABLA_CALLES = 'calles_aristas'
+TABLA_PERFILES = 'velocidad_segmento'
+TABLA_ESTADO = 'velocidad_segmento_estado'
+INTERVALO_BUCKET = '1 hour'
+ATRASO_MAXIMO = '6 hours'  # Fixes que llegan tarde (cola en disco, cargas por lotes) se recogen en el refresco
+DISTANCIA_MAXIMA_M = 50  # Fixes más lejos de cualquier calle no se asignan
+
+def cargar_calles_postgis(G):
+    """Carga las calles del grafo en PostGIS con índice GiST sobre la geometría."""
+    from emparejamiento_mapa import cargar_aristas
+
+    print("Cargando calles del grafo a PostGIS...")
+    aristas = cargar_aristas(G).to_crs(epsg=4326)
+    aristas = aristas.rename(columns={'length': 'longitud_m', 'key': 'clave'})
+    aristas['geom'] = aristas.geometry.apply(lambda x: WKTElement(x.wkt, srid=4326))
+
+    final_df = pd.DataFrame(aristas[['edge_id', 'u', 'v', 'clave', 'highway', 'longitud_m', 'geom']])
+    final_df.to_sql(
+        TABLA_CALLES,
+        con=engine,
+        if_exists='replace',
+        index=False,
+        dtype={'geom': Geometry('LINESTRING', srid=4326)}
+    )
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {TABLA_CALLES} ADD PRIMARY KEY (edge_id);"))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{TABLA_CALLES}_geom ON {TABLA_CALLES} USING gist (geom);"
+        ))
+        conn.execute(text(f"ANALYZE {TABLA_CALLES};"))
+
+    print(f"✅ {len(final_df):,} calles cargadas en '{TABLA_CALLES}'")
+
+def crear_tablas_perfiles():
+    """Crea la tabla de perfiles por calle × bucket y su marca de agua."""
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_PERFILES} (
+            edge_id BIGINT NOT NULL,
+            bucket TIMESTAMPTZ NOT NULL,
+            registros INTEGER NOT NULL,
+            velocidad_promedio DOUBLE PRECISION,
+            velocidad_p10 DOUBLE PRECISION,
+            velocidad_p50 DOUBLE PRECISION,
+            velocidad_p85 DOUBLE PRECISION,
+            PRIMARY KEY (edge_id, bucket)
+        );
+        """))
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_ESTADO} (
+            tabla_origen TEXT PRIMARY KEY,
+            ultima_ts TIMESTAMPTZ
+        );
+        """))
+
+@instrumentar
+def refrescar_perfiles(tabla='bus_locations', intervalo=INTERVALO_BUCKET, atraso=ATRASO_MAXIMO):
+    """Recalcula los percentiles solo de los buckets que pueden haber recibido datos.
+
+    Los percentiles no se pueden combinar parcialmente, así que se rehace
+    cada bucket completo desde la marca de agua menos `atraso` en adelante:
+    un fix que llega tarde, pero dentro de ese margen, entra en su bucket
+    aunque MAX(ts) no haya avanzado. Los más atrasados necesitan un refresco
+    completo (borrar la fila de la tabla de estado).
+    La asignación fix -> calle usa un join LATERAL con el operador KNN `<->`,
+    que recorre el índice GiST de las calles.
+    """
+    crear_tablas_perfiles()
+
+    with engine.begin() as conn:
+        ultima_ts = conn.execute(
+            text(f"SELECT ultima_ts FROM {TABLA_ESTADO} WHERE tabla_origen = :tabla"),
+            {'tabla': tabla}
+        ).scalar()
+        nueva_ts = conn.execute(text(f"SELECT MAX(ts) FROM {tabla}")).scalar()
+
+        if nueva_ts is None:
+            print("Sin datos: no hay perfiles que calcular.")
+            return 0
+
+        if ultima_ts is None:
+            desde = conn.execute(
+                text(f"SELECT time_bucket(CAST(:intervalo AS INTERVAL), MIN(ts)) FROM {tabla}"),
+                {'intervalo': intervalo}
+            ).scalar()
+        else:
+            desde = conn.execute(
+                text("SELECT time_bucket(CAST(:intervalo AS INTERVAL), "
+                     "CAST(:ts AS TIMESTAMPTZ) - CAST(:atraso AS INTERVAL))"),
+                {'intervalo': intervalo, 'ts': ultima_ts, 'atraso': atraso}
+            ).scalar()
+
+        print(f"Refrescando perfiles desde {desde} (datos hasta {nueva_ts})...")
+
+        conn.execute(text(f"DELETE FROM {TABLA_PERFILES} WHERE bucket >= :desde"), {'desde': desde})
+        resultado = conn.execute(text(f"""
+        INSERT INTO {TABLA_PERFILES}
+        SELECT
+            c.edge_id,
+            time_bucket(CAST(:intervalo AS INTERVAL), b.ts) AS bucket,
+            COUNT(*) AS registros,
+            AVG(b.velocidad_kmh) AS velocidad_promedio,
+            percentile_cont(0.10) WITHIN GROUP (ORDER BY b.velocidad_kmh) AS velocidad_p10,
+            percentile_cont(0.50) WITHIN GROUP (ORDER BY b.velocidad_kmh) AS velocidad_p50,
+            percentile_cont(0.85) WITHIN GROUP (ORDER BY b.velocidad_kmh) AS velocidad_p85
+        FROM {tabla} b
+        CROSS JOIN LATERAL (
+            SELECT a.edge_id, a.geom
+            FROM {TABLA_CALLES} a
+            ORDER BY a.geom <-> b.location
+            LIMIT 1
+        ) c
+        WHERE b.ts >= :desde
+          AND ST_DWithin(c.geom::geography, b.location::geography, :distancia_maxima)
+        GROUP BY 1, 2;
+        """), {'intervalo': intervalo, 'desde': desde, 'distancia_maxima': DISTANCIA_MAXIMA_M})
+
+        conn.execute(text(f"""
+        INSERT INTO {TABLA_ESTADO} (tabla_origen, ultima_ts) VALUES (:tabla, :ts)
+        ON CONFLICT (tabla_origen) DO UPDATE SET ultima_ts = EXCLUDED.ultima_ts;
+        """), {'tabla': tabla, 'ts': nueva_ts})
+
+    print(f"✅ {resultado.rowcount:,} filas calle × bucket actualizadas en '{TABLA_PERFILES}'")
+    return resultado.rowcount
+
+def consultar_perfil_segmento(edge_id, desde=None, hasta=None):
+    """Perfil de velocidades de una calle (búsqueda por clave primaria)."""
+    sql_query = f"""
+    SELECT p.*, a.highway, a.longitud_m
+    FROM {TABLA_PERFILES} p
+    JOIN {TABLA_CALLES} a USING (edge_id)
+    WHERE p.edge_id = %(edge_id)s
+      AND (%(desde)s IS NULL OR p.bucket >= %(desde)s)
+      AND (%(hasta)s IS NULL OR p.bucket < %(hasta)s)
+    ORDER BY p.bucket;
+    """
+    return pd.read_sql(sql_query, engine, params={'edge_id': int(edge_id), 'desde': desde, 'hasta': hasta})
+
+def consultar_perfil_en_punto(lat, lon, desde=None, hasta=None):
+    """Perfil de la calle más cercana a un punto (KNN sobre el índice GiST)."""
+    sql_calle = f"""
+    SELECT edge_id
+    FROM {TABLA_CALLES}
+    ORDER BY geom <-> ST_SetSRID(ST_Point(%(lon)s, %(lat)s), 4326)
+    LIMIT 1;
+    """
+    calle = pd.read_sql(sql_calle, engine, params={'lat': lat, 'lon': lon})
+    if calle.empty:
+        return calle
+    return consultar_perfil_segmento(calle['edge_id'].iloc[0], desde, hasta)
+
+def resumen_por_tipo_calle():
+    """Velocidad por tipo de calle (atributo `highway` del grafo) y hora del día."""
+    sql_query = f"""
+    SELECT
+        a.highway AS tipo_calle,
+        -- Hora en Arequipa (UTC-5), no en el TimeZone de la sesión
+        EXTRACT(HOUR FROM p.bucket AT TIME ZONE INTERVAL '-05:00') AS hora,
+        SUM(p.registros) AS registros,
+        SUM(p.velocidad_promedio * p.registros) / SUM(p.registros) AS velocidad_promedio,
+        AVG(p.velocidad_p50) AS velocidad_mediana
+    FROM {TABLA_PERFILES} p
+    JOIN {TABLA_CALLES} a USING (edge_id)
+    GROUP BY 1, 2
+    ORDER BY 1, 2;
+    """
+    return pd.read_sql(sql_query, engine)
+
+if __name__ == "__main__":
+    print("🛣️ PERFILES DE VELOCIDAD POR CALLE")
+    print("=" * 50)
+
+    try:
+        with engine.connect() as conn:
+            existe = conn.execute(text(f"SELECT to_regclass('{TABLA_CALLES}')")).scalar()
+
+        if existe is None:
+            from generador_datos_realistas import cargar_red_calles_cacheada
+            cargar_calles_postgis(cargar_red_calles_cacheada())
+
+        refrescar_perfiles()
+
+        resumen = resumen_por_tipo_calle()
+        print(f"\n📊 Velocidad por tipo de calle:")
+        for tipo, grupo in resumen.groupby('tipo_calle'):
+            print(f"   {tipo}: {grupo['velocidad_promedio'].mean():.1f} km/h "
+                  f"({int(grupo['registros'].sum()):,} registros)")
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Está PostgreSQL corriendo con PostGIS y TimescaleDB?")
+        print("   • ¿Los datos están cargados en 'bus_locations'?")
@@ -0,0 +1,204 @@
+import time
+from collections import OrderedDict
+import pandas as pd
+from sqlalchemy import create_engine, text
+from instrumentacion import instrumentar, registrar_filas
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+TABLA_ULTIMA_POSICION = 'bus_latest'
+TABLA_HISTORIAL = 'bus_locations'    # Tabla cuya última posición refleja bus_latest
+TTL_CACHE_S = 5.0
+MAX_BUSES_CACHE = 10000
+
+class CachePosiciones:
+    """Cache LRU con expiración (TTL) de la última posición por placa."""
+
+    def __init__(self, ttl=TTL_CACHE_S, max_elementos=MAX_BUSES_CACHE):
+        self.ttl = ttl
+        self.max_elementos = max_elementos
+        self._datos = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, placa):
+        entrada = self._datos.get(placa)
+        if entrada is None or time.monotonic() - entrada[0] > self.ttl:
+            self.fallos += 1
+            return None
+        self._datos.move_to_end(placa)
+        self.aciertos += 1
+        return entrada[1]
+
+    def guardar(self, placa, posicion):
+        self._datos[placa] = (time.monotonic(), posicion)
+        self._datos.move_to_end(placa)
+        while len(self._datos) > self.max_elementos:
+            self._datos.popitem(last=False)
+
+    def invalidar(self, placa=None):
+        if placa is None:
+            self._datos.clear()
+        else:
+            self._datos.pop(placa, None)
+
+cache_posiciones = CachePosiciones()
+_tabla_creada = False
+
+def crear_tabla_ultima_posicion():
+    """Crea la tabla con una fila por bus."""
+    global _tabla_creada
+    if _tabla_creada:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_ULTIMA_POSICION} (
+            placa TEXT PRIMARY KEY,
+            ts TIMESTAMPTZ NOT NULL,
+            velocidad_kmh DOUBLE PRECISION,
+            location geometry(Point, 4326)
+        );
+        """))
+    _tabla_creada = True
+
+@instrumentar
+def reconstruir_ultima_posicion(tabla=TABLA_HISTORIAL):
+    """Recalcula `bus_latest` desde el historial con DISTINCT ON.
+
+    El índice (placa, ts DESC) permite leer solo la primera fila de cada bus
+    en lugar de ordenar todo el historial.
+    """
+    crear_tabla_ultima_posicion()
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{tabla}_placa_ts ON {tabla} (placa, ts DESC);"
+        ))
+        resultado = conn.execute(text(f"""
+        INSERT INTO {TABLA_ULTIMA_POSICION} (placa, ts, velocidad_kmh, location)
+        SELECT DISTINCT ON (placa) placa, ts, velocidad_kmh, location
+        FROM {tabla}
+        ORDER BY placa, ts DESC
+        ON CONFLICT (placa) DO UPDATE SET
+            ts = EXCLUDED.ts,
+            velocidad_kmh = EXCLUDED.velocidad_kmh,
+            location = EXCLUDED.location
+        WHERE {TABLA_ULTIMA_POSICION}.ts < EXCLUDED.ts;
+        """))
+    cache_posiciones.invalidar()
+    print(f"✅ '{TABLA_ULTIMA_POSICION}' reconstruida: {resultado.rowcount} buses "
+          f"({time.perf_counter() - t0:.2f} s)")
+
+def actualizar_ultima_posicion(df):
+    """Upsert del último fix de cada bus de un lote recién escrito.
+
+    Lo llaman los caminos de escritura de gestor_cargas (cargas, ingesta,
+    simulador) con las columnas de staging: placa, latitud, longitud,
+    velocidad_kmh y ts con zona.
+    """
+    from psycopg2.extras import execute_values
+
+    ultimos = df.sort_values('ts', kind='stable').drop_duplicates('placa', keep='last')
+    filas = list(zip(ultimos['placa'].tolist(), ultimos['latitud'].astype(float).tolist(),
+                     ultimos['longitud'].astype(float).tolist(),
+                     ultimos['velocidad_kmh'].astype(float).tolist(), ultimos['ts'].dt.to_pydatetime()))
+
+    crear_tabla_ultima_posicion()
+    conexion = engine.raw_connection()
+    try:
+        cursor = conexion.cursor()
+        execute_values(cursor, f"""
+        INSERT INTO {TABLA_ULTIMA_POSICION} (placa, ts, velocidad_kmh, location)
+        SELECT v.placa, v.ts::timestamptz, v.velocidad, ST_SetSRID(ST_Point(v.lon, v.lat), 4326)
+        FROM (VALUES %s) AS v (placa, lat, lon, velocidad, ts)
+        ON CONFLICT (placa) DO UPDATE SET
+            ts = EXCLUDED.ts,
+            velocidad_kmh = EXCLUDED.velocidad_kmh,
+            location = EXCLUDED.location
+        WHERE {TABLA_ULTIMA_POSICION}.ts < EXCLUDED.ts;
+        """, filas)
+        conexion.commit()
+    finally:
+        conexion.close()
+
+    # La cache de este proceso queda al día sin ir a la BD; en otros procesos
+    # la entrada se renueva desde bus_latest al vencer el TTL
+    for placa, lat, lon, velocidad, ts in filas:
+        actual = cache_posiciones.obtener(placa)
+        if actual is None or actual['ts'] < ts:
+            cache_posiciones.guardar(placa, {'placa': placa, 'latitud': lat, 'longitud': lon,
+                                             'velocidad_kmh': velocidad, 'ts': ts})
+
+def obtener_posicion(placa):
+    """Última posición conocida de un bus, servida desde la cache si está fresca."""
+    posicion = cache_posiciones.obtener(placa)
+    if posicion is not None:
+        return posicion
+
+    sql_query = f"""
+    SELECT placa, ST_Y(location) AS latitud, ST_X(location) AS longitud, velocidad_kmh, ts
+    FROM {TABLA_ULTIMA_POSICION}
+    WHERE placa = %(placa)s;
+    """
+    df = pd.read_sql(sql_query, engine, params={'placa': placa})
+    if df.empty:
+        return None
+    posicion = df.iloc[0].to_dict()
+    cache_posiciones.guardar(placa, posicion)
+    return posicion
+
+def consultar_flota_actual():
+    """Posición actual de toda la flota: una fila por bus, sin tocar el historial."""
+    sql_query = f"""
+    SELECT placa, ST_Y(location) AS latitud, ST_X(location) AS longitud, velocidad_kmh, ts
+    FROM {TABLA_ULTIMA_POSICION}
+    ORDER BY placa;
+    """
+    df = pd.read_sql(sql_query, engine)
+    for posicion in df.to_dict('records'):
+        cache_posiciones.guardar(posicion['placa'], posicion)
+    return df
+
+@instrumentar
+def crear_mapa_flota_actual():
+    """Mapa con la última posición de cada bus."""
+    import folium
+
+    print("📍 Creando mapa de la flota actual...")
+    df = consultar_flota_actual()
+    registrar_filas(len(df))
+    print(f"Buses en la flota: {len(df)}")
+
+    mapa = folium.Map(location=[-16.4009, -71.5378], zoom_start=13, tiles='OpenStreetMap')
+
+    for _, row in df.iterrows():
+        color = 'red' if row['velocidad_kmh'] < 15 else ('orange' if row['velocidad_kmh'] < 25 else 'green')
+        folium.CircleMarker(
+            location=[row['latitud'], row['longitud']],
+            radius=6,
+            popup=f"{row['placa']}: {row['velocidad_kmh']:.0f} km/h<br>{row['ts']}",
+            color=color,
+            fill=True,
+            fillOpacity=0.8
+        ).add_to(mapa)
+
+    archivo = "mapa_flota_actual.html"
+    mapa.save(archivo)
+    print(f"✅ Mapa de flota guardado: {archivo}")
+    return archivo
+
+if __name__ == "__main__":
+    try:
+        reconstruir_ultima_posicion()
+        archivo_mapa = crear_mapa_flota_actual()
+        print(f"🎉 Mapa creado: {archivo_mapa}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
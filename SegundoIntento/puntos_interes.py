@@ -0,0 +1,22 @@
+# Puntos de interés de Arequipa usados por el generador, el modelo y los mapas
+PUNTOS_INTERES = [
+    {"nombre": "Plaza de Armas", "lat": -16.3989, "lon": -71.5367, "icono": "star"},
+    {"nombre": "Mall Plaza Cayma", "lat": -16.3795, "lon": -71.5492, "icono": "shopping-cart"},
+    {"nombre": "Terminal Terrestre", "lat": -16.4195, "lon": -71.5179, "icono": "road"},
+    {"nombre": "Óvalo Miraflores", "lat": -16.4113, "lon": -71.5235, "icono": "circle"},
+    {"nombre": "Estadio Melgar", "lat": -16.4150, "lon": -71.5280, "icono": "futbol-o"},
+    {"nombre": "Universidad San Agustín", "lat": -16.4068, "lon": -71.5223, "icono": "graduation-cap"},
+    {"nombre": "Mercado San Camilo", "lat": -16.4021, "lon": -71.5341, "icono": "shopping-bag"},
+    {"nombre": "Parque Lambramani", "lat": -16.4067, "lon": -71.5381, "icono": "tree"}
+]
+
+def buscar_punto(nombre):
+    """Devuelve el punto de interés con ese nombre."""
+    for punto in PUNTOS_INTERES:
+        if punto["nombre"] == nombre:
+            return punto
+    raise KeyError(f"Punto de interés desconocido: {nombre}")
+
+def seleccionar_puntos(nombres):
+    """Subconjunto de puntos de interés, en el orden pedido."""
+    return [buscar_punto(nombre) for nombre in nombres]
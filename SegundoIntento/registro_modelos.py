@@ -0,0 +1,244 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+import joblib
+
+DIRECTORIO_MODELOS = 'modelos'
+ARCHIVO_PRODUCCION = 'produccion.json'
+ARCHIVO_METADATA = 'metadata.json'
+ARCHIVO_COMPRIMIDO = 'modelo.joblib.gz'
+ARCHIVO_SERVIR = 'modelo_servir.joblib'   # Sin comprimir: se puede cargar con mmap
+COMPRESION = ('gzip', 3)
+
+LIBRERIAS = ['numpy', 'pandas', 'sklearn', 'joblib']
+
+def _sha256(ruta, bloque=1 << 20):
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for parte in iter(lambda: f.read(bloque), b''):
+            h.update(parte)
+    return h.hexdigest()
+
+def _hash_esquema(feature_columns):
+    return hashlib.sha256('\n'.join(feature_columns).encode()).hexdigest()[:16]
+
+def _escribir_json_atomico(ruta, datos):
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+def _leer_json(ruta):
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+def _versiones_librerias():
+    versiones = {'python': platform.python_version()}
+    for nombre in LIBRERIAS:
+        try:
+            versiones[nombre] = __import__(nombre).__version__
+        except ImportError:
+            versiones[nombre] = None
+    return versiones
+
+def _commit_codigo():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def directorio_version(version, directorio=DIRECTORIO_MODELOS):
+    return os.path.join(directorio, version)
+
+def listar_versiones(directorio=DIRECTORIO_MODELOS):
+    if not os.path.isdir(directorio):
+        return []
+    return sorted(v for v in os.listdir(directorio)
+                  if os.path.exists(os.path.join(directorio, v, ARCHIVO_METADATA)))
+
+def leer_metadata(version, directorio=DIRECTORIO_MODELOS):
+    return _leer_json(os.path.join(directorio_version(version, directorio), ARCHIVO_METADATA))
+
+def registrar_modelo(model, scaler, feature_columns, metricas, ventana=None,
+                     descripcion='', directorio=DIRECTORIO_MODELOS):
+    """Guarda una versión nueva (comprimida) con su esquema, métricas y procedencia."""
+    versiones = listar_versiones(directorio)
+    numero = int(versiones[-1][1:]) + 1 if versiones else 1
+    version = f"v{numero:04d}"
+    ruta = directorio_version(version, directorio)
+    os.makedirs(ruta)
+
+    archivo = os.path.join(ruta, ARCHIVO_COMPRIMIDO)
+    paquete = {'model': model, 'scaler': scaler, 'feature_columns': list(feature_columns)}
+    joblib.dump(paquete, archivo, compress=COMPRESION)
+
+    metadata = {
+        'version': version,
+        'creado': datetime.now().isoformat(timespec='seconds'),
+        'descripcion': descripcion,
+        'tipo_modelo': type(model).__name__,
+        'feature_columns': list(feature_columns),
+        'hash_esquema': _hash_esquema(feature_columns),
+        'ventana_entrenamiento': ventana or {},
+        'metricas': metricas,
+        'librerias': _versiones_librerias(),
+        'commit_codigo': _commit_codigo(),
+        'sha256': _sha256(archivo),
+        'bytes_comprimido': os.path.getsize(archivo),
+    }
+    _escribir_json_atomico(os.path.join(ruta, ARCHIVO_METADATA), metadata)
+    print(f"✅ Modelo registrado como {version} ({metadata['bytes_comprimido'] / 1e6:.1f} MB comprimido)")
+    return version
+
+def _preparar_para_servir(version, directorio=DIRECTORIO_MODELOS):
+    """Descomprime una vez la versión a un archivo que joblib puede mapear en memoria."""
+    ruta = directorio_version(version, directorio)
+    destino = os.path.join(ruta, ARCHIVO_SERVIR)
+    if os.path.exists(destino):
+        return destino
+
+    metadata = leer_metadata(version, directorio)
+    archivo = os.path.join(ruta, ARCHIVO_COMPRIMIDO)
+    if _sha256(archivo) != metadata['sha256']:
+        raise ValueError(f"El artefacto de {version} no coincide con su hash: archivo corrupto o modificado")
+
+    paquete = joblib.load(archivo)
+    temporal = f"{destino}.tmp"
+    joblib.dump(paquete, temporal)
+    os.replace(temporal, destino)
+    return destino
+
+def _leer_produccion(directorio=DIRECTORIO_MODELOS):
+    ruta = os.path.join(directorio, ARCHIVO_PRODUCCION)
+    if not os.path.exists(ruta):
+        return {'version': None, 'historial': []}
+    return _leer_json(ruta)
+
+def version_produccion(directorio=DIRECTORIO_MODELOS):
+    return _leer_produccion(directorio)['version']
+
+def promover_modelo(version, directorio=DIRECTORIO_MODELOS):
+    """Pone una versión en producción; la anterior queda en el historial para revertir."""
+    if version not in listar_versiones(directorio):
+        raise ValueError(f"Versión inexistente: {version}")
+    _preparar_para_servir(version, directorio)
+
+    estado = _leer_produccion(directorio)
+    if estado['version'] == version:
+        print(f"{version} ya está en producción")
+        return
+    if estado['version'] is not None:
+        estado['historial'].append(estado['version'])
+    estado['version'] = version
+    _escribir_json_atomico(os.path.join(directorio, ARCHIVO_PRODUCCION), estado)
+    print(f"🚀 {version} en producción")
+
+def revertir_modelo(directorio=DIRECTORIO_MODELOS):
+    """Vuelve a la versión que estaba en producción antes de la actual."""
+    estado = _leer_produccion(directorio)
+    if not estado['historial']:
+        raise ValueError("No hay versión anterior a la cual revertir")
+    anterior = estado['historial'].pop()
+    _preparar_para_servir(anterior, directorio)
+    print(f"↩️ Revirtiendo {estado['version']} → {anterior}")
+    estado['version'] = anterior
+    _escribir_json_atomico(os.path.join(directorio, ARCHIVO_PRODUCCION), estado)
+    return anterior
+
+def cargar_modelo_produccion(feature_columns=None, compacto=False, directorio=DIRECTORIO_MODELOS,
+                             permitir_librerias=False):
+    """Carga el modelo en producción desde la copia sin comprimir (mmap).
+
+    Si se pasa `feature_columns`, deben coincidir exactamente (nombres y orden)
+    con el esquema con que se entrenó; si no, se lanza ValueError. Lo mismo si
+    las librerías instaladas no son las del entrenamiento, salvo que se pida
+    `permitir_librerias`.
+    """
+    version = version_produccion(directorio)
+    if version is None:
+        raise ValueError(f"No hay modelo en producción en '{directorio}' "
+                         "(python registro_modelos.py promover <version>)")
+    return cargar_version(version, feature_columns, compacto, directorio, permitir_librerias)
+
+def cargar_version(version, feature_columns=None, compacto=False, directorio=DIRECTORIO_MODELOS,
+                   permitir_librerias=False):
+    """Carga una versión concreta; con `compacto=True` usa el bosque aplanado si existe."""
+    metadata = leer_metadata(version, directorio)
+    esquema = metadata['feature_columns']
+    if feature_columns is not None and list(feature_columns) != esquema:
+        faltantes = [c for c in esquema if c not in feature_columns]
+        sobrantes = [c for c in feature_columns if c not in esquema]
+        raise ValueError(f"Esquema de features distinto al de {version}: "
+                         f"faltan {faltantes}, sobran {sobrantes}"
+                         + ("" if faltantes or sobrantes else ", orden distinto"))
+
+    instaladas = _versiones_librerias()
+    distintas = [f"{nombre} {entrenada} (instalada {instaladas.get(nombre)})"
+                 for nombre, entrenada in metadata['librerias'].items() if instaladas.get(nombre) != entrenada]
+    if distintas:
+        # Un pickle de sklearn de otra versión puede cargar y predecir distinto sin avisar
+        if not permitir_librerias:
+            raise ValueError(f"{version} se entrenó con {', '.join(distintas)}: reentrenar, "
+                             "o cargar con permitir_librerias=True (--permitir-librerias)")
+        print(f"⚠️ {version} se entrenó con {', '.join(distintas)}")
+
+    if compacto:
+        from compactar_modelo import cargar_compacto
+        model, scaler = cargar_compacto(version, directorio)
+        return model, scaler, esquema
+
+    paquete = joblib.load(_preparar_para_servir(version, directorio), mmap_mode='r')
+    if paquete['feature_columns'] != esquema:
+        raise ValueError(f"El artefacto de {version} no coincide con el esquema de su metadata")
+    return paquete['model'], paquete['scaler'], paquete['feature_columns']
+
+def mostrar_registro(directorio=DIRECTORIO_MODELOS):
+    produccion = version_produccion(directorio)
+    print(f"📦 REGISTRO DE MODELOS ({directorio})")
+    print("-" * 50)
+    for version in listar_versiones(directorio):
+        m = leer_metadata(version, directorio)
+        marca = "🚀" if version == produccion else "  "
+        metricas = ', '.join(f"{k}={v:.3f}" for k, v in m['metricas'].items())
+        print(f"{marca} {version} {m['creado']} {m['tipo_modelo']} "
+              f"({len(m['feature_columns'])} features, esquema {m['hash_esquema']}) {metricas}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Registro de versiones del modelo de velocidad")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('listar', help="Versiones registradas")
+    p_promover = sub.add_parser('promover', help="Poner una versión en producción")
+    p_promover.add_argument('version')
+    sub.add_parser('revertir', help="Volver a la versión de producción anterior")
+    p_cargar = sub.add_parser('cargar', help="Medir el tiempo de carga del modelo en producción")
+    p_cargar.add_argument('--permitir-librerias', action='store_true',
+                          help="Cargar aunque las librerías no sean las del entrenamiento")
+    args = parser.parse_args()
+
+    try:
+        if args.comando == 'listar':
+            mostrar_registro()
+        elif args.comando == 'promover':
+            promover_modelo(args.version)
+        elif args.comando == 'revertir':
+            revertir_modelo()
+        elif args.comando == 'cargar':
+            t0 = time.perf_counter()
+            model, scaler, feature_columns = cargar_modelo_produccion(
+                permitir_librerias=args.permitir_librerias
+            )
+            print(f"⚡ {version_produccion()} cargado en {(time.perf_counter() - t0) * 1000:.0f} ms "
+                  f"({len(feature_columns)} features)")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Se entrenó algún modelo? (python analisis_predictivo_mejorado.py)")
+        print(f"   • ¿Existe el directorio '{DIRECTORIO_MODELOS}'?")
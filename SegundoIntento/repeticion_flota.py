@@ -0,0 +1,274 @@
+import argparse
+import glob
+import json
+import os
+import time
+import pandas as pd
+import folium
+from branca.element import MacroElement
+from jinja2 import Template
+from sqlalchemy import create_engine, text
+from instrumentacion import instrumentar, registrar_filas
+from calidad_datos import normalizar_ts
+
+# --- CONFIGURACIÓN DE LA CONEXIÓN ---
+db_user = 'postgres'
+db_password = '15243'
+db_host = 'localhost'
+db_port = '5432'
+db_name = 'MiPrimeraDB'
+
+db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+engine = create_engine(db_connection_str)
+
+INTERVALO_CUADRO = '1 minute'
+CUADROS_POR_VENTANA = 60        # Una ventana = un archivo que el navegador pide al acercarse
+DIRECTORIO_VENTANAS = 'repeticion_flota'
+ARCHIVO_MAPA = 'mapa_repeticion_flota.html'
+
+# Una fila por bus y cuadro: la última posición del bus dentro del bucket.
+# El tamaño del resultado es cuadros × flota, no la cantidad de fixes crudos.
+SQL_CUADROS = """
+SELECT time_bucket(CAST(:intervalo AS INTERVAL), ts) AS cuadro,
+       placa,
+       ST_Y(last(location, ts)) AS latitud,
+       ST_X(last(location, ts)) AS longitud,
+       last(velocidad_kmh, ts) AS velocidad_kmh,
+       COUNT(*) AS fixes
+FROM {tabla}
+WHERE ts >= :desde AND ts < :hasta
+GROUP BY cuadro, placa
+ORDER BY cuadro, placa;
+"""
+
+def rango_ultimo_dia(tabla='bus_locations'):
+    """Las últimas 24 h con datos de la tabla."""
+    with engine.connect() as conn:
+        hasta = conn.execute(text(f"SELECT MAX(ts) FROM {tabla}")).scalar()
+    if hasta is None:
+        raise ValueError(f"La tabla '{tabla}' no tiene datos")
+    hasta = pd.Timestamp(hasta)
+    return hasta - pd.Timedelta(days=1), hasta
+
+def consultar_cuadros(desde, hasta, intervalo=INTERVALO_CUADRO, tabla='bus_locations'):
+    """Posición de cada bus en cada cuadro de [desde, hasta) agregada con time_bucket."""
+    return pd.read_sql(text(SQL_CUADROS.format(tabla=tabla)), engine, params={
+        'intervalo': intervalo, 'desde': pd.Timestamp(desde).to_pydatetime(),
+        'hasta': pd.Timestamp(hasta).to_pydatetime(),
+    })
+
+def ventana_a_json(df, inicio, paso):
+    """Comprime los cuadros de una ventana: placas una vez y filas [placa, lat, lon, km/h]."""
+    df = df.dropna(subset=['latitud', 'longitud'])
+    placas = pd.Series(df['placa'].unique())
+    indice = {placa: i for i, placa in enumerate(placas)}
+    desplazamiento = ((normalizar_ts(df['cuadro']) - inicio) // paso).astype(int)
+    filas = zip(desplazamiento, df['placa'].map(indice), df['latitud'].round(5),
+                df['longitud'].round(5), df['velocidad_kmh'].fillna(0).round().astype(int))
+    cuadros = {}
+    for k, p, lat, lon, vel in filas:
+        cuadros.setdefault(int(k), []).append([int(p), float(lat), float(lon), int(vel)])
+    return {'placas': placas.tolist(), 'cuadros': cuadros}
+
+@instrumentar
+def exportar_ventanas(desde, hasta, intervalo=INTERVALO_CUADRO, cuadros_por_ventana=CUADROS_POR_VENTANA,
+                      tabla='bus_locations', directorio=DIRECTORIO_VENTANAS):
+    """Consulta y escribe una ventana de cuadros por archivo.
+
+    Cada ventana se pide a la BD por separado, así la memoria del proceso
+    queda acotada a una ventana aunque se exporte un mes. Los archivos son
+    JS (`cargarVentana(i, {...})`) y no JSON para que la página los cargue con
+    <script> también abierta desde disco, donde fetch() está bloqueado.
+    """
+    paso = pd.Timedelta(intervalo)
+    # Instantes con zona: --desde/--hasta sin offset son hora local, igual que los CSV
+    desde, hasta = normalizar_ts([desde, hasta])
+    desde = desde.floor(paso)
+    total_cuadros = max(1, int(-(-(hasta - desde) // paso)))
+    n_ventanas = -(-total_cuadros // cuadros_por_ventana)
+
+    os.makedirs(directorio, exist_ok=True)
+    for viejo in glob.glob(os.path.join(directorio, 'ventana_*.js')):
+        os.remove(viejo)
+
+    filas = fixes = bytes_escritos = 0
+    for i in range(n_ventanas):
+        inicio = desde + i * cuadros_por_ventana * paso
+        fin = min(inicio + cuadros_por_ventana * paso, desde + total_cuadros * paso)
+        df = consultar_cuadros(inicio, fin, intervalo, tabla)
+        filas += len(df)
+        fixes += int(df['fixes'].sum())
+        contenido = f"cargarVentana({i}, {json.dumps(ventana_a_json(df, inicio, paso), separators=(',', ':'))});"
+        with open(os.path.join(directorio, f'ventana_{i:04d}.js'), 'w', encoding='utf-8') as f:
+            f.write(contenido)
+        bytes_escritos += len(contenido)
+
+    registrar_filas(fixes)
+    print(f"🎞️ {total_cuadros} cuadros de {intervalo} en {n_ventanas} ventanas: {filas:,} posiciones "
+          f"de {fixes:,} fixes ({bytes_escritos / 1024 ** 2:.1f} MB)")
+    return {'inicio': desde, 'paso': paso, 'cuadros': total_cuadros, 'ventanas': n_ventanas}
+
+# Control de tiempo y carga perezosa de ventanas. Solo se mantienen en memoria
+# la ventana actual, la anterior y las dos siguientes; los marcadores se crean
+# una vez por bus y se mueven con setLatLng sobre un renderer canvas.
+JS_REPETICION = """
+(function() {
+    var mapa = {{ this._parent.get_name() }};
+    var CONFIG = {{ this.config }};
+    var ventanas = {}, pendientes = {}, marcadores = {};
+    var renderer = L.canvas({padding: 0.5});
+
+    var control = L.control({position: 'bottomleft'});
+    control.onAdd = function() {
+        var div = L.DomUtil.create('div');
+        div.style.cssText = 'background:white;padding:8px 12px;border-radius:6px;' +
+            'box-shadow:0 1px 5px rgba(0,0,0,.4);font:13px sans-serif;width:420px';
+        div.innerHTML = '<button id="rep-play" style="width:34px">▶</button> ' +
+            '<span id="rep-hora"></span> <span id="rep-buses" style="color:#666"></span><br>' +
+            '<input id="rep-slider" type="range" min="0" max="' + (CONFIG.cuadros - 1) +
+            '" value="0" style="width:100%">';
+        L.DomEvent.disableClickPropagation(div);
+        return div;
+    };
+    control.addTo(mapa);
+    var slider = document.getElementById('rep-slider');
+    var boton = document.getElementById('rep-play');
+
+    function color(vel) {
+        return vel < 15 ? 'red' : (vel < 25 ? 'orange' : 'green');
+    }
+
+    function pedir(i) {
+        if (i < 0 || i >= CONFIG.ventanas || ventanas[i] || pendientes[i]) return;
+        pendientes[i] = true;
+        var s = document.createElement('script');
+        s.src = CONFIG.directorio + '/ventana_' + String(i).padStart(4, '0') + '.js';
+        s.onload = function() { s.remove(); };
+        s.onerror = function() { delete pendientes[i]; s.remove(); };
+        document.head.appendChild(s);
+    }
+
+    function podar(actual) {
+        Object.keys(ventanas).forEach(function(i) {
+            if (i < actual - 1 || i > actual + 2) delete ventanas[i];
+        });
+    }
+
+    function dibujar() {
+        var k = +slider.value;
+        var w = Math.floor(k / CONFIG.por_ventana);
+        pedir(w); pedir(w + 1); pedir(w + 2);
+        var hora = new Date((CONFIG.inicio + CONFIG.offset + k * CONFIG.paso) * 1000);
+        document.getElementById('rep-hora').textContent = hora.toISOString().replace('T', ' ').slice(0, 19);
+        var v = ventanas[w];
+        if (!v) return;
+        var filas = v.cuadros[k - w * CONFIG.por_ventana] || [];
+        var vistos = {};
+        filas.forEach(function(f) {
+            var placa = v.placas[f[0]];
+            var m = marcadores[placa];
+            if (!m) {
+                m = L.circleMarker([f[1], f[2]], {radius: 4, weight: 1, renderer: renderer})
+                    .bindTooltip('').addTo(mapa);
+                marcadores[placa] = m;
+            }
+            m.setLatLng([f[1], f[2]]);
+            m.setStyle({color: color(f[3]), fillColor: color(f[3]), opacity: 1, fillOpacity: 0.8});
+            m.setTooltipContent(placa + ': ' + f[3] + ' km/h');
+            vistos[placa] = true;
+        });
+        Object.keys(marcadores).forEach(function(placa) {
+            if (!vistos[placa]) marcadores[placa].setStyle({opacity: 0, fillOpacity: 0});
+        });
+        document.getElementById('rep-buses').textContent = filas.length + ' buses';
+        podar(w);
+    }
+
+    window.cargarVentana = function(i, datos) {
+        ventanas[i] = datos;
+        delete pendientes[i];
+        if (i === Math.floor(+slider.value / CONFIG.por_ventana)) dibujar();
+    };
+
+    var reproduccion = null;
+    boton.onclick = function() {
+        if (reproduccion) {
+            clearInterval(reproduccion);
+            reproduccion = null;
+            boton.textContent = '▶';
+            return;
+        }
+        boton.textContent = '⏸';
+        reproduccion = setInterval(function() {
+            slider.value = (+slider.value + 1) % CONFIG.cuadros;
+            dibujar();
+        }, CONFIG.ms_por_cuadro);
+    };
+    slider.oninput = dibujar;
+    dibujar();
+})();
+"""
+
+class ControlRepeticion(MacroElement):
+    """Inserta el control de tiempo en el script del mapa, después de crearlo."""
+
+    _template = Template("{% macro script(this, kwargs) %}" + JS_REPETICION + "{% endmacro %}")
+
+    def __init__(self, config):
+        super().__init__()
+        self._name = 'ControlRepeticion'
+        self.config = json.dumps(config)
+
+@instrumentar
+def crear_mapa_repeticion(desde=None, hasta=None, intervalo=INTERVALO_CUADRO,
+                          cuadros_por_ventana=CUADROS_POR_VENTANA, tabla='bus_locations',
+                          ms_por_cuadro=200):
+    """Mapa con control de tiempo para reproducir la flota entre `desde` y `hasta`.
+
+    El HTML solo lleva el control; las posiciones están en las ventanas de
+    `repeticion_flota/`, que deben quedar junto al HTML.
+    """
+    print("🎬 Creando repetición de la flota...")
+    if desde is None or hasta is None:
+        desde, hasta = rango_ultimo_dia(tabla)
+    t0 = time.perf_counter()
+    directorio = os.path.join(os.path.dirname(os.path.abspath(ARCHIVO_MAPA)), DIRECTORIO_VENTANAS)
+    info = exportar_ventanas(desde, hasta, intervalo, cuadros_por_ventana, tabla, directorio)
+
+    mapa = folium.Map(location=[-16.4009, -71.5378], zoom_start=13, tiles='OpenStreetMap', prefer_canvas=True)
+    config = {
+        # Epoch del primer cuadro; la página le suma el offset para mostrar hora local
+        'inicio': int(info['inicio'].timestamp()),
+        'offset': int(info['inicio'].utcoffset().total_seconds()),
+        'paso': info['paso'].total_seconds(),
+        'cuadros': info['cuadros'],
+        'ventanas': info['ventanas'],
+        'por_ventana': cuadros_por_ventana,
+        'directorio': DIRECTORIO_VENTANAS,
+        'ms_por_cuadro': ms_por_cuadro,
+    }
+    ControlRepeticion(config).add_to(mapa)
+    mapa.save(ARCHIVO_MAPA)
+    print(f"✅ Repetición guardada: {ARCHIVO_MAPA} + {DIRECTORIO_VENTANAS}/ "
+          f"({time.perf_counter() - t0:.1f} s)")
+    return ARCHIVO_MAPA
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repetición animada de la flota con ventanas de tiempo")
+    parser.add_argument('--desde', help="Inicio (por defecto, 24 h antes del último fix)")
+    parser.add_argument('--hasta', help="Fin (por defecto, el último fix)")
+    parser.add_argument('--intervalo', default=INTERVALO_CUADRO, help="Duración de cada cuadro (time_bucket)")
+    parser.add_argument('--cuadros-por-ventana', type=int, default=CUADROS_POR_VENTANA)
+    parser.add_argument('--tabla', default='bus_locations')
+    parser.add_argument('--ms-por-cuadro', type=int, default=200, help="Velocidad de reproducción")
+    args = parser.parse_args()
+
+    try:
+        archivo_mapa = crear_mapa_repeticion(args.desde, args.hasta, args.intervalo,
+                                             args.cuadros_por_ventana, args.tabla, args.ms_por_cuadro)
+        print(f"🎉 Mapa creado: {archivo_mapa}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Está PostgreSQL corriendo con TimescaleDB? (time_bucket y last)")
+        print("   • ¿Hay datos en el rango pedido?")
@@ -0,0 +1,395 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+import numpy as np
+import networkx as nx
+from puntos_interes import PUNTOS_INTERES
+from instrumentacion import instrumentar
+
+# Simulador de flota a escala de producción. A diferencia de los generadores,
+# la posición sale de integrar la velocidad sobre las aristas de la red
+# (tiempo = largo / velocidad), y la velocidad es una sola función del tipo de
+# calle, un campo espacial suave, la curva de demanda del día y un ruido AR(1)
+# por bus: es continua a lo largo de la ruta y en el tiempo.
+NUM_BUSES = 2000
+DIAS = 30
+FECHA_INICIO = "2025-07-01"
+HORA_INICIO_SERVICIO = 5
+HORA_FIN_SERVICIO = 23
+INTERVALO_GPS_S = 30
+PASOS_POR_BLOQUE = 120           # Pasos de simulación por row group / COPY
+DIRECTORIO_SALIDA = 'simulacion_flota'
+
+VELOCIDAD_LIBRE_KMH = {
+    "residential": 25,
+    "secondary": 32,
+    "primary": 38,
+    "trunk": 45,
+    "motorway": 65,
+}
+VELOCIDAD_MINIMA_KMH = 3.0
+SIGMA_RUIDO_BUS = 0.15           # Desviación del log de la velocidad de cada bus
+TAU_RUIDO_S = 300                # Memoria del ruido: ~5 min
+SIGMA_ESPACIAL = 0.2             # Calles lentas/rápidas, suave en el espacio
+SIGMA_DIA = 0.05                 # Días mejores y peores para toda la red
+ESPERA_TERMINAL_S = (120, 480)   # Parada en los extremos de la ruta
+RUIDO_GPS_GRADOS = 0.00005       # ~5 m
+
+# Factor de congestión (velocidad / velocidad libre) para cada hora del día.
+# Las puntas son las de get_velocidad_segun_hora_y_calle.
+CURVAS_DEMANDA = {
+    'laboral': [0.95, 0.95, 0.95, 0.95, 0.92, 0.85, 0.70, 0.50, 0.48, 0.55, 0.72, 0.75,
+                0.70, 0.52, 0.55, 0.74, 0.72, 0.55, 0.48, 0.50, 0.60, 0.78, 0.88, 0.92],
+    'fin_semana': [0.95, 0.95, 0.95, 0.95, 0.95, 0.93, 0.90, 0.85, 0.80, 0.75, 0.70, 0.68,
+                   0.65, 0.65, 0.68, 0.70, 0.70, 0.68, 0.65, 0.68, 0.75, 0.82, 0.88, 0.92],
+}
+FLOTA_ACTIVA = {'laboral': 1.0, 'fin_semana': 0.7}
+
+def tipo_calle(highway):
+    """Normaliza el atributo `highway` de OSM (lista o *_link)."""
+    if isinstance(highway, list):
+        highway = highway[0]
+    highway = (highway or "residential").replace("_link", "")
+    return highway if highway in VELOCIDAD_LIBRE_KMH else "residential"
+
+def red_sintetica(filas=60, columnas=60, lat=(-16.425, -16.375), lon=(-71.555, -71.512)):
+    """Grilla de calles sobre Arequipa para pruebas de carga sin descargar OSM."""
+    G = nx.DiGraph()
+    lats, lons = np.linspace(*lat, filas), np.linspace(*lon, columnas)
+    for i in range(filas):
+        for j in range(columnas):
+            G.add_node(i * columnas + j, y=lats[i], x=lons[j])
+    metros_lat = (lats[1] - lats[0]) * 111_320
+    metros_lon = (lons[1] - lons[0]) * 111_320 * np.cos(np.radians(np.mean(lat)))
+    for i in range(filas):
+        for j in range(columnas):
+            nodo = i * columnas + j
+            vecinos = []
+            if j + 1 < columnas:
+                vecinos.append((nodo + 1, metros_lon, i))
+            if i + 1 < filas:
+                vecinos.append((nodo + columnas, metros_lat, j))
+            for vecino, largo, linea in vecinos:
+                highway = "trunk" if linea % 20 == 0 else "primary" if linea % 10 == 0 \
+                    else "secondary" if linea % 5 == 0 else "residential"
+                G.add_edge(nodo, vecino, length=largo, highway=highway)
+                G.add_edge(vecino, nodo, length=largo, highway=highway)
+    return G
+
+def red_a_arreglos(G, semilla=0):
+    """Nodos y aristas de la red como arreglos; el factor espacial queda fijo por arista."""
+    nodos = list(G.nodes)
+    indice = {nodo: i for i, nodo in enumerate(nodos)}
+    aristas, u, v, largo, libre = {}, [], [], [], []
+    for a, b, datos in G.edges(data=True):
+        if (a, b) in aristas:        # MultiDiGraph: basta la primera arista paralela
+            continue
+        aristas[(a, b)] = len(u)
+        u.append(indice[a])
+        v.append(indice[b])
+        largo.append(float(datos.get('length', 0.0)))
+        libre.append(VELOCIDAD_LIBRE_KMH[tipo_calle(datos.get('highway'))])
+    red = {
+        'lat': np.array([G.nodes[n]['y'] for n in nodos]),
+        'lon': np.array([G.nodes[n]['x'] for n in nodos]),
+        'u': np.array(u, dtype=np.int32),
+        'v': np.array(v, dtype=np.int32),
+        'largo': np.array(largo),
+        'velocidad_libre': np.array(libre, dtype=float),
+        'indice_nodo': indice,
+        'arista': aristas,
+    }
+    red['factor_espacial'] = campo_espacial(
+        (red['lat'][red['u']] + red['lat'][red['v']]) / 2,
+        (red['lon'][red['u']] + red['lon'][red['v']]) / 2,
+        semilla,
+    )
+    return red
+
+def campo_espacial(lat, lon, semilla=0, ondas=12, longitud_m=1500.0):
+    """Campo aleatorio suave (suma de cosenos): aristas vecinas tienen factores parecidos."""
+    rng = np.random.default_rng(semilla)
+    y = (lat - lat.mean()) * 111_320
+    x = (lon - lon.mean()) * 111_320 * np.cos(np.radians(lat.mean()))
+    angulos = rng.uniform(0, np.pi, ondas)
+    numeros = 2 * np.pi / (longitud_m * rng.uniform(0.5, 2.0, ondas))
+    fases = rng.uniform(0, 2 * np.pi, ondas)
+    campo = np.zeros_like(x)
+    for angulo, k, fase in zip(angulos, numeros, fases):
+        campo += np.cos(k * (x * np.cos(angulo) + y * np.sin(angulo)) + fase)
+    campo *= np.sqrt(2.0 / ondas)    # Varianza 1
+    return np.exp(SIGMA_ESPACIAL * campo)
+
+def nodo_mas_cercano(red, lat, lon):
+    """Índice del nodo más cercano (sin osmnx, distancia equirectangular)."""
+    dx = (red['lon'] - lon) * np.cos(np.radians(lat))
+    return int(np.argmin(dx ** 2 + (red['lat'] - lat) ** 2))
+
+def construir_rutas(G, red, puntos=PUNTOS_INTERES):
+    """Una ruta ida y vuelta por cada par de puntos de interés, como aristas en CSR."""
+    nodos = list(G.nodes)
+    cercanos = [nodos[nodo_mas_cercano(red, p['lat'], p['lon'])] for p in puntos]
+    aristas, sentido, inicios, origen, destino = [], [], [0], [], []
+    for a in range(len(puntos)):
+        for b in range(a + 1, len(puntos)):
+            if cercanos[a] == cercanos[b]:
+                continue
+            try:
+                ida = nx.shortest_path(G, cercanos[a], cercanos[b], weight='length')
+                vuelta = nx.shortest_path(G, cercanos[b], cercanos[a], weight='length')
+            except nx.NetworkXNoPath:
+                continue
+            for camino, s in ((ida, 0), (vuelta, 1)):
+                aristas.extend(red['arista'][(x, y)] for x, y in zip(camino[:-1], camino[1:]))
+                sentido.extend([s] * (len(camino) - 1))
+            inicios.append(len(aristas))
+            origen.append(a)
+            destino.append(b)
+    if not origen:
+        raise ValueError("No hay rutas entre los puntos de interés en esta red")
+    return {
+        'aristas': np.array(aristas, dtype=np.int32),
+        'sentido': np.array(sentido, dtype=np.int8),
+        'inicio': np.array(inicios[:-1], dtype=np.int64),
+        'fin': np.array(inicios[1:], dtype=np.int64),
+        'origen': np.array(origen, dtype=np.int16),
+        'destino': np.array(destino, dtype=np.int16),
+        'nombres': [p['nombre'] for p in puntos],
+    }
+
+def generar_placas(n):
+    """Placas únicas y reproducibles con el formato de los generadores (V123-AB)."""
+    i = np.arange(n)
+    letras = np.array([chr(65 + k) for k in range(26)])
+    return np.char.add(
+        np.char.add('V', (100 + i % 900).astype(str)),
+        np.char.add('-', np.char.add(letras[(i // 900) // 26 % 26], letras[(i // 900) % 26])),
+    )
+
+def simular_dia(dia, red, rutas, num_buses=NUM_BUSES, intervalo_s=INTERVALO_GPS_S,
+                curvas=CURVAS_DEMANDA, semilla=0, pasos_por_bloque=PASOS_POR_BLOQUE):
+    """Simula un día de servicio; entrega bloques de fixes como diccionarios de arreglos."""
+    rng = np.random.default_rng([semilla, dia.toordinal()])
+    tipo_dia = 'fin_semana' if dia.weekday() >= 5 else 'laboral'
+    curva = np.append(curvas[tipo_dia], curvas[tipo_dia][0])   # Cierra el ciclo de 24 h
+    factor_dia = np.exp(rng.normal(0, SIGMA_DIA))
+
+    # Cada bus tiene una ruta fija; los días de menor demanda sale solo una parte de la flota
+    n_rutas = len(rutas['inicio'])
+    activos = np.sort(rng.permutation(num_buses)[:int(round(num_buses * FLOTA_ACTIVA[tipo_dia]))])
+    n = len(activos)
+    ruta = activos % n_rutas
+    inicio, fin = rutas['inicio'][ruta], rutas['fin'][ruta]
+
+    # Arrancan repartidos a lo largo de su ruta, cada uno con su fase de muestreo GPS
+    pos = inicio + (rng.random(n) * (fin - inicio)).astype(np.int64)
+    s = rng.random(n) * red['largo'][rutas['aristas'][pos]]
+    espera = np.zeros(n)
+    ruido = rng.normal(0, SIGMA_RUIDO_BUS, n)
+    rho = np.exp(-intervalo_s / TAU_RUIDO_S)
+    fase = rng.integers(0, intervalo_s, n)
+
+    libre_ms = red['velocidad_libre'] * red['factor_espacial'] * factor_dia / 3.6
+    minima_ms = VELOCIDAD_MINIMA_KMH / 3.6
+    medianoche = (dia - date(1970, 1, 1)).days * 86400   # Hora local sin zona, como el CSV
+    pasos = range(HORA_INICIO_SERVICIO * 3600, HORA_FIN_SERVICIO * 3600, intervalo_s)
+
+    def velocidad_ms(arista, congestion, ruido_bus):
+        return np.maximum(libre_ms[arista] * congestion * np.exp(ruido_bus), minima_ms)
+
+    bloque = []
+    for paso, t in enumerate(pasos):
+        congestion = np.interp(t / 3600, np.arange(25), curva)
+        ruido = rho * ruido + np.sqrt(1 - rho ** 2) * SIGMA_RUIDO_BUS * rng.standard_normal(n)
+
+        # Eventos de fin de arista: se avanza arista por arista hasta agotar el intervalo
+        restante = np.full(n, float(intervalo_s))
+        consumo = np.minimum(espera, restante)
+        espera -= consumo
+        restante -= consumo
+        i = np.flatnonzero(restante > 0)
+        while len(i):
+            arista = rutas['aristas'][pos[i]]
+            v = velocidad_ms(arista, congestion, ruido[i])
+            hasta_fin = (red['largo'][arista] - s[i]) / v
+            cruza = hasta_fin <= restante[i]
+
+            sigue = i[~cruza]
+            s[sigue] += v[~cruza] * restante[sigue]
+
+            i = i[cruza]
+            restante[i] -= hasta_fin[cruza]
+            pos[i] += 1
+            s[i] = 0.0
+            termino = i[pos[i] == fin[i]]
+            if len(termino):
+                pos[termino] = inicio[termino]
+                espera[termino] = rng.uniform(*ESPERA_TERMINAL_S, len(termino))
+                consumo = np.minimum(espera[termino], restante[termino])
+                espera[termino] -= consumo
+                restante[termino] -= consumo
+            i = i[restante[i] > 0]
+
+        arista = rutas['aristas'][pos]
+        u, v = red['u'][arista], red['v'][arista]
+        fraccion = np.divide(s, red['largo'][arista], out=np.zeros(n), where=red['largo'][arista] > 0)
+        velocidad = np.where(espera > 0, 0.0, velocidad_ms(arista, congestion, ruido) * 3.6)
+        ida = rutas['sentido'][pos] == 0
+        bloque.append({
+            'bus': activos.astype(np.int32),
+            'ts': medianoche + t + fase,
+            'lat': red['lat'][u] + (red['lat'][v] - red['lat'][u]) * fraccion + rng.normal(0, RUIDO_GPS_GRADOS, n),
+            'lon': red['lon'][u] + (red['lon'][v] - red['lon'][u]) * fraccion + rng.normal(0, RUIDO_GPS_GRADOS, n),
+            'velocidad': velocidad.astype(np.float32),
+            'origen': np.where(ida, rutas['origen'][ruta], rutas['destino'][ruta]),
+            'destino': np.where(ida, rutas['destino'][ruta], rutas['origen'][ruta]),
+        })
+        if len(bloque) == pasos_por_bloque or paso == len(pasos) - 1:
+            yield {k: np.concatenate([b[k] for b in bloque]) for k in bloque[0]}
+            bloque = []
+
+def bloque_a_arrow(bloque, placas, nombres):
+    """Bloque de fixes como tabla Arrow con el esquema del CSV realista."""
+    import pyarrow as pa
+    return pa.table({
+        'placa': pa.DictionaryArray.from_arrays(pa.array(bloque['bus']), pa.array(placas)),
+        'latitud': pa.array(bloque['lat'].round(6)),
+        'longitud': pa.array(bloque['lon'].round(6)),
+        'velocidad_kmh': pa.array(bloque['velocidad'].round(1)),
+        'ts': pa.array(bloque['ts'], type=pa.timestamp('s')),
+        'origen': pa.DictionaryArray.from_arrays(pa.array(bloque['origen']), pa.array(nombres)),
+        'destino': pa.DictionaryArray.from_arrays(pa.array(bloque['destino']), pa.array(nombres)),
+    })
+
+def bloque_a_dataframe(bloque, placas, nombres):
+    """Bloque de fixes con las columnas de staging de gestor_cargas (ts con zona)."""
+    import pandas as pd
+    from calidad_datos import ZONA_HORARIA
+    nombres = np.asarray(nombres, dtype=object)
+    return pd.DataFrame({
+        'placa': placas[bloque['bus']],
+        'latitud': bloque['lat'].round(6),
+        'longitud': bloque['lon'].round(6),
+        'velocidad_kmh': bloque['velocidad'].round(1),
+        'ts': pd.to_datetime(bloque['ts'], unit='s').tz_localize(ZONA_HORARIA),
+        'origen': nombres[bloque['origen']],
+        'destino': nombres[bloque['destino']],
+    })
+
+# --- Ejecución por día en paralelo: los días son independientes (el servicio
+# se reinicia cada mañana), así cada proceso simula y escribe los suyos ---
+
+_contexto = {}
+
+def _inicializar_proceso(red, rutas, configuracion):
+    _contexto.update(red=red, rutas=rutas, placas=generar_placas(configuracion['num_buses']),
+                     **configuracion)
+
+def _simular_y_escribir(dia):
+    c = _contexto
+    t0 = time.perf_counter()
+    bloques = simular_dia(dia, c['red'], c['rutas'], c['num_buses'], c['intervalo_s'],
+                          c['curvas'], c['semilla'])
+    filas = 0
+    if c['destino'] == 'parquet':
+        import pyarrow.parquet as pq
+        archivo = os.path.join(c['directorio'], f"flota_{dia:%Y-%m-%d}.parquet")
+        escritor = None
+        try:
+            for bloque in bloques:
+                tabla = bloque_a_arrow(bloque, c['placas'], c['rutas']['nombres'])
+                if escritor is None:
+                    escritor = pq.ParquetWriter(archivo + '.tmp', tabla.schema, compression='snappy')
+                escritor.write_table(tabla)
+                filas += tabla.num_rows
+        finally:
+            if escritor is not None:
+                escritor.close()
+        os.replace(archivo + '.tmp', archivo)   # Un día a medias nunca queda con el nombre final
+    else:
+        from gestor_cargas import insertar_lote
+        for bloque in bloques:
+            insertar_lote(bloque_a_dataframe(bloque, c['placas'], c['rutas']['nombres']),
+                          c['tabla'], c['columnas'])
+            filas += len(bloque['bus'])
+    return dia, filas, time.perf_counter() - t0
+
+@instrumentar
+def simular_periodo(G, fecha_inicio=FECHA_INICIO, dias=DIAS, num_buses=NUM_BUSES,
+                    intervalo_s=INTERVALO_GPS_S, destino='parquet', directorio=DIRECTORIO_SALIDA,
+                    tabla='bus_locations', curvas=CURVAS_DEMANDA, semilla=0, procesos=None):
+    """Simula `dias` días de la flota y los escribe en Parquet (un archivo por día) o con COPY."""
+    red = red_a_arreglos(G, semilla)
+    rutas = construir_rutas(G, red)
+    print(f"Red: {len(red['lat']):,} nodos, {len(red['u']):,} aristas; "
+          f"{len(rutas['inicio'])} rutas para {num_buses:,} buses")
+    columnas = None
+    if destino == 'parquet':
+        os.makedirs(directorio, exist_ok=True)
+    else:
+        from gestor_cargas import preparar_tabla_destino
+        columnas = preparar_tabla_destino(tabla)
+
+    # Sin las tablas de búsqueda (claves de nodos OSM): no hacen falta en los procesos
+    red = {k: v for k, v in red.items() if k not in ('indice_nodo', 'arista')}
+    configuracion = {'num_buses': num_buses, 'intervalo_s': intervalo_s, 'curvas': curvas,
+                     'semilla': semilla, 'destino': destino, 'directorio': directorio, 'tabla': tabla,
+                     'columnas': columnas}
+    inicio = date.fromisoformat(fecha_inicio)
+    fechas = [inicio + timedelta(days=d) for d in range(dias)]
+
+    t0 = time.perf_counter()
+    total = 0
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_proceso,
+                             initargs=(red, rutas, configuracion)) as ejecutor:
+        for futuro in as_completed([ejecutor.submit(_simular_y_escribir, d) for d in fechas]):
+            dia, filas, segundos = futuro.result()
+            total += filas
+            print(f"   {dia:%Y-%m-%d} ({'fin de semana' if dia.weekday() >= 5 else 'laboral'}): "
+                  f"{filas:,} fixes en {segundos:.1f} s")
+    segundos = time.perf_counter() - t0
+    print(f"✅ {total:,} fixes en {segundos:.1f} s ({total / segundos:,.0f} fixes/s)")
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador de flota a escala (Parquet o COPY)")
+    parser.add_argument('--buses', type=int, default=NUM_BUSES)
+    parser.add_argument('--dias', type=int, default=DIAS)
+    parser.add_argument('--fecha-inicio', default=FECHA_INICIO)
+    parser.add_argument('--intervalo', type=int, default=INTERVALO_GPS_S, help="Segundos entre fixes GPS")
+    parser.add_argument('--destino', choices=['parquet', 'copy'], default='parquet')
+    parser.add_argument('--directorio', default=DIRECTORIO_SALIDA)
+    parser.add_argument('--tabla', default='bus_locations', help="Tabla destino con --destino copy")
+    parser.add_argument('--curvas', help="JSON con las curvas de demanda {'laboral': [24], 'fin_semana': [24]}")
+    parser.add_argument('--red-sintetica', action='store_true', help="Grilla sobre Arequipa en vez de OSM")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--procesos', type=int, default=None)
+    args = parser.parse_args()
+
+    print("🚌 SIMULADOR DE FLOTA")
+    print("=" * 50)
+    try:
+        curvas = CURVAS_DEMANDA
+        if args.curvas:
+            with open(args.curvas, encoding='utf-8') as f:
+                curvas = {**CURVAS_DEMANDA, **json.load(f)}
+            if any(len(c) != 24 for c in curvas.values()):
+                raise ValueError("Cada curva de demanda debe tener 24 valores (uno por hora)")
+
+        if args.red_sintetica:
+            G = red_sintetica()
+        else:
+            from generador_datos_realistas import cargar_red_calles_cacheada
+            G = cargar_red_calles_cacheada()
+
+        simular_periodo(G, args.fecha_inicio, args.dias, args.buses, args.intervalo, args.destino,
+                        args.directorio, args.tabla, curvas, args.semilla, args.procesos)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("\n🔧 Verificaciones:")
+        print("   • ¿Está instalado pyarrow? (pip install pyarrow)")
+        print("   • Con --destino copy: ¿PostgreSQL está corriendo y existe la tabla?")
+        print("   • Sin internet: usar --red-sintetica")
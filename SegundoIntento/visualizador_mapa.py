@@ -1,9 +1,13 @@
-import pandas as pd
+import numpy as np
 import folium
 from sqlalchemy import create_engine
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from puntos_interes import seleccionar_puntos
+from cache_consultas import leer_sql
+from almacen_trayectorias import AlmacenTrayectorias
+from instrumentacion import instrumentar, registrar_filas
 
 # --- CONFIGURACIÓN DE LA CONEXIÓN ---
 db_user = 'postgres'
@@ -15,6 +19,7 @@ db_name = 'MiPrimeraDB'
 db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
 engine = create_engine(db_connection_str)
 
+@instrumentar
 def crear_mapa_interactivo():
     """Crea un mapa interactivo con Folium mostrando las rutas de buses"""
     print("Cargando datos desde la base de datos...")
@@ -33,7 +38,8 @@ def crear_mapa_interactivo():
     LIMIT 2000;  -- Limitamos para mejor rendimiento
     """
     
-    df = pd.read_sql(sql_query, engine)
+    df = leer_sql(sql_query, engine)
+    registrar_filas(len(df))
     print(f"Se cargaron {len(df)} registros para visualización.")
     
     # Centro del mapa en Arequipa
@@ -62,14 +68,15 @@ def crear_mapa_interactivo():
                'lightred', 'beige', 'darkblue', 'darkgreen', 'cadetblue', 
                'darkpurple', 'white', 'pink', 'lightblue', 'lightgreen']
     
-    placas_unicas = df['placa'].unique()
+    almacen = AlmacenTrayectorias.desde_dataframe(df)
     
-    for i, placa in enumerate(placas_unicas[:10]):  # Solo primeros 10 buses
-        datos_bus = df[df['placa'] == placa].sort_values('ts')
+    for i in range(min(almacen.n_buses, 10)):  # Solo primeros 10 buses
+        bus = almacen.vista(i)
+        placa = bus.placa
         color = colores[i % len(colores)]
         
         # Crear la ruta del bus
-        coordenadas = [[row['latitud'], row['longitud']] for _, row in datos_bus.iterrows()]
+        coordenadas = np.column_stack([bus.latitud, bus.longitud]).tolist()
         
         # Línea de ruta
         folium.PolyLine(
@@ -96,13 +103,10 @@ def crear_mapa_interactivo():
             ).add_to(mapa)
     
     # Agregar puntos de interés de Arequipa
-    puntos_interes = [
-        {"nombre": "Plaza de Armas", "lat": -16.3989, "lon": -71.5367, "icono": "star"},
-        {"nombre": "Mall Plaza Cayma", "lat": -16.3795, "lon": -71.5492, "icono": "shopping-cart"},
-        {"nombre": "Óvalo Miraflores", "lat": -16.4113, "lon": -71.5235, "icono": "road"},
-        {"nombre": "Estadio Melgar", "lat": -16.4150, "lon": -71.5280, "icono": "futbol-o"},
-        {"nombre": "Universidad San Agustín", "lat": -16.4068, "lon": -71.5223, "icono": "graduation-cap"}
-    ]
+    puntos_interes = seleccionar_puntos([
+        "Plaza de Armas", "Mall Plaza Cayma", "Óvalo Miraflores",
+        "Estadio Melgar", "Universidad San Agustín"
+    ])
     
     for poi in puntos_interes:
         folium.Marker(
@@ -111,6 +115,16 @@ def crear_mapa_interactivo():
             icon=folium.Icon(color='black', icon=poi["icono"])
         ).add_to(mapa)
     
+    # Hotspots de congestión del mismo período (si ya se calcularon)
+    try:
+        from hotspots_congestion import cargar_hotspots, agregar_capa_hotspots
+        hotspots = cargar_hotspots(df['ts'].min(), df['ts'].max(), engine)
+        if len(hotspots) > 0:
+            agregar_capa_hotspots(mapa, hotspots)
+            print(f"🚦 Capa de hotspots: {len(hotspots)} zonas de congestión")
+    except Exception as e:
+        print(f"Sin capa de hotspots ({e})")
+    
     # Control de capas
     folium.LayerControl().add_to(mapa)
     
@@ -120,6 +134,7 @@ def crear_mapa_interactivo():
     print(f"✅ Mapa guardado como '{archivo_mapa}'")
     return archivo_mapa
 
+@instrumentar
 def crear_dashboard_velocidades():
     """Crea un dashboard interactivo con análisis de velocidades"""
     print("Creando dashboard de velocidades...")
@@ -136,7 +151,8 @@ def crear_dashboard_velocidades():
     FROM bus_locations;
     """
     
-    df = pd.read_sql(sql_query, engine)
+    df = leer_sql(sql_query, engine)
+    registrar_filas(len(df))
     
     # Crear subplots
     fig = make_subplots(
@@ -185,6 +201,7 @@ def crear_dashboard_velocidades():
     print(f"✅ Dashboard guardado como '{archivo_dashboard}'")
     return archivo_dashboard
 
+@instrumentar
 def generar_reporte_estadisticas():
     """Genera un reporte estadístico completo"""
     print("Generando reporte estadístico...")
@@ -202,7 +219,7 @@ def generar_reporte_estadisticas():
     FROM bus_locations;
     """
     
-    stats = pd.read_sql(sql_query, engine)
+    stats = leer_sql(sql_query, engine)
     
     print("\n" + "="*50)
     print("📊 REPORTE ESTADÍSTICO - PROYECTO BUSES AREQUIPA")
@@ -1,6 +1,8 @@
-import pandas as pd
 import folium
 from sqlalchemy import create_engine
+from puntos_interes import PUNTOS_INTERES
+from cache_consultas import leer_sql
+from instrumentacion import instrumentar, registrar_filas
 
 # --- CONFIGURACIÓN DE LA CONEXIÓN ---
 db_user = 'postgres'
@@ -12,6 +14,7 @@ db_name = 'MiPrimeraDB'
 db_connection_str = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
 engine = create_engine(db_connection_str)
 
+@instrumentar
 def crear_mapa_realista():
     """Crea un mapa con los datos realistas que siguen rutas reales"""
     print("🗺️ CREANDO MAPA CON DATOS REALISTAS")
@@ -32,7 +35,8 @@ def crear_mapa_realista():
     LIMIT 1500;  -- Optimizar rendimiento
     """
     
-    df = pd.read_sql(sql_query, engine)
+    df = leer_sql(sql_query, engine)
+    registrar_filas(len(df))
     print(f"📊 Datos cargados: {len(df)} registros")
     
     # Centro en Arequipa
@@ -111,16 +115,7 @@ def crear_mapa_realista():
                 ).add_to(mapa)
     
     # Agregar leyenda con puntos de interés
-    puntos_interes = [
-        {"nombre": "Plaza de Armas", "lat": -16.3989, "lon": -71.5367, "icono": "star"},
-        {"nombre": "Mall Plaza Cayma", "lat": -16.3795, "lon": -71.5492, "icono": "shopping-cart"},
-        {"nombre": "Terminal Terrestre", "lat": -16.4195, "lon": -71.5179, "icono": "road"},
-        {"nombre": "Óvalo Miraflores", "lat": -16.4113, "lon": -71.5235, "icono": "circle"},
-        {"nombre": "Estadio Melgar", "lat": -16.4150, "lon": -71.5280, "icono": "futbol-o"},
-        {"nombre": "Universidad San Agustín", "lat": -16.4068, "lon": -71.5223, "icono": "graduation-cap"},
-        {"nombre": "Mercado San Camilo", "lat": -16.4021, "lon": -71.5341, "icono": "shopping-bag"},
-        {"nombre": "Parque Lambramani", "lat": -16.4067, "lon": -71.5381, "icono": "tree"}
-    ]
+    puntos_interes = PUNTOS_INTERES
     
     for poi in puntos_interes:
         folium.Marker(
@@ -135,6 +130,7 @@ def crear_mapa_realista():
     print(f"✅ Mapa realista guardado: {archivo}")
     return archivo
 
+@instrumentar
 def crear_analisis_comparativo():
     """Crea un análisis visual comparando ambos datasets"""
     print(f"\n📊 ANÁLISIS COMPARATIVO VISUAL")
@@ -151,8 +147,9 @@ def crear_analisis_comparativo():
     FROM bus_locations_realistas LIMIT 1000;
     """
     
-    df_original = pd.read_sql(sql_original, engine)
-    df_realista = pd.read_sql(sql_realista, engine)
+    df_original = leer_sql(sql_original, engine)
+    df_realista = leer_sql(sql_realista, engine)
+    registrar_filas(len(df_original) + len(df_realista))
     
     # Crear mapa comparativo
     centro_lat = -16.4009
@@ -0,0 +1,142 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Punto de entrada único para los dos intentos. Solo importa la biblioteca
+# estándar: cada script (con sus osmnx, geopandas, sklearn, plotly, folium...)
+# se ejecuta recién cuando se invoca su subcomando, así `--help` es inmediato.
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIOS = {1: 'PrimerIntento', 2: 'SegundoIntento'}
+
+# comando -> {intento: script}
+SCRIPTS = {
+    'generar': {1: 'generador_datos.py', 2: 'generador_datos_realistas.py'},
+    'simular': {2: 'simulador_flota.py'},
+    'cargar': {1: 'cargar_datos.py', 2: 'cargar_datos_realistas.py'},
+    'cargas': {2: 'gestor_cargas.py'},
+    'carga-paralela': {2: 'carga_paralela.py'},
+    'entrenar': {1: 'analisis_predictivo.py', 2: 'analisis_predictivo_mejorado.py'},
+    'predecir': {2: 'eta.py'},
+    'reporte': {2: 'comparar_datasets.py'},
+    'archivar': {2: 'compresion_trayectorias.py'},
+    'calidad': {2: 'calidad_datos.py'},
+    'geocercas': {2: 'geocercas.py'},
+    'cache': {2: 'cache_consultas.py'},
+    'modelos': {2: 'registro_modelos.py'},
+    'buscar': {2: 'busqueda_hiperparametros.py'},
+    'ingesta': {2: 'ingesta_tiempo_real.py'},
+    'benchmark': {2: 'benchmark_pipeline.py'},
+}
+MAPAS = {
+    'realista': 'visualizador_realista.py',
+    'interactivo': 'visualizador_mapa.py',
+    'simple': 'mapa_simple.py',
+    'flota': 'posicion_actual.py',
+    'hotspots': 'hotspots_congestion.py',
+    'repeticion': 'repeticion_flota.py',
+}
+
+# Presupuesto de arranque de `buses_aqp.py --help` y módulos que no deben cargarse
+PRESUPUESTO_ARRANQUE_MS = 150
+MODULOS_PESADOS = ['pandas', 'numpy', 'sqlalchemy', 'sklearn', 'geopandas', 'osmnx',
+                   'networkx', 'folium', 'plotly', 'shapely', 'psycopg2', 'pyarrow']
+
+def ejecutar_script(intento, script, argumentos):
+    """Ejecuta `python script.py argumentos` desde el directorio del intento."""
+    directorio = os.path.join(RAIZ, DIRECTORIOS[intento])
+    # Proceso aparte y no runpy: los scripts usan rutas relativas, importan a sus
+    # vecinos y algunos lanzan procesos hijos que deben poder reimportar su __main__
+    return subprocess.call([sys.executable, script, *argumentos], cwd=directorio)
+
+def medir_arranque(argumentos=('--help',)):
+    """Tiempo de importación de `buses_aqp.py` según `python -X importtime`."""
+    resultado = subprocess.run(
+        [sys.executable, '-X', 'importtime', os.path.abspath(__file__), *argumentos],
+        capture_output=True, text=True,
+    )
+    total_us, modulos = 0, set()
+    for linea in resultado.stderr.splitlines():
+        m = re.match(r'import time:\s+\d+\s+\|\s+(\d+)\s+\|(\s*)(\S+)', linea)
+        if not m:
+            continue
+        modulos.add(m.group(3).split('.')[0])
+        if len(m.group(2)) == 1:     # Solo módulos de primer nivel: su acumulado incluye a los hijos
+            total_us += int(m.group(1))
+    return total_us / 1000, modulos
+
+def verificar_arranque(presupuesto_ms=PRESUPUESTO_ARRANQUE_MS):
+    """Falla si el arranque excede el presupuesto o arrastra dependencias pesadas."""
+    ok = True
+    for argumentos in [('--help',), ('generar', '--help'), ('mapa', '--help')]:
+        ms, modulos = medir_arranque(argumentos)
+        pesados = sorted(set(MODULOS_PESADOS) & modulos)
+        estado = "✅" if ms <= presupuesto_ms and not pesados else "❌"
+        print(f"{estado} buses_aqp {' '.join(argumentos)}: {ms:.1f} ms de importación "
+              f"(presupuesto {presupuesto_ms} ms)")
+        if pesados:
+            print(f"   Importa dependencias pesadas: {', '.join(pesados)}")
+        ok = ok and estado == "✅"
+    return ok
+
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        prog='buses_aqp',
+        description="Pipeline de buses de Arequipa: generar → cargar → entrenar → predecir → mapas",
+    )
+    parser.add_argument('--intento', type=int, choices=sorted(DIRECTORIOS), default=2,
+                        help="1 = PrimerIntento (datos básicos), 2 = SegundoIntento (realistas)")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    ayudas = {
+        'generar': "Generar el CSV de datos sintéticos",
+        'simular': "Simular la flota a escala (Parquet o COPY)",
+        'cargar': "Cargar el CSV a PostgreSQL",
+        'cargas': "Cargas reanudables de CSV con manifiesto (cargar/estado)",
+        'carga-paralela': "Carga de CSV con varias conexiones en paralelo",
+        'entrenar': "Entrenar el modelo de velocidad",
+        'predecir': "ETA de la flota a las paradas",
+        'reporte': "Comparar datasets original y realista",
+        'archivar': "Comprimir fixes viejos en trayectorias LINESTRING M",
+        'calidad': "Benchmark de validación y resumen de la cuarentena",
+        'geocercas': "Eventos de entrada/salida/permanencia en zonas y POIs",
+        'cache': "Cache de resultados de consultas (estado/limpiar/medir)",
+        'modelos': "Registro de versiones del modelo (listar/promover/revertir/cargar)",
+        'buscar': "Búsqueda de hiperparámetros",
+        'ingesta': "Ingesta en tiempo real de fixes GPS",
+        'benchmark': "Benchmark del pipeline",
+    }
+    for comando, ayuda in ayudas.items():
+        p = sub.add_parser(comando, help=ayuda)
+        # Los argumentos restantes se pasan tal cual al script (p. ej. `modelos promover v0003`)
+        p.add_argument('argumentos', nargs=argparse.REMAINDER)
+
+    p_mapa = sub.add_parser('mapa', help="Generar mapas HTML")
+    p_mapa.add_argument('--tipo', choices=sorted(MAPAS), default='realista')
+
+    p_arranque = sub.add_parser('arranque', help="Verificar el presupuesto de tiempo de arranque")
+    p_arranque.add_argument('--presupuesto-ms', type=float, default=PRESUPUESTO_ARRANQUE_MS)
+    return parser
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+
+    if args.comando == 'arranque':
+        return 0 if verificar_arranque(args.presupuesto_ms) else 1
+
+    if args.comando == 'mapa':
+        if args.intento != 2:
+            print("❌ Los mapas solo existen para el SegundoIntento (--intento 2)")
+            return 2
+        return ejecutar_script(2, MAPAS[args.tipo], [])
+
+    scripts = SCRIPTS[args.comando]
+    if args.intento not in scripts:
+        print(f"❌ '{args.comando}' no existe en {DIRECTORIOS[args.intento]}; "
+              f"disponible en: {', '.join(DIRECTORIOS[i] for i in scripts)}")
+        return 2
+    return ejecutar_script(args.intento, scripts[args.intento], args.argumentos)
+
+if __name__ == "__main__":
+    sys.exit(main())